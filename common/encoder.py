@@ -0,0 +1,227 @@
+"""Deterministic text encoder shared by the RA-Rec and EQR demos.
+
+The paper uses a dense sentence encoder; the demo stands in a feature-hashing
+encoder so the app runs offline with no model download. Vectors are
+L2-normalised, so dot products are cosine similarities. ``CachedEncoder``
+puts a memory-bounded LRU of query embeddings in front of any encoder, keyed
+on the model id and the normalised query text.
+"""
+import atexit
+import os
+import re
+import threading
+import unicodedata
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_DIM = 256
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_SPACE_RE = re.compile(r"\s+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from had has have i i'm if in is it its "
+    "my of on or our so that the their them they this to very was we were with "
+    "you your".split()
+)
+
+
+def tokenize(text):
+    """Lower-case word tokens with stopwords removed."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def stem(token):
+    # Crude suffix stripping so "rolls"/"roll" and "options"/"option" collide.
+    for suffix in ("ing", "es", "s"):
+        if len(token) > len(suffix) + 2 and token.endswith(suffix):
+            return token[: -len(suffix)]
+    return token
+
+
+def _features(text):
+    for token in tokenize(text):
+        word = stem(token)
+        yield word, 1.0
+        padded = f"#{word}#"
+        for i in range(len(padded) - 2):
+            yield padded[i:i + 3], 0.3
+
+
+class HashingEncoder:
+    """Signed feature-hashing encoder over word stems and character trigrams."""
+
+    def __init__(self, dim=DEFAULT_DIM):
+        self.dim = dim
+        self.model_id = f"hashing-{dim}"
+
+    def encode(self, texts):
+        """Encode a string or list of strings into a float32 matrix (n, dim)."""
+        if isinstance(texts, str):
+            texts = [texts]
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in _features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if h & 1 else -1.0
+                out[row, (h >> 1) % self.dim] += sign * weight
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+
+def normalize_query(text):
+    """Cache key form of a query: NFKC, whitespace collapsed, case-folded."""
+    return _SPACE_RE.sub(" ", unicodedata.normalize("NFKC", text)).strip().casefold()
+
+
+# Caches to write back when the interpreter exits, by path. One hook serves
+# them all, however often an app recreates its cache.
+_SAVE_AT_EXIT = {}
+
+
+@atexit.register
+def _save_caches():
+    for cache in list(_SAVE_AT_EXIT.values()):
+        cache.save()
+
+
+class EmbeddingCache:
+    """Thread-safe LRU of query embeddings, bounded by the bytes it holds.
+
+    Keys are ``(model_id, normalize(text))``. Pass the ``normalize`` of any
+    other cache layered on the same queries, so both agree on which
+    spellings are the same query. With ``path`` set, the cache loads that
+    ``.npz`` file on creation, and ``save()`` writes it back so a restarted
+    server starts warm.
+    """
+
+    def __init__(self, max_bytes=8 << 20, path=None, normalize=normalize_query):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.normalize = normalize
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, model_id, text):
+        key = (model_id, self.normalize(text))
+        with self._lock:
+            vec = self._entries.get(key)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vec
+
+    def put(self, model_id, text, vec):
+        key = (model_id, self.normalize(text))
+        vec = np.array(vec, dtype=np.float32)
+        vec.setflags(write=False)  # shared between callers
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[key] = vec
+            self._bytes += vec.nbytes
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def save(self, path=None):
+        """Write the entries (least recently used first) to an ``.npz`` file."""
+        path = path or self.path
+        with self._lock:
+            items = list(self._entries.items())
+        # Vectors are stacked per model (dimensions may differ); ``order_i``
+        # keeps each entry's recency rank across models.
+        by_model = {}
+        for rank, ((model_id, text), vec) in enumerate(items):
+            by_model.setdefault(model_id, []).append((rank, text, vec))
+        arrays = {}
+        for i, (model_id, entries) in enumerate(by_model.items()):
+            arrays[f"model_{i}"] = np.array(model_id)
+            arrays[f"order_{i}"] = np.array([rank for rank, _, _ in entries], dtype=np.int64)
+            arrays[f"texts_{i}"] = np.array([text for _, text, _ in entries], dtype=str)
+            arrays[f"vectors_{i}"] = np.stack([vec for _, _, vec in entries])
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    def save_at_exit(self):
+        """Save to ``path`` when the interpreter exits; a later cache with the same path replaces this one."""
+        _SAVE_AT_EXIT[self.path] = self
+
+    def load(self, path):
+        entries = []
+        with np.load(path, allow_pickle=False) as data:
+            i = 0
+            while f"model_{i}" in data:
+                model_id = str(data[f"model_{i}"])
+                texts = data[f"texts_{i}"].tolist()
+                # Files without ``order_i`` load model by model.
+                order = data[f"order_{i}"] if f"order_{i}" in data else len(entries) + np.arange(len(texts))
+                entries.extend(zip(order.tolist(), [model_id] * len(texts), texts, data[f"vectors_{i}"]))
+                i += 1
+        for _, model_id, text, vec in sorted(entries, key=lambda entry: entry[0]):
+            self.put(model_id, text, vec)
+
+
+class CachedEncoder:
+    """Encoder wrapper that serves repeated queries from an ``EmbeddingCache``.
+
+    Misses are encoded together in one call to the wrapped encoder. The
+    encoder sees the normalised text, so every spelling that shares a cache
+    key also shares its vector. Use it for query-time encoding only; bulk
+    corpus encoding should bypass it.
+    """
+
+    def __init__(self, encoder, cache=None):
+        self.encoder = encoder
+        self.cache = cache if cache is not None else EmbeddingCache()
+
+    @property
+    def model_id(self):
+        return self.encoder.model_id
+
+    @property
+    def dim(self):
+        return self.encoder.dim
+
+    def encode(self, texts):
+        if isinstance(texts, str):
+            texts = [texts]
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        missing = {}  # normalised text -> rows needing it
+        for row, text in enumerate(texts):
+            vec = self.cache.get(self.model_id, text)
+            if vec is None:
+                missing.setdefault(self.cache.normalize(text), []).append(row)
+            else:
+                out[row] = vec
+        if missing:
+            encoded = self.encoder.encode(list(missing))
+            for (text, rows), vec in zip(missing.items(), encoded):
+                out[rows] = vec
+                self.cache.put(self.model_id, text, vec)
+        return out
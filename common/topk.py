@@ -0,0 +1,72 @@
+"""Segmented top-k selection shared by the RA-Rec and EQR demos.
+
+Rows of one item (reviews, passages) are contiguous, so an item is a
+segment ``offsets[i]:offsets[i + 1]`` of a score row. ``segmented_topk``
+finds the best ``k`` rows of every segment for one or many score rows at
+once, which both demos use for late fusion (mean of the top-k). EQR keeps
+the top-k values per segment instead (``segmented_topk_values``, padded
+with ``-inf``), so that late fusion and subtopic fusion can both be
+computed from them.
+"""
+import numpy as np
+
+
+def segmented_topk(scores, offsets, k):
+    """Positions of the top-``k`` scores inside each segment.
+
+    ``scores`` is ``(n_rows,)`` or ``(n_queries, n_rows)``. Returns an int
+    array of indices into the last axis of ``scores``, shaped
+    ``(n_segments, k)`` or ``(n_queries, n_segments, k)``, ordered by
+    descending score and padded with ``-1`` for segments shorter than ``k``.
+    """
+    scores = np.asarray(scores)
+    squeeze = scores.ndim == 1
+    scores = np.atleast_2d(scores)
+    n_queries, n_rows = scores.shape
+    offsets = np.asarray(offsets, dtype=np.int64)
+    counts = np.diff(offsets)
+    n_segments = len(counts)
+    out = np.full((n_queries, n_segments, k), -1, dtype=np.int64)
+    if n_segments and n_rows:
+        width = int(counts.max())
+        seg = np.repeat(np.arange(n_segments), counts)
+        pos = np.arange(n_rows) - offsets[:-1][seg]
+        if n_segments * width <= 4 * n_rows:
+            # Dense layout: pad each segment to the longest one and partition
+            # every query and segment in one call.
+            kk = min(k, width)
+            padded = np.full((n_queries, n_segments, width), -np.inf, dtype=np.float64)
+            padded[:, seg, pos] = scores
+            top = np.argpartition(-padded, kk - 1, axis=2)[:, :, :kk]
+            order = np.argsort(-np.take_along_axis(padded, top, axis=2), axis=2, kind="stable")
+            top = np.take_along_axis(top, order, axis=2)
+            out[:, :, :kk] = np.where(top < counts[:, None], top + offsets[:-1, None], -1)
+        else:
+            # Skewed layout (a few very long segments): padding would waste
+            # memory, so sort by (segment, -score) and keep the first k of
+            # each segment.
+            keep = pos < k
+            for q in range(n_queries):
+                order = np.lexsort((-scores[q], seg))
+                out[q, seg[keep], pos[keep]] = order[keep]
+    return out[0] if squeeze else out
+
+
+def segmented_topk_values(scores, offsets, k):
+    """Top-``k`` scores per segment, for each row of ``scores``.
+
+    ``scores`` is ``(n_queries, n_rows)``; returns ``(n_queries, n_segments, k)``
+    sorted in descending order and padded with ``-inf``.
+    """
+    scores = np.atleast_2d(scores)
+    top = segmented_topk(scores, offsets, k)
+    out = np.full(top.shape, -np.inf)
+    valid = top >= 0
+    out[valid] = scores[np.nonzero(valid)[0], top[valid]]
+    return out
+
+
+def topk_sums(top):
+    """Sum and count of the finite entries along the last axis of ``top``."""
+    finite = np.isfinite(top)
+    return np.where(finite, top, 0.0).sum(axis=-1), finite.sum(axis=-1)
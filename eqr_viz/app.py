@@ -1,7 +1,37 @@
+import html
+import os
+
 import streamlit as st
 import pandas as pd
 import time
 
+from demo_data import CANNED_REFORMULATIONS, PASSAGES, RELEVANT
+from encoder import CachedEncoder, EmbeddingCache, HashingEncoder
+from llm_client import AsyncLLMClient, HTTPLLM, LLMError
+from nlrec import DATASETS, NLRecStore
+from bm25 import BM25Index
+from pipeline import RETRIEVAL_LABELS, RETRIEVAL_MODES, EQRPipeline, PassageIndex
+from reformulation import METHOD_LABELS, METHODS, Reformulator, StubLLM
+from reformulation_cache import DEFAULT_PATH as DEFAULT_REFORMULATION_CACHE, ReformulationCache
+from sharding import ShardedIndex
+from snapshot import DEFAULT_PATH as DEFAULT_SNAPSHOT, Snapshot, SnapshotResult
+from subtopics import FUSION_LABELS, FUSION_MODES, parse_subtopics
+
+TOP_N = 5
+# Converted NLRec datasets (see nlrec.py), searched one shard per city; the
+# datasets table falls back to the published corpus sizes when this
+# directory is absent.
+NLREC_DIR = os.environ.get("NLREC_DIR", os.path.join(os.path.dirname(__file__), "data", "nlrec"))
+# OpenAI-compatible endpoint for live reformulations; the offline stub otherwise.
+LLM_URL = os.environ.get("EQR_LLM_URL")
+LLM_MODEL = os.environ.get("EQR_LLM_MODEL", "gpt-4o-mini")
+# Precomputed rankings (``python snapshot.py``); queries not in it run live.
+SNAPSHOT_PATH = os.environ.get("EQR_SNAPSHOT", DEFAULT_SNAPSHOT)
+# Optional .npz file keeping query embeddings across server restarts.
+QUERY_CACHE_PATH = os.environ.get("EQR_QUERY_CACHE")
+# Reformulations persist here across restarts and evaluation reruns.
+REFORMULATION_CACHE = os.environ.get("EQR_REFORMULATION_CACHE", DEFAULT_REFORMULATION_CACHE)
+
 # --- PAGE CONFIGURATION ---
 st.set_page_config(
     page_title="EQR: Elaborative Query Reformulation",
@@ -65,6 +95,78 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# --- RETRIEVAL PIPELINE (shared by every session of this server process) ---
+@st.cache_resource
+def load_pipeline():
+    encoder = HashingEncoder()
+    index = PassageIndex.from_passages(PASSAGES, encoder)
+    cache = ReformulationCache(REFORMULATION_CACHE)
+    llm = HTTPLLM(LLM_URL, LLM_MODEL, os.environ.get("EQR_LLM_API_KEY")) if LLM_URL else StubLLM(CANNED_REFORMULATIONS)
+    # One client for all sessions: the three methods run concurrently and
+    # identical in-flight prompts from different sessions share a request.
+    client = AsyncLLMClient(llm, max_concurrency=8, timeout=30.0)
+    # Passages are encoded above without the cache; queries go through it,
+    # keyed like the reformulation cache.
+    query_cache = EmbeddingCache(path=QUERY_CACHE_PATH)
+    if QUERY_CACHE_PATH:
+        query_cache.save_at_exit()
+    return EQRPipeline(index, CachedEncoder(encoder, query_cache), Reformulator(client, cache),
+                       lexical=BM25Index.from_texts(index.texts))
+
+@st.cache_resource
+def load_snapshot():
+    """The ranking snapshot, or None when missing or built for another model, prompt or corpus."""
+    if not os.path.exists(SNAPSHOT_PATH):
+        return None
+    snapshot = Snapshot.load(SNAPSHOT_PATH)
+    return snapshot if snapshot.matches(load_pipeline()) else None
+
+@st.cache_resource
+def load_nlrec_store():
+    """``NLRecStore`` over ``NLREC_DIR``, or None when no data is converted."""
+    if not os.path.isdir(NLREC_DIR):
+        return None
+    store = NLRecStore(NLREC_DIR)
+    return store if store.datasets() else None
+
+@st.cache_resource
+def load_nlrec_pipeline(dataset):
+    """``EQRPipeline`` over one NLRec dataset, with one ``ShardedIndex`` shard per city."""
+    pipeline = load_pipeline()
+    index = ShardedIndex.from_store(load_nlrec_store(), dataset, HashingEncoder())
+    return EQRPipeline(index, pipeline.encoder, pipeline.reformulator, lexical=BM25Index.from_texts(index.texts))
+
+@st.cache_data
+def nlrec_item_names(dataset):
+    store = load_nlrec_store()
+    return {item: name for city in store.cities(dataset) for item, name in store.item_names(dataset, city).items()}
+
+@st.cache_data
+def corpus_sizes():
+    store = load_nlrec_store()
+    return None if store is None else pd.DataFrame(store.corpus_table())
+
+def render_ranks(result, method, relevant, names=None):
+    """Top-N list for one method; relevant items green, others red when labels exist.
+
+    ``names`` maps item ids to display names (ids are shown when absent).
+    """
+    names = names or {}
+    for rank, item, score in result.ranking(method, TOP_N):
+        color_class = "" if relevant is None else ("rank-ideal" if item in relevant else "rank-bad")
+        st.markdown(f'<div class="rank-item {color_class}"><span>{rank}. {html.escape(str(names.get(item, item)))}</span><span class="rank-score">{score:.2f}</span></div>', unsafe_allow_html=True)
+    # Relevant items that did not make the top-N, with the rank they got.
+    # Snapshot results only store ranks down to their depth (None below it).
+    missed = sorted(
+        (result.rank_of(method, item) or float("inf"), item) for item in relevant or () if item in result.item_ids
+    )
+    missed = [(rank, item) for rank, item in missed if rank > TOP_N]
+    if missed:
+        st.markdown('<div class="rank-item"><span>...</span><span></span></div>', unsafe_allow_html=True)
+        rank, item = missed[0]
+        rank = "—" if rank == float("inf") else f"{rank}."
+        st.markdown(f'<div class="rank-item rank-ideal"><span>{rank} {html.escape(str(names.get(item, item)))}</span><span class="rank-score">missed</span></div>', unsafe_allow_html=True)
+
 # --- HEADER ---
 def render_header():
     st.markdown("""
@@ -110,32 +212,34 @@ def render_demo():
     st.markdown("## 🔍 Interactive Comparison")
     st.caption("Select a query to see how different reformulation methods affect retrieval results.")
     
-    # Pre-defined scenarios based on the paper
-    scenarios = {
-        "Cities for youth-friendly activities": {
-            "q2e_text": "Night life; Budget hotels; Outdoor activities; Hostels; Backpacking; Cheap eats; Bars; Clubs",
-            "q2d_text": "Amsterdam is a vibrant city known for its lively nightlife and strong youth culture. It offers numerous hostels...",
-            "eqr_text": """1. Night life: Cities with live music venues, diverse night markets...
-2. Budget hotels: Cities with budget-friendly lodging options...
-3. Outdoor activities: Cities with lots of biking trails, beaches...""",
-            "q2e_ranks": [("1. Amsterdam", "0.85"), ("2. Bucharest", "0.84 (Cheap but not youth focused)"), ("...", ""), ("56. Bangkok", "0.62")],
-            "q2d_ranks": [("1. Amsterdam", "0.88"), ("...", ""), ("73. Vancouver", "0.55 (Missed outdoor aspect)"), ("...", "")],
-            "eqr_ranks": [("1. Amsterdam", "0.89"), ("2. Bangkok", "0.82"), ("3. Vancouver", "0.80"), ("...", "")]
-        },
-        "Cities for a high school graduation trip": {
-            "q2e_text": "youth-friendly activities; budget accommodations; group tours; adventure parks; cultural experiences",
-            "q2d_text": "New York City, USA: As one of the world's most iconic destinations, NYC offers a dynamic setting for graduation trips...",
-            "eqr_text": """1. Adventure Activities: Cities offering exciting outdoor activities... (e.g. Queenstown)
-2. Cultural Hotspots: Cities rich in museums and history... (e.g. Rome)
-3. Beach Destinations: Vibrant beach scenes suitable for young travelers... (e.g. Miami)""",
-            "q2e_ranks": [("1. Aarhus", "0.81"), ("2. San Francisco", "0.79"), ("...", "")],
-            "q2d_ranks": [("1. New York City", "0.86"), ("2. London", "0.84"), ("...", "")],
-            "eqr_ranks": [("1. Queenstown", "0.88"), ("2. New York City", "0.85"), ("3. Rome", "0.82")]
-        }
-    }
-
-    query_selection = st.selectbox("Choose a User Query:", list(scenarios.keys()))
-    data = scenarios[query_selection]
+    query_selection = st.selectbox("Choose a User Query:", list(CANNED_REFORMULATIONS))
+    custom_query = st.text_input("...or type your own:", placeholder="e.g. Cities for a quiet relaxing retreat")
+    query = custom_query.strip() or query_selection
+    fusion = st.radio(
+        "EQR scoring", FUSION_MODES, index=FUSION_MODES.index("mean"),
+        format_func=FUSION_LABELS.get, horizontal=True,
+        help="Score each EQR subtopic as its own query vector and fuse the per-item scores."
+    )
+    retrieval = st.radio(
+        "Passage retrieval", RETRIEVAL_MODES, format_func=RETRIEVAL_LABELS.get, horizontal=True,
+        help="Dense embeddings, BM25 over the passages, or reciprocal rank fusion of both."
+    )
+    relevant = RELEVANT.get(query)
+    snapshot = load_snapshot() if retrieval == "dense" else None
+    result = snapshot.get(query, fusion) if snapshot is not None else None
+    if result is None:
+        try:
+            result = load_pipeline().run(query, fusion=fusion, retrieval=retrieval)
+        except (LLMError, TimeoutError) as exc:
+            # LLM unavailable: fall back to the precomputed dense ranking.
+            snapshot = load_snapshot()
+            result = snapshot.get(query, fusion) if snapshot is not None else None
+            if result is None:
+                st.error(f"Could not reformulate the query: {exc}")
+                return
+            st.warning(f"Could not reformulate the query ({exc}); showing the precomputed dense ranking.")
+    if relevant is None:
+        st.caption("No relevance labels for this query, so results are not colour-coded.")
 
     # --- VISUALIZATION COLUMNS ---
     col1, col2, col3 = st.columns(3)
@@ -145,34 +249,41 @@ def render_demo():
         st.markdown("#### Q2E (Breadth Only)")
         st.caption("Query2Expansion")
         with st.container():
-            st.markdown(f'<div class="ref-box q2e">{data["q2e_text"]}</div>', unsafe_allow_html=True)
+            st.markdown(f'<div class="ref-box q2e">{html.escape(result.texts["q2e"])}</div>', unsafe_allow_html=True)
             st.markdown("**Result:** Expands keywords but lacks context. Can retrieve superficially matching items.")
             st.markdown("---")
-            for rank, score in data["q2e_ranks"]:
-                color_class = "rank-bad" if "Bucharest" in rank or "Aarhus" in rank else ""
-                st.markdown(f'<div class="rank-item {color_class}"><span>{rank}</span><span class="rank-score">{score}</span></div>', unsafe_allow_html=True)
+            render_ranks(result, "q2e", relevant)
 
     # METHOD 2: Q2D
     with col2:
         st.markdown("#### Q2D (Depth Only)")
         st.caption("Query2Doc")
         with st.container():
-            st.markdown(f'<div class="ref-box q2d">{data["q2d_text"]}</div>', unsafe_allow_html=True)
+            st.markdown(f'<div class="ref-box q2d">{html.escape(result.texts["q2d"])}</div>', unsafe_allow_html=True)
             st.markdown("**Result:** Focuses deeply on one interpretation (Tunnel Vision). Misses other relevant items.")
             st.markdown("---")
-            for rank, score in data["q2d_ranks"]:
-                st.markdown(f'<div class="rank-item"><span>{rank}</span><span class="rank-score">{score}</span></div>', unsafe_allow_html=True)
+            render_ranks(result, "q2d", relevant)
 
     # METHOD 3: EQR (OURS)
     with col3:
         st.markdown("#### EQR (Breadth + Depth)")
         st.caption("Elaborative Subtopic QR")
         with st.container():
-            st.markdown(f'<div class="ref-box eqr">{data["eqr_text"]}</div>', unsafe_allow_html=True)
+            st.markdown(f'<div class="ref-box eqr">{html.escape(result.texts["eqr"])}</div>', unsafe_allow_html=True)
+            if fusion != "single":
+                st.caption(f"{len(parse_subtopics(result.texts['eqr']))} subtopic vectors • {FUSION_LABELS[fusion]}")
             st.markdown("**Result:** Breaks query into subtopics AND elaborates on them. Retrieves diverse, relevant items.")
             st.markdown("---")
-            for rank, score in data["eqr_ranks"]:
-                st.markdown(f'<div class="rank-item rank-ideal"><span>{rank}</span><span class="rank-score">{score}</span></div>', unsafe_allow_html=True)
+            render_ranks(result, "eqr", relevant)
+
+    if isinstance(result, SnapshotResult):
+        st.caption("Served from the precomputed ranking snapshot.")
+        return
+    stats = load_pipeline().reformulator.cache.stats()
+    st.caption(
+        f"Reformulation cache: {stats['entries']} entries • {stats['hits']} hits / "
+        f"{stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)"
+    )
 
 # --- PIPELINE VISUALIZATION ---
 def render_pipeline():
@@ -220,22 +331,49 @@ def render_datasets():
     🤗 **[Access the datasets on Hugging Face](https://huggingface.co/datasets/cuijustin0617/NLRec)**
     """)
     
-    df = pd.DataFrame({
-        "Dataset": ["Yelp Restaurant", "TripAdvisor Hotel", "Traveldest"],
-        "Cities/Categories": [
-            "New Orleans (nor), Philadelphia (phi)",
-            "New York City, Chicago, London, Montreal",
-            "/"
-        ],
-        "Corpus Size": [
-            "1,152 restaurants (nor: 515, phi: 637)",
-            "586 hotels (nyc: 182, chicago: 74, london: 266, montreal: 64)",
-            "775 cities"
-        ],
-        "Queries": [100, 100, 100]
-    })
+    df = corpus_sizes()
+    if df is None:
+        df = pd.DataFrame({
+            "Dataset": ["Yelp Restaurant", "TripAdvisor Hotel", "Traveldest"],
+            "Cities/Categories": [
+                "New Orleans (nor), Philadelphia (phi)",
+                "New York City, Chicago, London, Montreal",
+                "/"
+            ],
+            "Corpus Size": [
+                "1,152 restaurants (nor: 515, phi: 637)",
+                "586 hotels (nyc: 182, chicago: 74, london: 266, montreal: 64)",
+                "775 cities"
+            ],
+            "Queries": [100, 100, 100]
+        })
     
     st.table(df)
+    render_nlrec_search()
+
+def render_nlrec_search():
+    """Run a dataset query over the converted corpus, sharded by city."""
+    store = load_nlrec_store()
+    if store is None:
+        return
+
+    st.markdown("#### Search a dataset")
+    dataset = st.selectbox("Dataset", store.datasets(), format_func=lambda d: DATASETS[d]["label"])
+    queries = dict(store.queries(dataset))
+    if not queries:
+        return
+    query_id = st.selectbox("Query", list(queries), format_func=queries.get)
+    try:
+        result = load_nlrec_pipeline(dataset).run(queries[query_id], fusion="mean")
+    except (LLMError, TimeoutError) as exc:
+        st.error(f"Could not reformulate the query: {exc}")
+        return
+    relevant = {item for item, relevance in store.labels(dataset).get(query_id, {}).items() if relevance > 0}
+    names = nlrec_item_names(dataset)
+    for col, method in zip(st.columns(len(METHODS)), METHODS):
+        with col:
+            st.markdown(f"**{METHOD_LABELS[method]}**")
+            render_ranks(result, method, relevant, names)
     
     # Detailed dataset descriptions
     st.markdown("### Dataset Details")
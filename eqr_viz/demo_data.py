@@ -0,0 +1,91 @@
+"""Toy Traveldest-style corpus behind the EQR demo.
+
+Each city is described by a few WikiVoyage-like passages. The two demo
+queries come with the reformulations from the paper and hand-made relevance
+labels.
+"""
+
+PASSAGES = {
+    "Amsterdam": [
+        "Amsterdam has a legendary night life with bars, clubs and live music venues around Leidseplein.",
+        "Budget hotels and hostels are plentiful, popular with backpackers and students.",
+        "Rent a bike and cycle the canals, parks and outdoor trails around the city.",
+    ],
+    "Bangkok": [
+        "Bangkok's night markets and rooftop bars make for a lively night life.",
+        "Khao San Road is packed with cheap hostels, budget hotels and street food for backpackers.",
+        "Day trips offer outdoor activities like island hopping and jungle treks.",
+    ],
+    "Vancouver": [
+        "Vancouver is famous for outdoor activities: hiking, kayaking, biking trails and beaches.",
+        "Young travellers enjoy the craft breweries and live music of Gastown.",
+        "Hostels downtown keep accommodation affordable for budget travellers.",
+    ],
+    "Bucharest": [
+        "Bucharest is one of the cheapest capitals in Europe for food and accommodation.",
+        "The Palace of the Parliament is among the largest buildings in the world.",
+        "Old town has a handful of bars and pubs.",
+    ],
+    "Aarhus": [
+        "Aarhus is a university city with a young population and many youth-friendly activities.",
+        "The ARoS art museum and its rainbow panorama are the main attractions.",
+    ],
+    "San Francisco": [
+        "San Francisco offers group tours of Alcatraz and the Golden Gate Bridge.",
+        "Accommodation is expensive, though a few hostels exist near Union Square.",
+        "Cultural experiences range from Chinatown to the museums of Golden Gate Park.",
+    ],
+    "New York City": [
+        "New York City is an iconic destination with Broadway shows, museums and endless night life.",
+        "Graduation trips often include group tours of Times Square and the Statue of Liberty.",
+        "Hotels are pricey, but hostels in Brooklyn offer budget accommodations.",
+    ],
+    "London": [
+        "London's museums, theatres and historic sites offer cultural experiences for every age.",
+        "Pubs, clubs and live music make Camden and Shoreditch lively at night.",
+    ],
+    "Queenstown": [
+        "Queenstown is the adventure capital of the world: bungee jumping, skydiving and jet boating.",
+        "Exciting outdoor activities like skiing, hiking and rafting attract young travellers.",
+        "Backpacker hostels and a buzzing bar scene make it a favourite for graduation trips.",
+    ],
+    "Rome": [
+        "Rome is a cultural hotspot rich in museums, history and ancient ruins like the Colosseum.",
+        "Students visit the Vatican Museums and enjoy cheap pizza and gelato.",
+    ],
+    "Miami": [
+        "Miami has vibrant beach destinations and a beach scene suitable for young travellers.",
+        "South Beach night life runs until dawn with clubs and bars.",
+    ],
+    "Kyoto": [
+        "Kyoto is known for temples, tea houses and traditional gardens.",
+        "Quiet ryokan inns offer a peaceful, relaxing stay.",
+    ],
+    "Zurich": [
+        "Zurich is a banking centre with upscale shopping and expensive hotels.",
+        "Lake Zurich offers calm boat cruises.",
+    ],
+}
+
+# Reformulations from the paper for the demo queries.
+CANNED_REFORMULATIONS = {
+    "Cities for youth-friendly activities": {
+        "q2e": "Night life; Budget hotels; Outdoor activities; Hostels; Backpacking; Cheap eats; Bars; Clubs",
+        "q2d": "Amsterdam is a vibrant city known for its lively nightlife and strong youth culture. It offers numerous hostels...",
+        "eqr": """1. Night life: Cities with live music venues, diverse night markets...
+2. Budget hotels: Cities with budget-friendly lodging options...
+3. Outdoor activities: Cities with lots of biking trails, beaches...""",
+    },
+    "Cities for a high school graduation trip": {
+        "q2e": "youth-friendly activities; budget accommodations; group tours; adventure parks; cultural experiences",
+        "q2d": "New York City, USA: As one of the world's most iconic destinations, NYC offers a dynamic setting for graduation trips...",
+        "eqr": """1. Adventure Activities: Cities offering exciting outdoor activities... (e.g. Queenstown)
+2. Cultural Hotspots: Cities rich in museums and history... (e.g. Rome)
+3. Beach Destinations: Vibrant beach scenes suitable for young travelers... (e.g. Miami)""",
+    },
+}
+
+RELEVANT = {
+    "Cities for youth-friendly activities": {"Amsterdam", "Bangkok", "Vancouver", "Queenstown", "Miami"},
+    "Cities for a high school graduation trip": {"Queenstown", "New York City", "Rome", "Miami", "London"},
+}
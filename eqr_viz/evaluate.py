@@ -0,0 +1,209 @@
+"""Offline evaluation of Q2E / Q2D / EQR on an NLRec dataset.
+
+    python evaluate.py --data data/nlrec --dataset yelp --out report.parquet
+    python evaluate.py --demo                  # toy corpus, no data needed
+
+For each city partition, every query is reformulated by every method. All
+reformulations are then scored in one batched ``(query vectors x passages)``
+pass (``EQRPipeline.run_many``). nDCG@k, Recall@k and AP for each (query,
+method) are computed in a process pool. The report is a Parquet file with one
+row per (city, query, method). Its schema metadata holds the per-stage wall
+times under ``stage_seconds``, and a per-method summary is printed.
+"""
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from bm25 import BM25Index
+from demo_data import CANNED_REFORMULATIONS, PASSAGES, RELEVANT
+from nlrec import NLRecStore
+from pipeline import EQRPipeline, PassageIndex
+from quantization import QuantizedPassageIndex
+from reformulation import METHOD_LABELS, METHODS
+
+STAGES = ("load", "index", "reformulate", "retrieve", "metrics")
+
+
+def ndcg_at_k(gains, label_gains, k):
+    """nDCG@k from the gains of the ranked items and all label gains."""
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    dcg = float(np.dot(gains[:k], discounts[:len(gains[:k])]))
+    ideal = np.sort(label_gains)[::-1][:k]
+    idcg = float(np.dot(ideal, discounts[:len(ideal)]))
+    return dcg / idcg if idcg > 0 else 0.0
+
+
+def recall_at_k(hits, n_relevant, k):
+    return float(hits[:k].sum()) / n_relevant if n_relevant else 0.0
+
+
+def average_precision(hits, n_relevant):
+    """AP over the full ranking; relevant items never ranked count as misses."""
+    if not n_relevant:
+        return 0.0
+    ranks = np.flatnonzero(hits) + 1
+    return float((np.arange(1, len(ranks) + 1) / ranks).sum()) / n_relevant
+
+
+def _metrics_chunk(chunk, k):
+    """Metrics for a list of ``(ranked_gains, label_gains)`` pairs (worker side)."""
+    out = []
+    for gains, label_gains in chunk:
+        hits = gains > 0
+        n_relevant = int((label_gains > 0).sum())
+        out.append((
+            ndcg_at_k(gains, label_gains, k),
+            recall_at_k(hits, n_relevant, k),
+            average_precision(hits, n_relevant),
+        ))
+    return out
+
+
+def compute_metrics(jobs, k, workers=None):
+    """Run ``_metrics_chunk`` over ``jobs`` split across a process pool."""
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) < 64:
+        return _metrics_chunk(jobs, k)
+    size = -(-len(jobs) // workers)
+    chunks = [jobs[i:i + size] for i in range(0, len(jobs), size)]
+    with ProcessPoolExecutor(workers) as pool:
+        return [row for part in pool.map(_metrics_chunk, chunks, [k] * len(chunks)) for row in part]
+
+
+def demo_partitions():
+    """The toy corpus as a single partition: (city, passages, queries, labels)."""
+    queries = [(str(i), query) for i, query in enumerate(RELEVANT)]
+    labels = {str(i): {item: 1 for item in RELEVANT[query]} for i, query in enumerate(RELEVANT)}
+    yield "demo", PASSAGES, queries, labels
+
+
+def nlrec_partitions(store, dataset, cities=None):
+    queries = store.queries(dataset)
+    labels = store.labels(dataset)
+    for city in cities or store.cities(dataset):
+        yield city, store.passages_by_item(dataset, city), queries, labels
+
+
+def evaluate(partitions, reformulator, encoder, methods=METHODS, fusion="single", retrieval="dense",
+             k=10, passage_k=3, workers=None, quantize=None):
+    """Evaluate ``methods`` on every partition; returns ``(rows, stage_seconds)``.
+
+    ``quantize`` ("int8" or "binary") scores passages through a
+    ``QuantizedPassageIndex`` to measure the recall cost on real queries.
+    Its float embeddings are memory-mapped from a temporary directory.
+    """
+    stages = dict.fromkeys(STAGES, 0.0)
+    rows, jobs = [], []
+    scratch = tempfile.TemporaryDirectory() if quantize else None
+    partitions = iter(partitions)
+    while True:
+        start = time.perf_counter()
+        try:
+            city, passages, queries, labels = next(partitions)
+        except StopIteration:
+            break
+        stages["load"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = PassageIndex.from_passages(passages, encoder)
+        if quantize:
+            path = os.path.join(scratch.name, f"embeddings-{len(rows)}.npy")
+            index = QuantizedPassageIndex.from_index(index, path, quantize)
+        lexical = BM25Index.from_texts(index.texts) if retrieval != "dense" else None
+        pipeline = EQRPipeline(index, encoder, reformulator, passage_k, lexical)
+        stages["index"] += time.perf_counter() - start
+
+        # Only queries with at least one relevant item in this partition count.
+        position = {item: i for i, item in enumerate(pipeline.index.item_ids)}
+        queries = [(qid, q) for qid, q in queries if any(i in position for i in labels.get(qid, ()))]
+        start = time.perf_counter()
+        texts = reformulator.reformulate_many([q for _, q in queries], methods)
+        stages["reformulate"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = pipeline.run_many([q for _, q in queries], methods, fusion, retrieval, texts)
+        stages["retrieve"] += time.perf_counter() - start
+
+        for (qid, query), result in zip(queries, results):
+            gains = np.zeros(pipeline.index.n_items)
+            for item, gain in labels[qid].items():
+                if item in position:
+                    gains[position[item]] = gain
+            label_gains = gains[gains > 0]
+            for m, method in enumerate(methods):
+                rows.append({"city": city, "query_id": qid, "query": query, "method": method})
+                jobs.append((gains[result.order[m]], label_gains))
+
+    if scratch is not None:
+        scratch.cleanup()
+
+    start = time.perf_counter()
+    for row, (ndcg, recall, ap) in zip(rows, compute_metrics(jobs, k, workers)):
+        row.update({f"ndcg@{k}": ndcg, f"recall@{k}": recall, "ap": ap})
+    stages["metrics"] = time.perf_counter() - start
+    return rows, stages
+
+
+def write_report(rows, stages, path, **meta):
+    table = pa.Table.from_pylist(rows)
+    metadata = {"stage_seconds": json.dumps(stages), **{key: json.dumps(value) for key, value in meta.items()}}
+    pq.write_table(table.replace_schema_metadata(metadata), path)
+
+
+def summarize(rows, k):
+    """``{method: {metric: mean}}`` over all evaluated queries."""
+    out = {}
+    for method in dict.fromkeys(row["method"] for row in rows):
+        picked = [row for row in rows if row["method"] == method]
+        out[method] = {m: float(np.mean([row[m] for row in picked])) for m in (f"ndcg@{k}", f"recall@{k}", "ap")}
+    return out
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from encoder import HashingEncoder
+    from llm_client import add_llm_arguments, client_from_args
+    from pipeline import RETRIEVAL_MODES
+    from quantization import QUANTIZATIONS
+    from reformulation import Reformulator, StubLLM
+    from reformulation_cache import DEFAULT_PATH as CACHE_PATH, ReformulationCache
+    from subtopics import FUSION_MODES
+
+    parser = argparse.ArgumentParser(description="Evaluate Q2E / Q2D / EQR on an NLRec dataset.")
+    parser.add_argument("--data", help="converted NLRec directory (see nlrec.py)")
+    parser.add_argument("--dataset", default="traveldest")
+    parser.add_argument("--city", action="append", help="only these city partitions (repeatable)")
+    parser.add_argument("--demo", action="store_true", help="evaluate on the toy demo corpus")
+    parser.add_argument("--fusion", choices=FUSION_MODES, default="mean")
+    parser.add_argument("--retrieval", choices=RETRIEVAL_MODES, default="dense")
+    parser.add_argument("--quantize", choices=QUANTIZATIONS, help="score passages from int8/binary codes")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--cache", default=CACHE_PATH, help="reformulation cache (SQLite)")
+    add_llm_arguments(parser)
+    parser.add_argument("--out", default="eqr_report.parquet")
+    args = parser.parse_args()
+
+    if args.demo:
+        partitions, llm = demo_partitions(), StubLLM(CANNED_REFORMULATIONS)
+    elif args.data:
+        partitions, llm = nlrec_partitions(NLRecStore(args.data), args.dataset, args.city), StubLLM()
+    else:
+        parser.error("pass --data or --demo")
+    reformulator = Reformulator(client_from_args(args, llm), ReformulationCache(args.cache))
+    rows, stages = evaluate(partitions, reformulator, HashingEncoder(), fusion=args.fusion,
+                            retrieval=args.retrieval, k=args.k, workers=args.workers, quantize=args.quantize)
+    write_report(rows, stages, args.out, dataset="demo" if args.demo else args.dataset,
+                 fusion=args.fusion, retrieval=args.retrieval, quantize=args.quantize, k=args.k)
+
+    for method, metrics in summarize(rows, args.k).items():
+        print(f"{METHOD_LABELS[method]:>4}  " + "  ".join(f"{name} {value:.3f}" for name, value in metrics.items()))
+    print("stages: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in stages.items()))
+    print(f"wrote {len(rows)} rows to {args.out}")
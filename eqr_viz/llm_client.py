@@ -0,0 +1,224 @@
+"""Concurrent LLM calls for the reformulation fan-out.
+
+``AsyncLLMClient`` wraps any blocking client with ``complete(prompt)``
+(``StubLLM`` or ``HTTPLLM``):
+
+- ``complete_many(prompts)`` sends all prompts at once, so Q2E, Q2D and EQR
+  together cost about one round trip instead of three.
+- At most ``max_concurrency`` requests run at a time.
+- Each request fails with ``TimeoutError`` after ``timeout`` seconds. Its
+  worker thread still holds a concurrency slot until the call returns.
+- Identical prompts already in flight share one request. This also works
+  across Streamlit sessions, because every client runs its coroutines on one
+  background event loop (``background_loop()``).
+
+Blocking calls run in worker threads via ``asyncio.to_thread``. ``HTTPLLM``
+uses only ``urllib``, and ``serve_stub`` starts a local mock endpoint that
+needs no API key. ``add_llm_arguments`` / ``client_from_args`` give the
+command-line tools the same backend options as the app (``EQR_LLM_URL``,
+``EQR_LLM_MODEL``, ``EQR_LLM_API_KEY``). Run ``python llm_client.py`` to
+compare sequential and concurrent latency against that mock server.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class LLMError(RuntimeError):
+    """The LLM endpoint returned an error or an unreadable response."""
+
+
+class HTTPLLM:
+    """Blocking client for an OpenAI-compatible ``/chat/completions`` endpoint."""
+
+    def __init__(self, base_url, model, api_key=None, timeout=30.0):
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.model_id = model
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def complete(self, prompt):
+        body = json.dumps({"model": self.model_id, "messages": [{"role": "user", "content": prompt}]})
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        request = urllib.request.Request(self.url, body.encode("utf-8"), headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                payload = json.load(response)
+            return payload["choices"][0]["message"]["content"]
+        except (urllib.error.URLError, KeyError, IndexError, ValueError) as exc:
+            raise LLMError(f"LLM request to {self.url} failed: {exc}") from exc
+
+
+class _BackgroundLoop:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=self.loop.run_forever, name="llm-client-loop", daemon=True)
+        thread.start()
+
+    def run(self, coro):
+        """Run ``coro`` on the loop and block the calling thread for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def background_loop():
+    """Process-wide event loop thread shared by all ``AsyncLLMClient`` objects."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = _BackgroundLoop()
+        return _loop
+
+
+class AsyncLLMClient:
+    """Concurrency-limited, coalescing async front end for a blocking LLM."""
+
+    def __init__(self, llm, max_concurrency=4, timeout=30.0):
+        self.llm = llm
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._loop = background_loop()
+        # Only touched from coroutines on the background loop, so no lock.
+        self._semaphore = None
+        self._in_flight = {}
+        self.requests = 0
+        self.coalesced = 0
+
+    @property
+    def model_id(self):
+        return self.llm.model_id
+
+    async def acomplete(self, prompt):
+        future = self._in_flight.get(prompt)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[prompt] = future
+        try:
+            result = await self._call(prompt)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            future.exception()  # mark retrieved when nobody else is waiting
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._in_flight[prompt]
+
+    async def _call(self, prompt):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        await self._semaphore.acquire()
+        self.requests += 1
+        # A timed-out thread keeps running, so its slot is freed when the
+        # worker returns, not when the caller stops waiting.
+        worker = asyncio.ensure_future(asyncio.to_thread(self.llm.complete, prompt))
+        worker.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.shield(worker), self.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"LLM request timed out after {self.timeout:g}s") from None
+
+    def _release(self, worker):
+        self._semaphore.release()
+        if not worker.cancelled():
+            worker.exception()  # retrieved here when the caller timed out
+
+    async def acomplete_many(self, prompts):
+        return list(await asyncio.gather(*(self.acomplete(p) for p in prompts)))
+
+    def complete(self, prompt):
+        return self._loop.run(self.acomplete(prompt))
+
+    def complete_many(self, prompts):
+        """Completions for ``prompts``, requested concurrently, in input order."""
+        return self._loop.run(self.acomplete_many(prompts))
+
+
+def add_llm_arguments(parser):
+    """``--llm-url``, ``--llm-model`` and ``--concurrency`` options of the CLIs."""
+    parser.add_argument("--llm-url", default=os.environ.get("EQR_LLM_URL"),
+                        help="OpenAI-compatible endpoint (default: $EQR_LLM_URL, else the offline stub)")
+    parser.add_argument("--llm-model", default=os.environ.get("EQR_LLM_MODEL", "gpt-4o-mini"))
+    parser.add_argument("--concurrency", type=int, default=8, help="LLM requests in flight")
+
+
+def client_from_args(args, fallback):
+    """``AsyncLLMClient`` for ``--llm-url``, or for ``fallback`` when no URL is given."""
+    if args.llm_url:
+        llm = HTTPLLM(args.llm_url, args.llm_model, os.environ.get("EQR_LLM_API_KEY"))
+    else:
+        llm = fallback
+    return AsyncLLMClient(llm, max_concurrency=args.concurrency)
+
+
+def serve_stub(llm, port=0, delay=0.0):
+    """Mock ``/chat/completions`` server backed by ``llm``.
+
+    Serves from a daemon thread. Returns the server, whose ``server_address``
+    gives the bound port. Each reply waits ``delay`` seconds to imitate
+    network latency.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(delay)
+            try:
+                text = llm.complete(body["messages"][-1]["content"])
+            except ValueError as exc:
+                self.send_error(400, str(exc))
+                return
+            payload = json.dumps({"choices": [{"message": {"role": "assistant", "content": text}}]})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(payload.encode("utf-8"))
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from reformulation import METHODS, PROMPTS, StubLLM
+
+    parser = argparse.ArgumentParser(description="Sequential vs concurrent reformulation latency.")
+    parser.add_argument("--delay", type=float, default=0.5, help="mock server latency per request (s)")
+    parser.add_argument("--query", default="Cities for a high school graduation trip")
+    args = parser.parse_args()
+
+    server = serve_stub(StubLLM(), delay=args.delay)
+    llm = HTTPLLM(f"http://127.0.0.1:{server.server_address[1]}", StubLLM.model_id)
+    prompts = [PROMPTS[m].format(query=args.query) for m in METHODS]
+
+    start = time.perf_counter()
+    for prompt in prompts:
+        llm.complete(prompt)
+    print(f"sequential: {time.perf_counter() - start:.2f}s")
+
+    client = AsyncLLMClient(llm)
+    start = time.perf_counter()
+    client.complete_many(prompts + prompts)  # duplicates are coalesced
+    print(f"concurrent: {time.perf_counter() - start:.2f}s "
+          f"({client.requests} requests, {client.coalesced} coalesced)")
+    server.shutdown()
@@ -0,0 +1,178 @@
+"""NLRec datasets as city-partitioned Parquet, loaded one partition at a time.
+
+Raw files (as downloaded from Hugging Face) are expected under
+``<raw>/<dataset>/``::
+
+    queries.jsonl              {"query_id": ..., "query": ...}
+    labels.jsonl               {"query_id": ..., "item_id": ..., "relevance": ...}
+    corpus/<city>.jsonl        {"item_id": ..., "name": ..., "text": ...}   one passage per line
+                               (or {"item_id": ..., "passages": [...]})
+
+``convert()`` rewrites them as::
+
+    <root>/<dataset>/queries.parquet
+    <root>/<dataset>/labels.parquet
+    <root>/<dataset>/city=<city>/passages.parquet   sorted by item_id
+
+``NLRecStore`` opens a single city partition on demand, memory-mapped. It
+never reads the other partitions, so a per-city evaluation only pays for
+its own city. Run ``python eqr_viz/nlrec.py <raw> <root>`` to convert.
+"""
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+DATASETS = {
+    "yelp": {
+        "label": "Yelp Restaurant",
+        "items": "restaurants",
+        "cities": {"nor": "New Orleans", "phi": "Philadelphia"},
+    },
+    "tripadvisor": {
+        "label": "TripAdvisor Hotel",
+        "items": "hotels",
+        "cities": {"nyc": "New York City", "chicago": "Chicago", "london": "London", "montreal": "Montreal"},
+    },
+    "traveldest": {
+        "label": "Traveldest",
+        "items": "cities",
+        "cities": {},
+    },
+}
+
+
+def _read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _passage_rows(path):
+    for record in _read_jsonl(path):
+        texts = record["passages"] if "passages" in record else [record["text"]]
+        for text in texts:
+            yield {"item_id": str(record["item_id"]), "name": record.get("name", str(record["item_id"])), "text": text}
+
+
+def convert(raw_root, root, datasets=None):
+    """Convert raw NLRec JSONL files under ``raw_root`` to Parquet under ``root``."""
+    for dataset in datasets or DATASETS:
+        src = os.path.join(raw_root, dataset)
+        if not os.path.isdir(src):
+            continue
+        dst = os.path.join(root, dataset)
+        os.makedirs(dst, exist_ok=True)
+        for name in ("queries", "labels"):
+            path = os.path.join(src, f"{name}.jsonl")
+            if os.path.exists(path):
+                rows = [{k: (str(v) if k.endswith("_id") else v) for k, v in r.items()} for r in _read_jsonl(path)]
+                pq.write_table(pa.Table.from_pylist(rows), os.path.join(dst, f"{name}.parquet"))
+        corpus = os.path.join(src, "corpus")
+        for filename in sorted(os.listdir(corpus)):
+            city, ext = os.path.splitext(filename)
+            if ext != ".jsonl":
+                continue
+            table = pa.Table.from_pylist(list(_passage_rows(os.path.join(corpus, filename))))
+            # Sorting by item keeps each item's passages contiguous, which is
+            # the layout PassageIndex expects.
+            table = table.sort_by("item_id")
+            os.makedirs(os.path.join(dst, f"city={city}"), exist_ok=True)
+            pq.write_table(table, os.path.join(dst, f"city={city}", "passages.parquet"))
+
+
+class NLRecStore:
+    """Read-only access to converted NLRec datasets, one partition at a time."""
+
+    def __init__(self, root):
+        self.root = root
+        self._partitions = {}
+
+    def datasets(self):
+        return [d for d in DATASETS if os.path.isdir(os.path.join(self.root, d))]
+
+    def cities(self, dataset):
+        path = os.path.join(self.root, dataset)
+        return sorted(name.split("=", 1)[1] for name in os.listdir(path) if name.startswith("city="))
+
+    def partition(self, dataset, city):
+        """Passages of one city as a memory-mapped Arrow table (cached)."""
+        key = (dataset, city)
+        if key not in self._partitions:
+            path = os.path.join(self.root, dataset, f"city={city}", "passages.parquet")
+            self._partitions[key] = pq.read_table(path, memory_map=True)
+        return self._partitions[key]
+
+    def passages_by_item(self, dataset, city):
+        """``{item_id: [passage, ...]}`` for ``PassageIndex.from_passages``.
+
+        Items are keyed by id, as the relevance labels are: distinct items
+        can share a display name (chain restaurants, hotel brands). Use
+        ``item_names`` to label them.
+        """
+        table = self.partition(dataset, city)
+        out = {}
+        for item, text in zip(table.column("item_id").to_pylist(), table.column("text").to_pylist()):
+            out.setdefault(item, []).append(text)
+        return out
+
+    def item_names(self, dataset, city):
+        """``{item_id: display name}`` of one partition."""
+        table = self.partition(dataset, city)
+        return dict(zip(table.column("item_id").to_pylist(), table.column("name").to_pylist()))
+
+    def queries(self, dataset):
+        table = pq.read_table(os.path.join(self.root, dataset, "queries.parquet"))
+        return list(zip(table.column("query_id").to_pylist(), table.column("query").to_pylist()))
+
+    def labels(self, dataset):
+        """``{query_id: {item_id: relevance}}`` (relevance 1 when not given)."""
+        table = pq.read_table(os.path.join(self.root, dataset, "labels.parquet"))
+        relevance = table.column("relevance").to_pylist() if "relevance" in table.column_names else None
+        out = {}
+        for i, (qid, item) in enumerate(zip(table.column("query_id").to_pylist(), table.column("item_id").to_pylist())):
+            out.setdefault(qid, {})[item] = 1 if relevance is None else relevance[i]
+        return out
+
+    def n_items(self, dataset, city):
+        """Distinct items in a partition; reads only the ``item_id`` column."""
+        path = os.path.join(self.root, dataset, f"city={city}", "passages.parquet")
+        column = pq.read_table(path, columns=["item_id"], memory_map=True).column("item_id")
+        return pc.count_distinct(column).as_py()
+
+    def n_queries(self, dataset):
+        path = os.path.join(self.root, dataset, "queries.parquet")
+        return pq.ParquetFile(path).metadata.num_rows if os.path.exists(path) else 0
+
+    def corpus_table(self):
+        """Rows for the datasets table, counted from the converted files."""
+        rows = []
+        for dataset in self.datasets():
+            info = DATASETS[dataset]
+            cities = self.cities(dataset)
+            sizes = {city: self.n_items(dataset, city) for city in cities}
+            total = f"{sum(sizes.values()):,} {info['items']}"
+            if info["cities"]:
+                total += " (" + ", ".join(f"{city}: {n:,}" for city, n in sizes.items()) + ")"
+            rows.append({
+                "Dataset": info["label"],
+                "Cities/Categories": ", ".join(
+                    f"{info['cities'][c]} ({c})" if c in info["cities"] else c for c in cities
+                ) if info["cities"] else "/",
+                "Corpus Size": total,
+                "Queries": self.n_queries(dataset),
+            })
+        return rows
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        sys.exit("usage: python nlrec.py <raw-nlrec-dir> <parquet-dir>")
+    convert(sys.argv[1], sys.argv[2])
+    for row in NLRecStore(sys.argv[2]).corpus_table():
+        print(row)
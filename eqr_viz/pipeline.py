@@ -0,0 +1,204 @@
+"""EQR retrieval pipeline: reformulate -> dense retrieval -> top-k passage average.
+
+Passage embeddings live in one ``(n_passages, dim)`` matrix. Passages of
+the same item are stored back to back, so item ``i`` owns rows
+``offsets[i]:offsets[i + 1]``. All reformulations of a query (Q2E, Q2D,
+EQR, optionally one vector per EQR subtopic) are encoded together and scored
+in a single ``(n_queries, n_passages)`` matrix product. The top-k passage
+mean per item is then computed for every query at once.
+"""
+import numpy as np
+
+from bm25 import RRF_DEPTH, reciprocal_rank_fusion
+from reformulation import METHODS
+from subtopics import fuse, parse_subtopics
+from topk import segmented_topk_values, topk_sums
+
+RETRIEVAL_MODES = ("dense", "bm25", "hybrid")
+RETRIEVAL_LABELS = {"dense": "Dense", "bm25": "BM25", "hybrid": "Hybrid (RRF)"}
+
+# Passages scored per matrix product when computing per-item top-k, so the
+# full (queries x passages) score matrix is never materialised at once.
+BLOCK_PASSAGES = 1 << 18
+
+
+class PassageIndex:
+    """Contiguous passage-embedding matrix with per-item offsets."""
+
+    def __init__(self, embeddings, offsets, item_ids, texts=None):
+        offsets = np.asarray(offsets, dtype=np.int64)
+        if offsets.ndim != 1 or len(offsets) != len(item_ids) + 1:
+            raise ValueError("offsets must have one entry per item plus one")
+        if offsets[0] != 0 or offsets[-1] != len(embeddings) or np.any(np.diff(offsets) < 0):
+            raise ValueError("offsets must be non-decreasing from 0 to n_passages")
+        self.embeddings = embeddings
+        self.offsets = offsets
+        self.item_ids = list(item_ids)
+        self.texts = texts
+
+    @classmethod
+    def from_passages(cls, passages_by_item, encoder):
+        """Build an index from ``{item_id: [passage text, ...]}``."""
+        item_ids = list(passages_by_item)
+        texts = [text for item_id in item_ids for text in passages_by_item[item_id]]
+        offsets = np.zeros(len(item_ids) + 1, dtype=np.int64)
+        np.cumsum([len(passages_by_item[i]) for i in item_ids], out=offsets[1:])
+        return cls(encoder.encode(texts), offsets, item_ids, texts)
+
+    @property
+    def n_items(self):
+        return len(self.item_ids)
+
+    @property
+    def n_passages(self):
+        return len(self.embeddings)
+
+    def _block_topk(self, n_queries, block_scores, k, block_passages):
+        """Per-item top-``k`` from ``block_scores(lo, hi)``, one block of whole items at a time.
+
+        ``block_scores`` returns the ``(n_queries, hi - lo)`` scores of
+        passage rows ``lo:hi``. Memory stays at one block of scores plus the
+        bounded ``k`` values kept per item.
+        """
+        out = np.full((n_queries, self.n_items, k), -np.inf)
+        start = 0
+        while start < self.n_items:
+            # Largest run of items whose passages fit in one block (at least one item).
+            stop = int(np.searchsorted(self.offsets, self.offsets[start] + block_passages, side="right")) - 1
+            stop = min(max(stop, start + 1), self.n_items)
+            lo, hi = self.offsets[start], self.offsets[stop]
+            out[:, start:stop] = segmented_topk_values(block_scores(lo, hi), self.offsets[start:stop + 1] - lo, k)
+            start = stop
+        return out
+
+    def block_scores(self, query_vecs, lo, hi):
+        """``(n_queries, hi - lo)`` scores of passage rows ``lo:hi``."""
+        return query_vecs @ np.asarray(self.embeddings[lo:hi], dtype=np.float32).T
+
+    def topk_values(self, query_vecs, k=3, block_passages=BLOCK_PASSAGES):
+        """``(n_queries, n_items, k)`` top passage scores per item."""
+        query_vecs = np.atleast_2d(np.asarray(query_vecs, dtype=np.float32))
+        return self._block_topk(len(query_vecs), lambda lo, hi: self.block_scores(query_vecs, lo, hi), k,
+                                block_passages)
+
+    def sparse_topk_values(self, sparse, k=3, block_passages=BLOCK_PASSAGES):
+        """``topk_values`` for sparse per-query passage scores.
+
+        ``sparse`` holds one ``(rows, scores)`` pair per query, rows
+        ascending (``BM25Index.sparse_score``). Unlisted passages score 0.
+        """
+        def block_scores(lo, hi):
+            out = np.zeros((len(sparse), hi - lo), dtype=np.float32)
+            for q, (rows, scores) in enumerate(sparse):
+                a, b = np.searchsorted(rows, (lo, hi))
+                out[q, rows[a:b] - lo] = scores[a:b]
+            return out
+
+        return self._block_topk(len(sparse), block_scores, k, block_passages)
+
+    def top_passages(self, query_vecs, n, block_passages=BLOCK_PASSAGES):
+        """Best ``n`` passages per query as ``(rows, scores)`` pairs, in one pass over blocks.
+
+        Only ``n`` candidates per query are kept between blocks.
+        """
+        query_vecs = np.atleast_2d(np.asarray(query_vecs, dtype=np.float32))
+        best_rows = np.empty((len(query_vecs), 0), dtype=np.int64)
+        best = np.empty((len(query_vecs), 0), dtype=np.float32)
+        for lo in range(0, self.n_passages, block_passages):
+            hi = min(lo + block_passages, self.n_passages)
+            scores = np.concatenate([best, self.block_scores(query_vecs, lo, hi)], axis=1)
+            rows = np.concatenate([best_rows, np.broadcast_to(np.arange(lo, hi), (len(query_vecs), hi - lo))], axis=1)
+            if scores.shape[1] > n:
+                keep = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+                scores = np.take_along_axis(scores, keep, axis=1)
+                rows = np.take_along_axis(rows, keep, axis=1)
+            best, best_rows = scores, rows
+        return list(zip(best_rows, best))
+
+    def item_scores(self, query_vecs, k=3):
+        """``(n_queries, n_items)`` late-fusion scores: mean of top-``k`` passages."""
+        sums, counts = topk_sums(self.topk_values(query_vecs, k))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return sums / counts
+
+
+class PipelineResult:
+    """Reformulations and item rankings of one query for several methods."""
+
+    def __init__(self, query, methods, texts, scores, item_ids):
+        self.query = query
+        self.methods = list(methods)
+        self.texts = texts                       # method -> reformulated text
+        self.scores = scores                     # (n_methods, n_items)
+        self.order = np.argsort(-scores, axis=1, kind="stable")
+        self.item_ids = item_ids
+
+    def ranking(self, method, n=None):
+        """``[(rank, item_id, score), ...]`` for ``method``, best first."""
+        row = self.methods.index(method)
+        order = self.order[row] if n is None else self.order[row][:n]
+        return [(r + 1, self.item_ids[i], float(self.scores[row, i])) for r, i in enumerate(order)]
+
+    def rank_of(self, method, item_id):
+        """1-based rank of ``item_id`` under ``method``."""
+        row = self.methods.index(method)
+        position = self.item_ids.index(item_id)
+        return int(np.flatnonzero(self.order[row] == position)[0]) + 1
+
+
+class EQRPipeline:
+    """Reformulate a query with each method and rank items against one index."""
+
+    def __init__(self, index, encoder, reformulator, k=3, lexical=None):
+        self.index = index
+        self.encoder = encoder
+        self.reformulator = reformulator
+        self.k = k
+        self.lexical = lexical    # BM25Index over index.texts, for bm25/hybrid
+
+    def run(self, query, methods=METHODS, fusion="single", retrieval="dense"):
+        """Reformulate ``query`` with every method and rank items.
+
+        With a ``fusion`` other than ``"single"``, each EQR subtopic becomes
+        its own query vector and the subtopic scores are fused. Either way,
+        all query vectors of all methods go through one batched scoring pass.
+        """
+        return self.run_many([query], methods, fusion, retrieval)[0]
+
+    def run_many(self, queries, methods=METHODS, fusion="single", retrieval="dense", texts=None):
+        """``run`` for many queries, scored together in one batched pass.
+
+        ``retrieval`` picks the passage scores: dense dot products, BM25, or
+        reciprocal rank fusion of both. The item-level top-k aggregation is
+        the same for all three. ``texts`` are reformulations already
+        obtained from ``reformulator.reformulate_many``; they are requested
+        here when omitted.
+        """
+        all_texts = texts if texts is not None else self.reformulator.reformulate_many(queries, methods)
+        rows, spans = [], []
+        for texts in all_texts:
+            for method in methods:
+                parts = parse_subtopics(texts[method]) if method == "eqr" and fusion != "single" else [texts[method]]
+                spans.append(slice(len(rows), len(rows) + len(parts)))
+                rows.extend(parts)
+        top = self.passage_topk(rows, retrieval)
+        results = []
+        for q, (query, texts) in enumerate(zip(queries, all_texts)):
+            scores = np.stack([
+                fuse(top[spans[q * len(methods) + m]], fusion if method == "eqr" else "single")
+                for m, method in enumerate(methods)
+            ])
+            results.append(PipelineResult(query, methods, texts, scores, self.index.item_ids))
+        return results
+
+    def passage_topk(self, rows, retrieval="dense"):
+        """``(len(rows), n_items, k)`` top passage scores per item."""
+        if retrieval == "dense":
+            return self.index.topk_values(self.encoder.encode(rows), self.k)
+        if self.lexical is None:
+            raise ValueError(f"{retrieval!r} retrieval needs a BM25 index (lexical=...)")
+        sparse = [self.lexical.sparse_score(text) for text in rows]
+        if retrieval == "hybrid":
+            dense = self.index.top_passages(self.encoder.encode(rows), RRF_DEPTH)
+            sparse = [reciprocal_rank_fusion(d, s) for d, s in zip(dense, sparse)]
+        return self.index.sparse_topk_values(sparse, self.k)
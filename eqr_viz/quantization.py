@@ -0,0 +1,191 @@
+"""Quantized passage embeddings with exact rescoring of the top candidates.
+
+``QuantizedPassageIndex`` keeps a compact copy of the passage matrix in RAM:
+
+- ``int8``: one signed byte per dimension plus a float32 scale per passage,
+  so a 256-d passage takes 260 bytes instead of 1 KiB.
+- ``binary``: one sign bit per dimension (``np.packbits``), 32 bytes per
+  256-d passage. The query stays in float (asymmetric scoring), which
+  recalls much more than Hamming distance on binarised queries.
+
+The float embeddings stay on disk: the index requires a memory-mapped
+``.npy`` matrix (``save_embeddings`` writes one) and only ever reads the
+rows it rescores.
+
+Scoring runs in two passes per query. The first pass scores every passage
+against the quantized codes, one block at a time, and keeps each query's
+``rescore`` best passages. The second pass gathers just those rows from the
+float matrix and scores them exactly. Per-item top-k aggregation then runs
+on the exact scores of the rescored passages. Passages that missed the cut
+count at the lowest rescored score.
+
+Run ``python eqr_viz/quantization.py`` for memory, latency and recall
+numbers on a synthetic corpus.
+"""
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from pipeline import BLOCK_PASSAGES, PassageIndex
+from topk import segmented_topk_values
+
+QUANTIZATIONS = ("int8", "binary")
+
+
+def quantize_int8(x):
+    """Symmetric per-row int8 codes and float32 scales (``x ≈ codes * scale``)."""
+    x = np.asarray(x, dtype=np.float32)
+    scales = np.abs(x).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(x / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def quantize_binary(x):
+    """Sign bits of ``x`` packed eight dimensions per byte."""
+    return np.packbits(np.asarray(x) > 0, axis=1)
+
+
+def save_embeddings(path, embeddings, block_rows=BLOCK_PASSAGES):
+    """Write ``embeddings`` to a float32 ``.npy`` file and return it memory-mapped."""
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=embeddings.shape)
+    for start in range(0, len(embeddings), block_rows):
+        out[start:start + block_rows] = embeddings[start:start + block_rows]
+    out.flush()
+    del out
+    return np.load(path, mmap_mode="r")
+
+
+class QuantizedPassageIndex(PassageIndex):
+    """``PassageIndex`` whose first-pass scores come from quantized codes."""
+
+    def __init__(self, embeddings, offsets, item_ids, texts=None, kind="int8", rescore=4096):
+        if kind not in QUANTIZATIONS:
+            raise ValueError(f"unknown quantization {kind!r}; choose from {QUANTIZATIONS}")
+        if not isinstance(embeddings, np.memmap):
+            raise ValueError("QuantizedPassageIndex needs memory-mapped float embeddings (see save_embeddings)")
+        super().__init__(embeddings, offsets, item_ids, texts)
+        self.kind = kind
+        self.rescore = rescore
+        self.dim = embeddings.shape[1]
+        parts, scales = [], []
+        for start in range(0, self.n_passages, BLOCK_PASSAGES):
+            block = np.asarray(embeddings[start:start + BLOCK_PASSAGES], dtype=np.float32)
+            if kind == "int8":
+                codes, s = quantize_int8(block)
+                scales.append(s)
+            else:
+                codes = quantize_binary(block)
+            parts.append(codes)
+        width = self.dim if kind == "int8" else -(-self.dim // 8)
+        self.codes = np.concatenate(parts) if parts else np.empty((0, width), np.int8 if kind == "int8" else np.uint8)
+        self.scales = np.concatenate(scales) if scales else None
+
+    @classmethod
+    def from_index(cls, index, path, kind="int8", rescore=4096):
+        """Quantize ``index``; its float embeddings are written to ``path`` and memory-mapped."""
+        embeddings = index.embeddings
+        if not isinstance(embeddings, np.memmap):
+            embeddings = save_embeddings(path, embeddings)
+        return cls(embeddings, index.offsets, index.item_ids, index.texts, kind, rescore)
+
+    @property
+    def nbytes(self):
+        """Bytes held in RAM for first-pass scoring (codes, scales, offsets)."""
+        scales = 0 if self.scales is None else self.scales.nbytes
+        return self.codes.nbytes + scales + self.offsets.nbytes
+
+    def block_scores(self, query_vecs, lo, hi):
+        """First-pass ``(n_queries, hi - lo)`` scores from the codes of rows ``lo:hi``."""
+        if self.kind == "int8":
+            return (query_vecs @ self.codes[lo:hi].astype(np.float32).T) * self.scales[lo:hi]
+        # q . (2 * bits - 1) == 2 * (q . bits) - sum(q)
+        bits = np.unpackbits(self.codes[lo:hi], axis=1, count=self.dim).astype(np.float32)
+        return 2.0 * (query_vecs @ bits.T) - query_vecs.sum(axis=1, keepdims=True)
+
+    def topk_values(self, query_vecs, k=3, block_passages=BLOCK_PASSAGES):
+        """``(n_queries, n_items, k)`` exact top passage scores among each query's candidates.
+
+        The candidates are the query's own ``rescore`` best first-pass
+        passages (``top_passages``); only those float rows are read.
+        """
+        query_vecs = np.atleast_2d(np.asarray(query_vecs, dtype=np.float32))
+        out = np.full((len(query_vecs), self.n_items, k), -np.inf)
+        # Slots an item would fill if all of its passages were rescored.
+        slots = np.arange(k) < np.minimum(np.diff(self.offsets), k)[:, None]
+        for q, (rows, _) in enumerate(self.top_passages(query_vecs, self.rescore, block_passages)):
+            rows = np.sort(rows)
+            exact = np.asarray(self.embeddings[rows], dtype=np.float32) @ query_vecs[q]
+            top = segmented_topk_values(exact, np.searchsorted(rows, self.offsets), k)[0]
+            # Passages that missed the cut scored about as low as the weakest
+            # candidate, at best. Counting them at that score keeps an item
+            # with one lucky candidate from averaging over that one alone.
+            if len(exact):
+                top[slots & np.isneginf(top)] = exact.min()
+            out[q] = top
+        return out
+
+
+def synthetic_index(n_items=5000, passages_per_item=20, dim=256, n_topics=128, seed=0):
+    """Random clustered passage corpus shaped like a chunked WikiVoyage dump."""
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(passages_per_item, n_items) + 1
+    offsets = np.zeros(n_items + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    topics = rng.standard_normal((n_topics, dim)).astype(np.float32)
+    emb = topics[np.repeat(rng.integers(n_topics, size=n_items), counts)]
+    emb += 0.8 * rng.standard_normal(emb.shape).astype(np.float32)
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+    return PassageIndex(emb, offsets, list(range(n_items)))
+
+
+def benchmark(index, queries, directory, kinds=QUANTIZATIONS, rescores=(256, 1024, 4096), k=3, top_n=10):
+    """RAM, latency and item recall@top_n of each quantization vs in-RAM float32.
+
+    The float embeddings are written once under ``directory`` and
+    memory-mapped for the quantized indexes.
+    """
+    t0 = time.perf_counter()
+    truth = np.argsort(-index.item_scores(queries, k), axis=1)[:, :top_n]
+    rows = [{"mode": "float32", "rescore": None, "mbytes": index.embeddings.nbytes / 2**20,
+             "latency_ms": 1000 * (time.perf_counter() - t0) / len(queries), f"recall@{top_n}": 1.0}]
+    embeddings = save_embeddings(os.path.join(directory, "embeddings.npy"), index.embeddings)
+    for kind in kinds:
+        quantized = QuantizedPassageIndex(embeddings, index.offsets, index.item_ids, kind=kind)
+        for rescore in rescores:
+            quantized.rescore = rescore
+            t0 = time.perf_counter()
+            scores = quantized.item_scores(queries, k)
+            latency = 1000 * (time.perf_counter() - t0) / len(queries)
+            got = np.argsort(-np.nan_to_num(scores, nan=-np.inf), axis=1)[:, :top_n]
+            recall = np.mean([len(set(a) & set(b)) / top_n for a, b in zip(truth.tolist(), got.tolist())])
+            rows.append({"mode": kind, "rescore": rescore, "mbytes": quantized.nbytes / 2**20,
+                         "latency_ms": latency, f"recall@{top_n}": float(recall)})
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Quantized vs float32 passage scoring benchmark")
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--passages-per-item", type=int, default=20)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=32)
+    parser.add_argument("--top-n", type=int, default=10)
+    args = parser.parse_args()
+
+    index = synthetic_index(args.items, args.passages_per_item, args.dim)
+    rng = np.random.default_rng(1)
+    queries = index.embeddings[rng.choice(index.n_passages, args.queries)]
+    queries = queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    print(f"{index.n_passages} passages x {args.dim} dims, {args.queries} queries per batch")
+    with tempfile.TemporaryDirectory() as directory:
+        results = benchmark(index, queries, directory, top_n=args.top_n)
+    for row in results:
+        rescore = "-" if row["rescore"] is None else row["rescore"]
+        print(f"{row['mode']:>7}  rescore={rescore:>5}  {row['mbytes']:8.1f} MiB  {row['latency_ms']:8.2f} ms/query  "
+              f"recall@{args.top_n}={row[f'recall@{args.top_n}']:.3f}")
@@ -0,0 +1,143 @@
+"""LLM query reformulation: Q2E, Q2D and EQR.
+
+Each method is a prompt template sent to an LLM client with a
+``complete(prompt) -> str`` method. ``StubLLM`` answers offline. It
+recognises which template a prompt came from, returns the paper's
+reformulations for the demo queries and builds a deterministic
+reformulation from a small subtopic lexicon for anything else. Give
+``Reformulator`` a ``ReformulationCache`` and it asks the LLM only once per
+(method, prompt version, model, normalized query).
+"""
+import re
+
+METHODS = ("q2e", "q2d", "eqr")
+METHOD_LABELS = {"q2e": "Q2E", "q2d": "Q2D", "eqr": "EQR"}
+
+# Bump when a template changes so cached reformulations are not reused.
+PROMPT_VERSION = 1
+PROMPTS = {
+    "q2e": (
+        "Expand the following recommendation query into a list of related keywords "
+        "and phrases separated by semicolons.\nQuery: {query}\nKeywords:"
+    ),
+    "q2d": (
+        "Write a short passage describing an item that perfectly answers the "
+        "following recommendation query.\nQuery: {query}\nPassage:"
+    ),
+    "eqr": (
+        "List the distinct subtopics a user with the following recommendation query "
+        "may care about. For each subtopic, write one sentence elaborating on what "
+        "makes an item satisfy it. Format: '<n>. <Subtopic>: <elaboration>'.\n"
+        "Query: {query}\nSubtopics:"
+    ),
+}
+
+# Subtopic lexicon for the stub: trigger words -> (subtopic, elaboration).
+SUBTOPICS = [
+    (("youth", "young", "student", "graduation", "party"), "Night life",
+     "Cities with live music venues, bars, clubs and night markets."),
+    (("youth", "young", "student", "budget", "cheap", "backpack", "graduation"), "Budget hotels",
+     "Cities with hostels and budget-friendly lodging options."),
+    (("youth", "young", "adventure", "active", "outdoor", "graduation"), "Outdoor activities",
+     "Cities with hiking and biking trails, beaches and adventure sports."),
+    (("culture", "cultural", "history", "museum", "art", "graduation"), "Cultural hotspots",
+     "Cities rich in museums, history and historic sites."),
+    (("beach", "sun", "summer", "graduation"), "Beach destinations",
+     "Cities with vibrant beach scenes suitable for young travellers."),
+    (("relax", "quiet", "peaceful", "calm", "retreat"), "Relaxation",
+     "Cities with quiet inns, gardens and calm lakes for a peaceful stay."),
+    (("food", "eat", "cuisine", "foodie"), "Food scene",
+     "Cities with street food, markets and cheap eats."),
+]
+
+
+class StubLLM:
+    """Offline stand-in for the reformulation LLM."""
+
+    model_id = "stub-reformulator-v1"
+
+    def __init__(self, canned=None):
+        # {query: {method: text}}, e.g. the paper's examples.
+        self.canned = canned or {}
+        self._patterns = {
+            method: re.compile(re.escape(template).replace(re.escape("{query}"), "(?P<query>.*)"), re.DOTALL)
+            for method, template in PROMPTS.items()
+        }
+        self.calls = 0
+
+    def complete(self, prompt):
+        self.calls += 1
+        for method, pattern in self._patterns.items():
+            match = pattern.fullmatch(prompt)
+            if match:
+                return self._reformulate(method, match.group("query"))
+        raise ValueError("StubLLM only understands the reformulation prompts")
+
+    def _reformulate(self, method, query):
+        if query in self.canned:
+            return self.canned[query][method]
+        words = set(re.findall(r"[a-z]+", query.lower()))
+        topics = [
+            (name, text) for triggers, name, text in SUBTOPICS
+            if any(w.startswith(t) for w in words for t in triggers)
+        ]
+        if not topics:
+            topics = [(w.capitalize(), f"Cities known for {w}.") for w in sorted(words) if len(w) > 3][:3]
+        if not topics:
+            topics = [(query.strip().capitalize() or "Anything", f"Cities for {query.strip() or 'any trip'}.")]
+        if method == "q2e":
+            return "; ".join([name for name, _ in topics] + [query])
+        if method == "q2d":
+            name, text = topics[0]
+            return f"A great choice for {query.lower()}: {text} {name} is what most visitors come for."
+        return "\n".join(f"{i}. {name}: {text}" for i, (name, text) in enumerate(topics, 1))
+
+
+class Reformulator:
+    """Builds the method prompt and asks ``llm`` for the reformulation."""
+
+    def __init__(self, llm, cache=None):
+        self.llm = llm
+        self.cache = cache
+
+    @property
+    def model_id(self):
+        return self.llm.model_id
+
+    def prompt(self, method, query):
+        return PROMPTS[method].format(query=query)
+
+    def reformulate(self, method, query):
+        if self.cache is not None:
+            text = self.cache.get(method, self.model_id, query)
+            if text is not None:
+                return text
+        text = self.llm.complete(self.prompt(method, query)).strip()
+        if self.cache is not None:
+            self.cache.put(method, self.model_id, query, text)
+        return text
+
+    def reformulate_many(self, queries, methods=METHODS):
+        """``{method: text}`` for every query, in order.
+
+        Cache misses are sent together through ``llm.complete_many`` when the
+        client has one (``AsyncLLMClient``), otherwise one after another.
+        """
+        complete_many = getattr(self.llm, "complete_many", None)
+        if complete_many is None:
+            return [{method: self.reformulate(method, query) for method in methods} for query in queries]
+        texts = [{} for _ in queries]
+        if self.cache is not None:
+            for q, query in enumerate(queries):
+                for method in methods:
+                    text = self.cache.get(method, self.model_id, query)
+                    if text is not None:
+                        texts[q][method] = text
+        missing = [(q, method) for q in range(len(queries)) for method in methods if method not in texts[q]]
+        if missing:
+            prompts = [self.prompt(method, queries[q]) for q, method in missing]
+            for (q, method), text in zip(missing, complete_many(prompts)):
+                texts[q][method] = text.strip()
+                if self.cache is not None:
+                    self.cache.put(method, self.model_id, queries[q], texts[q][method])
+        return [{method: t[method] for method in methods} for t in texts]
@@ -0,0 +1,116 @@
+"""Persistent, content-addressed cache of LLM reformulations.
+
+An entry's key is the SHA-256 of ``(method, PROMPT_VERSION, model_id,
+normalized query)``. Bumping the prompt version or switching models
+therefore never returns a stale text. Entries live in one SQLite table. They
+survive app restarts and evaluation reruns, and any number of processes can
+share them. When the stored texts exceed ``max_bytes``, the least recently
+used entries are deleted. All calls on a ``ReformulationCache`` share one
+connection and one lock, so Streamlit session threads can use the same
+instance.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from encoder import normalize_query
+from reformulation import PROMPT_VERSION
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "reformulations.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reformulations (
+    key TEXT PRIMARY KEY,
+    method TEXT NOT NULL,
+    model_id TEXT NOT NULL,
+    query TEXT NOT NULL,
+    text TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reformulations_last_used ON reformulations (last_used);
+"""
+
+
+def cache_key(method, model_id, query, prompt_version=PROMPT_VERSION):
+    payload = json.dumps([method, prompt_version, model_id, normalize_query(query)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ReformulationCache:
+    """SQLite-backed LRU cache bounded by the total size of stored texts."""
+
+    def __init__(self, path=":memory:", max_bytes=64 << 20, clock=time.time):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.executescript(SCHEMA)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM reformulations").fetchone()[0]
+
+    def get(self, method, model_id, query):
+        """Cached text or ``None`` (counts a hit or a miss)."""
+        key = cache_key(method, model_id, query)
+        with self._lock:
+            row = self._db.execute("SELECT text FROM reformulations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE reformulations SET last_used = ? WHERE key = ?", (self._clock(), key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, method, model_id, query, text):
+        key = cache_key(method, model_id, query)
+        size = len(text.encode("utf-8"))
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO reformulations VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, method, model_id, normalize_query(query), text, size, self._clock()),
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM reformulations").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Walk entries oldest first and drop them until the rest fits.
+        doomed = []
+        for key, size in self._db.execute("SELECT key, size FROM reformulations ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM reformulations WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM reformulations")
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM reformulations"
+            ).fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
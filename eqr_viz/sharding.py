@@ -0,0 +1,172 @@
+"""City-sharded retrieval with concurrent shard scoring.
+
+NLRec corpora are partitioned by city (nor/phi, nyc/chicago/london/montreal),
+so each city partition gets its own ``PassageIndex`` shard. A query scores
+the shards it needs on a thread pool, which gives real parallelism because
+NumPy matrix products release the GIL. Each shard returns its own top-n
+items in descending score order. ``heapq.merge`` combines those sorted lists
+lazily, and the first n merged entries are the global top-n.
+
+``ShardedIndex`` also has the ``PassageIndex`` scoring interface
+(``topk_values``, ``sparse_topk_values``, ``top_passages``, ``item_scores``)
+over the concatenation of its shards: items and passage rows are numbered
+shard by shard. Each call fans out to the shards on the same pool, so
+``EQRPipeline`` runs on a ``ShardedIndex`` unchanged. The app serves
+converted NLRec datasets this way. Item ids must be unique across shards.
+
+Run ``python eqr_viz/sharding.py`` to measure speedup against worker count
+on synthetic shards. With OpenBLAS or MKL, set ``OMP_NUM_THREADS=1`` so
+that the BLAS library does not already spread each matmul over all cores.
+"""
+import heapq
+import itertools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from pipeline import BLOCK_PASSAGES, PassageIndex
+from topk import topk_sums
+
+
+class ShardedIndex:
+    """``{shard name: PassageIndex}`` searched concurrently."""
+
+    def __init__(self, shards, max_workers=None):
+        self.shards = dict(shards)
+        self.max_workers = max_workers or min(len(self.shards), os.cpu_count() or 1) or 1
+        self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="shard")
+        indexes = list(self.shards.values())
+        self.item_ids = [item_id for index in indexes for item_id in index.item_ids]
+        if len(set(self.item_ids)) != len(self.item_ids):
+            raise ValueError("item ids must be unique across shards")
+        self._bases = np.zeros(len(indexes) + 1, dtype=np.int64)
+        np.cumsum([index.n_passages for index in indexes], out=self._bases[1:])
+        self.texts = None
+        if all(index.texts is not None for index in indexes):
+            self.texts = [text for index in indexes for text in index.texts]
+
+    @classmethod
+    def from_store(cls, store, dataset, encoder, cities=None, max_workers=None):
+        """One shard per city partition of an ``NLRecStore`` dataset, items keyed by id."""
+        cities = cities or store.cities(dataset)
+        return cls({c: PassageIndex.from_passages(store.passages_by_item(dataset, c), encoder) for c in cities},
+                   max_workers)
+
+    @property
+    def n_items(self):
+        return len(self.item_ids)
+
+    @property
+    def n_passages(self):
+        return int(self._bases[-1])
+
+    def _map(self, fn):
+        """``[fn(shard, first global passage row), ...]`` run on the pool, in shard order."""
+        futures = [self._pool.submit(fn, index, int(base)) for index, base in zip(self.shards.values(), self._bases)]
+        return [f.result() for f in futures]
+
+    def topk_values(self, query_vecs, k=3, block_passages=BLOCK_PASSAGES):
+        """``(n_queries, n_items, k)`` top passage scores per item, shards scored concurrently."""
+        query_vecs = np.atleast_2d(np.asarray(query_vecs, dtype=np.float32))
+        parts = self._map(lambda index, base: index.topk_values(query_vecs, k, block_passages))
+        return np.concatenate(parts, axis=1)
+
+    def sparse_topk_values(self, sparse, k=3, block_passages=BLOCK_PASSAGES):
+        """``topk_values`` for sparse ``(rows, scores)`` pairs over global passage rows."""
+        def shard_topk(index, base):
+            local = []
+            for rows, scores in sparse:
+                a, b = np.searchsorted(rows, (base, base + index.n_passages))
+                local.append((rows[a:b] - base, scores[a:b]))
+            return index.sparse_topk_values(local, k, block_passages)
+
+        return np.concatenate(self._map(shard_topk), axis=1)
+
+    def top_passages(self, query_vecs, n, block_passages=BLOCK_PASSAGES):
+        """Best ``n`` global passage rows per query, merged from each shard's best ``n``."""
+        query_vecs = np.atleast_2d(np.asarray(query_vecs, dtype=np.float32))
+        per_shard = self._map(lambda index, base: [(rows + base, scores) for rows, scores in
+                                                   index.top_passages(query_vecs, n, block_passages)])
+        out = []
+        for q in range(len(query_vecs)):
+            rows = np.concatenate([hits[q][0] for hits in per_shard])
+            scores = np.concatenate([hits[q][1] for hits in per_shard])
+            if len(scores) > n:
+                keep = np.argpartition(-scores, n - 1)[:n]
+                rows, scores = rows[keep], scores[keep]
+            out.append((rows, scores))
+        return out
+
+    def item_scores(self, query_vecs, k=3):
+        """``(n_queries, n_items)`` late-fusion scores: mean of top-``k`` passages."""
+        sums, counts = topk_sums(self.topk_values(query_vecs, k))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return sums / counts
+
+    def _shard_top(self, name, query_vecs, n, k):
+        index = self.shards[name]
+        scores = np.nan_to_num(index.item_scores(query_vecs, k), nan=-np.inf)
+        n = min(n, index.n_items)
+        top = np.argpartition(-scores, n - 1, axis=1)[:, :n] if n else np.empty((len(scores), 0), np.int64)
+        out = []
+        for row, cand in zip(scores, top):
+            cand = cand[np.argsort(-row[cand], kind="stable")]
+            out.append([(float(row[i]), name, index.item_ids[i]) for i in cand])
+        return out
+
+    def search(self, query_vecs, n=10, shards=None, k=3):
+        """Top-``n`` ``(score, shard, item_id)`` per query over ``shards`` (all by default)."""
+        query_vecs = np.atleast_2d(np.asarray(query_vecs, dtype=np.float32))
+        names = list(shards or self.shards)
+        futures = [self._pool.submit(self._shard_top, name, query_vecs, n, k) for name in names]
+        per_shard = [f.result() for f in futures]
+        return [
+            list(itertools.islice(heapq.merge(*(lists[q] for lists in per_shard), key=lambda hit: -hit[0]), n))
+            for q in range(len(query_vecs))
+        ]
+
+    def close(self):
+        self._pool.shutdown()
+
+
+def benchmark(shards, queries, workers=(1, 2, 4, 8), repeats=3, n=10):
+    """Mean latency and speedup of ``search`` per worker count."""
+    rows, base = [], None
+    for w in workers:
+        index = ShardedIndex(shards, max_workers=w)
+        index.search(queries[:1], n)  # warm up the pool
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            index.search(queries, n)
+        latency = 1000 * (time.perf_counter() - t0) / repeats
+        index.close()
+        base = base or latency
+        rows.append({"workers": w, "latency_ms": latency, "speedup": base / latency})
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from quantization import synthetic_index
+
+    parser = argparse.ArgumentParser(description="Sharded retrieval speedup vs worker count")
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--items", type=int, default=2000, help="items per shard")
+    parser.add_argument("--passages-per-item", type=int, default=20)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=16)
+    args = parser.parse_args()
+
+    shards = {}
+    for i in range(args.shards):
+        index = synthetic_index(args.items, args.passages_per_item, args.dim, seed=i)
+        shards[f"city{i}"] = PassageIndex(index.embeddings, index.offsets, [f"city{i}/{j}" for j in index.item_ids])
+    queries = next(iter(shards.values())).embeddings[:args.queries]
+    cores = os.cpu_count() or 1
+    workers = sorted({1, *[w for w in (2, 4, 8, 16) if w <= max(cores, 2)], min(cores, args.shards)})
+    print(f"{args.shards} shards x {next(iter(shards.values())).n_passages} passages, {cores} cores")
+    for row in benchmark(shards, queries, workers):
+        print(f"workers={row['workers']:>2}  {row['latency_ms']:8.1f} ms  speedup {row['speedup']:.2f}x")
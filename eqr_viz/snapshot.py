@@ -0,0 +1,170 @@
+"""Precomputed EQR rankings for the demo.
+
+    python snapshot.py                          # demo queries -> data/demo_snapshot.npz
+    python snapshot.py --queries queries.txt --out data/snapshot.npz
+
+``precompute`` reformulates every query once and scores the reformulations
+under every fusion mode. The LLM backend options are those of
+``evaluate.py`` (``--llm-url``, ``--llm-model``, ``--cache``); without a URL
+the offline stub answers. The snapshot is one ``.npz`` file of plain arrays
+and no pickles:
+
+    queries   (Q,)            query strings
+    methods   (M,)            method names
+    fusions   (F,)            fusion modes
+    item_ids  (I,)            item names
+    texts     (Q, M)          reformulation per query and method
+    top_items (Q, F, M, D)    item positions, best first (-1 past the end)
+    top_scores(Q, F, M, D)    float32 scores aligned with top_items
+    model_id, prompt_version  the reformulation model and prompts
+    corpus                    ``corpus_fingerprint`` of the index
+
+``Snapshot.get(query, fusion)`` returns an object with the ``ranking`` /
+``rank_of`` / ``texts`` / ``item_ids`` interface of ``PipelineResult``, so
+the app renders precomputed and live results the same way. Queries are
+matched after ``normalize_query``, like the caches. Items ranked below depth
+``D`` have no stored rank. ``Snapshot.matches`` tells whether the rankings
+still hold for a pipeline: another model, prompt version or corpus makes the
+snapshot stale.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from encoder import normalize_query
+from reformulation import METHODS, PROMPT_VERSION
+from subtopics import FUSION_MODES
+
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), "data", "demo_snapshot.npz")
+
+
+def corpus_fingerprint(index):
+    """SHA-256 over the item ids, passage offsets and passage texts of ``index``."""
+    payload = json.dumps([index.item_ids, np.asarray(index.offsets).tolist(), list(index.texts or [])])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def precompute(pipeline, queries, fusions=FUSION_MODES, methods=METHODS, depth=100):
+    """Snapshot arrays for ``queries`` under every fusion mode."""
+    n_items = pipeline.index.n_items
+    depth = min(depth, n_items)
+    top_items = np.full((len(queries), len(fusions), len(methods), depth), -1, dtype=np.int32)
+    top_scores = np.full(top_items.shape, np.nan, dtype=np.float32)
+    all_texts = pipeline.reformulator.reformulate_many(queries, methods)
+    for f, fusion in enumerate(fusions):
+        results = pipeline.run_many(queries, methods, fusion, texts=all_texts)
+        for q, result in enumerate(results):
+            order = result.order[:, :depth]
+            top_items[q, f] = order
+            top_scores[q, f] = np.take_along_axis(result.scores, order, axis=1)
+    return {
+        "queries": np.array(queries, dtype=str),
+        "methods": np.array(methods, dtype=str),
+        "fusions": np.array(fusions, dtype=str),
+        "item_ids": np.array(pipeline.index.item_ids, dtype=str),
+        "texts": np.array([[t[m] for m in methods] for t in all_texts], dtype=str).reshape(len(queries), len(methods)),
+        "top_items": top_items,
+        "top_scores": top_scores,
+        "model_id": np.array(pipeline.reformulator.model_id, dtype=str),
+        "prompt_version": np.array(PROMPT_VERSION),
+        "corpus": np.array(corpus_fingerprint(pipeline.index), dtype=str),
+    }
+
+
+def write_snapshot(path, arrays):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.savez_compressed(path, **arrays)
+
+
+class SnapshotResult:
+    """One precomputed (query, fusion) entry, shaped like ``PipelineResult``."""
+
+    def __init__(self, query, methods, texts, items, scores, item_ids):
+        self.query = query
+        self.methods = methods
+        self.texts = texts
+        self.item_ids = item_ids
+        self._items = items          # (n_methods, depth)
+        self._scores = scores
+
+    def ranking(self, method, n=None):
+        row = self.methods.index(method)
+        items = self._items[row] if n is None else self._items[row][:n]
+        return [(r + 1, self.item_ids[i], float(self._scores[row, r])) for r, i in enumerate(items) if i >= 0]
+
+    def rank_of(self, method, item_id):
+        """1-based rank of ``item_id``, or None when it is below the stored depth."""
+        row = self.methods.index(method)
+        hit = np.flatnonzero(self._items[row] == self.item_ids.index(item_id))
+        return int(hit[0]) + 1 if len(hit) else None
+
+
+class Snapshot:
+    """Read-only view of a snapshot file, loaded fully into memory once."""
+
+    def __init__(self, arrays):
+        self.queries = {normalize_query(q): i for i, q in enumerate(arrays["queries"].tolist())}
+        self.methods = arrays["methods"].tolist()
+        self.fusions = {f: i for i, f in enumerate(arrays["fusions"].tolist())}
+        self.item_ids = arrays["item_ids"].tolist()
+        self.texts = arrays["texts"]
+        self.top_items = arrays["top_items"]
+        self.top_scores = arrays["top_scores"]
+        # Files written before these were recorded never match.
+        self.model_id = arrays["model_id"].item() if "model_id" in arrays else None
+        self.prompt_version = arrays["prompt_version"].item() if "prompt_version" in arrays else None
+        self.corpus = arrays["corpus"].item() if "corpus" in arrays else None
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls({key: data[key] for key in data.files})
+
+    def matches(self, pipeline):
+        """Whether the snapshot was built with ``pipeline``'s model, prompts and corpus."""
+        return (self.model_id == pipeline.reformulator.model_id and self.prompt_version == PROMPT_VERSION
+                and self.corpus == corpus_fingerprint(pipeline.index))
+
+    def __contains__(self, query):
+        return normalize_query(query) in self.queries
+
+    def get(self, query, fusion):
+        """``SnapshotResult`` or None when the pair was not precomputed."""
+        q, f = self.queries.get(normalize_query(query)), self.fusions.get(fusion)
+        if q is None or f is None:
+            return None
+        texts = dict(zip(self.methods, self.texts[q].tolist()))
+        return SnapshotResult(query, self.methods, texts, self.top_items[q, f], self.top_scores[q, f], self.item_ids)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from demo_data import CANNED_REFORMULATIONS, PASSAGES
+    from encoder import HashingEncoder
+    from llm_client import add_llm_arguments, client_from_args
+    from pipeline import EQRPipeline, PassageIndex
+    from reformulation import Reformulator, StubLLM
+    from reformulation_cache import DEFAULT_PATH as CACHE_PATH, ReformulationCache
+
+    parser = argparse.ArgumentParser(description="Precompute EQR demo rankings into a snapshot file.")
+    parser.add_argument("--queries", help="text file with one query per line (default: the demo queries)")
+    parser.add_argument("--depth", type=int, default=100, help="ranked items stored per method")
+    parser.add_argument("--out", default=DEFAULT_PATH)
+    parser.add_argument("--cache", default=CACHE_PATH, help="reformulation cache (SQLite)")
+    add_llm_arguments(parser)
+    args = parser.parse_args()
+
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = list(CANNED_REFORMULATIONS)
+    encoder = HashingEncoder()
+    reformulator = Reformulator(client_from_args(args, StubLLM(CANNED_REFORMULATIONS)), ReformulationCache(args.cache))
+    pipeline = EQRPipeline(PassageIndex.from_passages(PASSAGES, encoder), encoder, reformulator)
+    write_snapshot(args.out, precompute(pipeline, queries, depth=args.depth))
+    print(f"wrote {len(queries)} queries x {len(FUSION_MODES)} fusion modes to {args.out} "
+          f"({os.path.getsize(args.out):,} bytes)")
@@ -0,0 +1,47 @@
+"""Multi-vector scoring of EQR subtopics.
+
+EQR reformulations are numbered lists ("1. Night life: ...", "2. Budget
+hotels: ..."). Each subtopic is encoded as its own query vector, so all
+subtopics are scored against the passages in one ``(subtopics x passages)``
+matrix product. Their per-item scores are then fused into one ranking.
+"""
+import re
+
+import numpy as np
+
+from topk import topk_sums
+
+FUSION_MODES = ("single", "mean", "max", "sum_topk")
+FUSION_LABELS = {
+    "single": "Single vector (whole text)",
+    "mean": "Mean over subtopics",
+    "max": "Max over subtopics",
+    "sum_topk": "Sum of top-k per subtopic",
+}
+
+_ITEM_RE = re.compile(r"^\s*\d+[.)]\s*(.+?)\s*$")
+
+
+def parse_subtopics(text):
+    """Numbered list entries of an EQR reformulation (whole text if none)."""
+    items = [m.group(1) for m in map(_ITEM_RE.match, text.splitlines()) if m]
+    return items or [text]
+
+
+def fuse(top, mode):
+    """Fuse ``(n_subtopics, n_items, k)`` top-k passage scores into item scores.
+
+    ``mean``/``max`` combine the per-subtopic top-k means; ``sum_topk`` adds
+    up the top-k passage scores of every subtopic. Items with no passage
+    score NaN.
+    """
+    sums, counts = topk_sums(top)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if mode == "sum_topk":
+            return np.where(counts.sum(axis=0) > 0, sums.sum(axis=0), np.nan)
+        means = sums / counts
+    if mode == "max":
+        return means.max(axis=0)
+    if mode in ("mean", "single"):
+        return means.mean(axis=0)
+    raise ValueError(f"unknown fusion mode {mode!r}; choose from {FUSION_MODES}")
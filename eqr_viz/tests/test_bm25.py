@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from bm25 import BM25Index, reciprocal_rank_fusion
+from encoder import HashingEncoder
+from pipeline import PassageIndex
+from topk import segmented_topk_values
+
+WORDS = "beach museum night market street food hiking temple jazz river castle wine".split()
+
+
+def _corpus(n_items=40, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        f"item{i}": [" ".join(rng.choice(WORDS, rng.integers(3, 9))) for _ in range(rng.integers(1, 6))]
+        for i in range(n_items)
+    }
+
+
+def _ranks(scores):
+    order = np.lexsort((np.arange(len(scores)), -scores))
+    out = np.empty(len(scores), dtype=np.int64)
+    out[order] = np.arange(1, len(scores) + 1)
+    return out
+
+
+def test_sparse_score_matches_dense_score():
+    bm25 = BM25Index.from_texts(["night market food", "street food food", "quiet beach", ""])
+    rows, scores = bm25.sparse_score("street food, food market")
+    assert rows.tolist() == [0, 1]
+    dense = bm25.score("street food, food market")
+    np.testing.assert_array_equal(dense[rows], scores)
+    assert (dense[[2, 3]] == 0).all()
+    assert bm25.sparse_score("unknown words")[0].size == 0
+
+
+def test_reciprocal_rank_fusion():
+    dense = (np.array([0, 1, 2, 3]), np.array([0.1, 0.9, 0.5, 0.5], dtype=np.float32))
+    lexical = (np.array([3]), np.array([2.0], dtype=np.float32))
+    rows, scores = reciprocal_rank_fusion(dense, lexical, k=60)
+    assert rows.tolist() == [0, 1, 2, 3]
+    # Dense ranks: 1 -> 1, 2 -> 2 (tie goes to the lower row), 3 -> 3, 0 -> 4.
+    np.testing.assert_allclose(scores, [1 / 64, 1 / 61, 1 / 62, 1 / 63 + 1 / 61], rtol=1e-6)
+    rows, scores = reciprocal_rank_fusion(dense, lexical, k=60, depth=1)
+    assert rows.tolist() == [1, 3]
+    np.testing.assert_allclose(scores, [1 / 61, 1 / 61], rtol=1e-6)
+
+
+@pytest.mark.parametrize("block_passages", [1, 7, 1 << 18])
+def test_blockwise_scores_match_full_matrices(block_passages):
+    encoder = HashingEncoder()
+    index = PassageIndex.from_passages(_corpus(), encoder)
+    bm25 = BM25Index.from_texts(index.texts)
+    queries = ["street food night market", "castle wine", "jazz"]
+    query_vecs = encoder.encode(queries)
+
+    lexical = np.stack([bm25.score(q) for q in queries])
+    sparse = [bm25.sparse_score(q) for q in queries]
+    np.testing.assert_array_equal(
+        index.sparse_topk_values(sparse, 3, block_passages), segmented_topk_values(lexical, index.offsets, 3)
+    )
+
+    dense = query_vecs @ index.embeddings.T
+    top = index.top_passages(query_vecs, index.n_passages, block_passages)
+    fused = []
+    for q in range(len(queries)):
+        rows, scores = top[q]
+        assert sorted(rows.tolist()) == list(range(index.n_passages))
+        np.testing.assert_allclose(scores, dense[q, rows], rtol=1e-6)
+        full = 1.0 / (60 + _ranks(dense[q])) + np.where(lexical[q] > 0, 1.0 / (60 + _ranks(lexical[q])), 0.0)
+        fused.append(reciprocal_rank_fusion(top[q], sparse[q]))
+        np.testing.assert_array_equal(fused[-1][0], np.arange(index.n_passages))
+        np.testing.assert_allclose(fused[-1][1], full, rtol=1e-6)
+
+    n = 5
+    for (rows, scores), row in zip(index.top_passages(query_vecs, n, block_passages), dense):
+        np.testing.assert_allclose(np.sort(scores)[::-1], np.sort(row)[::-1][:n], rtol=1e-6)
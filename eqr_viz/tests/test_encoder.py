@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from encoder import CachedEncoder, EmbeddingCache, HashingEncoder, normalize_query
+
+
+class CountingEncoder(HashingEncoder):
+    def __init__(self):
+        super().__init__(dim=32)
+        self.seen = []
+
+    def encode(self, texts):
+        self.seen.extend([texts] if isinstance(texts, str) else texts)
+        return super().encode(texts)
+
+
+def test_cached_encoder_uses_the_cache_normalizer():
+    encoder = CountingEncoder()
+    cached = CachedEncoder(encoder, EmbeddingCache(normalize=lambda text: normalize_query(text).rstrip("?!.")))
+    vecs = cached.encode(["Quiet beach towns?", "quiet  beach towns", "QUIET beach towns!"])
+    assert encoder.seen == ["quiet beach towns"]
+    np.testing.assert_array_equal(vecs[0], vecs[2])
+    cached.encode("Quiet beach towns.")
+    assert encoder.seen == ["quiet beach towns"]
+    assert (cached.cache.stats()["hits"], cached.cache.stats()["misses"]) == (1, 3)
+
+
+def test_embedding_cache_evicts_least_recently_used_by_bytes():
+    vec = np.ones(32, dtype=np.float32)  # 128 bytes
+    cache = EmbeddingCache(max_bytes=3 * vec.nbytes)
+    for text in ["a", "b", "c"]:
+        cache.put("m", text, vec)
+    assert cache.get("m", "A") is not None  # "a" is now the most recent
+    cache.put("m", "d", vec)
+    assert [cache.get("m", t) is not None for t in "abcd"] == [True, False, True, True]
+    assert cache.stats()["bytes"] == 3 * vec.nbytes
+    # Replacing an entry frees its old bytes first.
+    cache.put("m", "d", np.ones(64, dtype=np.float32))
+    assert cache.stats()["bytes"] <= cache.max_bytes and cache.get("m", "d").shape == (64,)
+    cache.put("m", "huge", np.ones(200, dtype=np.float32))
+    assert len(cache) == 0 and cache.stats()["bytes"] == 0
+
+
+def test_embedding_cache_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "queries.npz")
+    cache = EmbeddingCache(path=path)
+    encoder = HashingEncoder(dim=32)
+    cache.put(encoder.model_id, "Quiet beach towns", encoder.encode("quiet beach towns")[0])
+    cache.put("other-model", "ﬁne dining", np.arange(4, dtype=np.float32))
+    cache.put(encoder.model_id, "street food", encoder.encode("street food")[0])
+    cache.save()
+
+    loaded = EmbeddingCache(path=path)
+    assert len(loaded) == 3
+    np.testing.assert_array_equal(loaded.get(encoder.model_id, "QUIET beach towns "),
+                                  encoder.encode("quiet beach towns")[0])
+    np.testing.assert_array_equal(loaded.get("other-model", "fine dining"), np.arange(4))
+    assert loaded.get("other-model", "street food") is None
+    # Recency order survives across models: the oldest entry goes first.
+    cache.get(encoder.model_id, "quiet beach towns")
+    cache.save()
+    loaded = EmbeddingCache(max_bytes=EmbeddingCache(path=path).stats()["bytes"], path=path)
+    loaded.put("other-model", "new", np.zeros(1, dtype=np.float32))
+    assert loaded.get("other-model", "fine dining") is None
+    assert loaded.get(encoder.model_id, "street food") is not None
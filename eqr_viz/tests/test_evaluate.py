@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from demo_data import CANNED_REFORMULATIONS
+from encoder import HashingEncoder
+from evaluate import (average_precision, compute_metrics, demo_partitions, evaluate, ndcg_at_k, recall_at_k,
+                      summarize)
+from reformulation import METHODS, Reformulator, StubLLM
+
+
+def test_ndcg_binary():
+    # Relevant at ranks 1 and 3, two relevant items in total.
+    gains = np.array([1.0, 0.0, 1.0, 0.0])
+    dcg = 1.0 + 1.0 / np.log2(4)
+    idcg = 1.0 + 1.0 / np.log2(3)
+    assert ndcg_at_k(gains, np.array([1.0, 1.0]), 3) == pytest.approx(dcg / idcg)  # 0.9197
+    assert ndcg_at_k(gains, np.array([1.0, 1.0]), 1) == pytest.approx(1.0)
+
+
+def test_ndcg_graded():
+    gains = np.array([0.0, 2.0, 1.0])
+    assert ndcg_at_k(gains, np.array([2.0, 1.0]), 2) == pytest.approx((2 / np.log2(3)) / (2 + 1 / np.log2(3)))
+
+
+def test_ndcg_without_relevant_items():
+    assert ndcg_at_k(np.zeros(3), np.array([]), 3) == 0.0
+
+
+def test_recall():
+    hits = np.array([True, False, True, False])
+    assert recall_at_k(hits, 2, 1) == 0.5
+    assert recall_at_k(hits, 2, 3) == 1.0
+    assert recall_at_k(hits, 4, 10) == 0.5
+    assert recall_at_k(hits, 0, 3) == 0.0
+
+
+def test_average_precision():
+    assert average_precision(np.array([True, False, True, False]), 2) == pytest.approx((1 + 2 / 3) / 2)
+    # One of two relevant items is never ranked.
+    assert average_precision(np.array([True, False, False]), 2) == pytest.approx(0.5)
+    assert average_precision(np.array([False, False, True]), 1) == pytest.approx(1 / 3)
+    assert average_precision(np.array([False, False]), 0) == 0.0
+
+
+def test_compute_metrics_process_pool_matches_serial():
+    rng = np.random.default_rng(0)
+    jobs = []
+    for _ in range(200):
+        gains = rng.integers(0, 3, 20).astype(float)
+        jobs.append((gains, np.sort(gains[gains > 0])[::-1]))
+    serial = compute_metrics(jobs, 10, workers=1)
+    pooled = compute_metrics(jobs, 10, workers=2)
+    assert len(pooled) == len(jobs)
+    np.testing.assert_allclose(pooled, serial)
+    gains, label_gains = jobs[0]
+    hits = gains > 0
+    assert serial[0] == pytest.approx((
+        ndcg_at_k(gains, label_gains, 10),
+        recall_at_k(hits, len(label_gains), 10),
+        average_precision(hits, len(label_gains)),
+    ))
+
+
+def test_evaluate_demo():
+    reformulator = Reformulator(StubLLM(CANNED_REFORMULATIONS))
+    rows, stages = evaluate(demo_partitions(), reformulator, HashingEncoder(), k=5, workers=1)
+    n_queries = len(next(demo_partitions())[2])
+    assert len(rows) == n_queries * len(METHODS)
+    assert set(stages) == {"load", "index", "reformulate", "retrieve", "metrics"}
+    summary = summarize(rows, 5)
+    assert list(summary) == list(METHODS)
+    for metrics in summary.values():
+        assert all(0.0 <= value <= 1.0 for value in metrics.values())
+
+
+def test_evaluate_reformulates_each_query_once():
+    llm = StubLLM(CANNED_REFORMULATIONS)
+    rows, _ = evaluate(demo_partitions(), Reformulator(llm), HashingEncoder(), workers=1)
+    assert llm.calls == len(rows)
@@ -0,0 +1,126 @@
+import threading
+import time
+
+import pytest
+
+from llm_client import HTTPLLM, AsyncLLMClient, LLMError, serve_stub
+from reformulation import METHODS, PROMPTS, Reformulator, StubLLM
+
+
+class SlowEcho:
+    """Echoes the prompt after ``delay`` seconds and tracks peak concurrency."""
+
+    model_id = "echo"
+
+    def __init__(self, delay=0.1):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def complete(self, prompt):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.delay)
+            if prompt.startswith("fail"):
+                raise ValueError("bad prompt")
+            return prompt.upper()
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+@pytest.fixture
+def endpoint():
+    servers = []
+
+    def start(llm, delay=0.0):
+        server = serve_stub(llm, delay=delay)
+        servers.append(server)
+        return HTTPLLM(f"http://127.0.0.1:{server.server_address[1]}", llm.model_id)
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_complete_many_against_mock_server(endpoint):
+    client = AsyncLLMClient(endpoint(StubLLM()), max_concurrency=4)
+    prompts = [PROMPTS[m].format(query="Cities for a beach holiday") for m in METHODS]
+    assert client.complete_many(prompts) == [StubLLM().complete(p) for p in prompts]
+    assert client.requests == len(prompts)
+
+
+def test_identical_prompts_in_flight_share_one_request(endpoint):
+    llm = SlowEcho(delay=0.2)
+    client = AsyncLLMClient(endpoint(llm), max_concurrency=4)
+    assert client.complete_many(["a", "a", "b", "a"]) == ["A", "A", "B", "A"]
+    assert llm.calls == 2
+    assert client.requests == 2
+    assert client.coalesced == 2
+    # Nothing stays registered once the requests are done.
+    assert client.complete("a") == "A"
+    assert llm.calls == 3
+
+
+def test_concurrency_is_limited(endpoint):
+    llm = SlowEcho(delay=0.1)
+    client = AsyncLLMClient(endpoint(llm), max_concurrency=2)
+    start = time.perf_counter()
+    assert client.complete_many([f"p{i}" for i in range(6)]) == [f"P{i}" for i in range(6)]
+    elapsed = time.perf_counter() - start
+    assert llm.peak == 2
+    assert elapsed >= 0.3  # three waves of two
+
+
+def test_requests_run_concurrently(endpoint):
+    llm = SlowEcho(delay=0.3)
+    client = AsyncLLMClient(endpoint(llm), max_concurrency=4)
+    start = time.perf_counter()
+    client.complete_many(["x", "y", "z"])
+    assert time.perf_counter() - start < 0.8
+    assert llm.peak == 3
+
+
+def test_server_errors_propagate(endpoint):
+    llm = SlowEcho(delay=0.1)
+    client = AsyncLLMClient(endpoint(llm), max_concurrency=4)
+    with pytest.raises(LLMError, match="400"):
+        client.complete("fail once")
+    # Every waiter on a coalesced failing request sees the error.
+    with pytest.raises(LLMError):
+        client.complete_many(["fail twice", "fail twice", "ok"])
+    assert llm.calls == 3
+    assert client.complete("ok") == "OK"
+
+
+def test_timeout(endpoint):
+    client = AsyncLLMClient(endpoint(SlowEcho(delay=0.0), delay=0.5), timeout=0.1)
+    with pytest.raises(TimeoutError):
+        client.complete("slow")
+
+
+def test_timed_out_requests_keep_their_slot_until_the_thread_returns():
+    llm = SlowEcho(delay=0.4)
+    client = AsyncLLMClient(llm, max_concurrency=2, timeout=0.1)
+    with pytest.raises(TimeoutError):
+        client.complete_many(["a", "b"])
+    # Both threads are still running, so these wait for free slots.
+    client.timeout = 5.0
+    assert client.complete_many(["c", "d", "e"]) == ["C", "D", "E"]
+    assert llm.peak == 2
+
+
+def test_reformulator_fans_out_through_client(endpoint):
+    stub = StubLLM()
+    client = AsyncLLMClient(endpoint(stub, delay=0.2), max_concurrency=8)
+    start = time.perf_counter()
+    texts = Reformulator(client).reformulate_many(["Cities for street food", "Cities for night life"])
+    assert time.perf_counter() - start < 0.6  # six prompts, one round trip
+    assert [set(t) for t in texts] == [set(METHODS)] * 2
+    assert texts[0]["q2e"] == StubLLM().complete(PROMPTS["q2e"].format(query="Cities for street food"))
@@ -0,0 +1,35 @@
+import json
+import os
+
+from nlrec import NLRecStore, convert
+
+
+def _write_jsonl(path, rows):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+
+
+def test_items_sharing_a_name_stay_separate(tmp_path):
+    raw = tmp_path / "raw" / "yelp"
+    _write_jsonl(str(raw / "queries.jsonl"), [{"query_id": 1, "query": "cheap coffee"}])
+    _write_jsonl(str(raw / "labels.jsonl"), [{"query_id": 1, "item_id": "b2"}])
+    _write_jsonl(str(raw / "corpus" / "phi.jsonl"), [
+        {"item_id": "b1", "name": "Chain Cafe", "text": "Good coffee."},
+        {"item_id": "b2", "name": "Chain Cafe", "passages": ["Cheap coffee.", "Friendly staff."]},
+        {"item_id": "a1", "name": "Diner", "text": "Pancakes."},
+    ])
+    convert(str(tmp_path / "raw"), str(tmp_path / "nlrec"))
+    store = NLRecStore(str(tmp_path / "nlrec"))
+
+    assert store.cities("yelp") == ["phi"]
+    assert store.passages_by_item("yelp", "phi") == {
+        "a1": ["Pancakes."],
+        "b1": ["Good coffee."],
+        "b2": ["Cheap coffee.", "Friendly staff."],
+    }
+    assert store.item_names("yelp", "phi") == {"a1": "Diner", "b1": "Chain Cafe", "b2": "Chain Cafe"}
+    assert store.n_items("yelp", "phi") == 3
+    assert store.queries("yelp") == [("1", "cheap coffee")]
+    assert store.labels("yelp") == {"1": {"b2": 1}}
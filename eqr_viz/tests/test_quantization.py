@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from quantization import QuantizedPassageIndex, quantize_int8, synthetic_index
+
+
+@pytest.fixture
+def index():
+    return synthetic_index(n_items=60, passages_per_item=5, dim=32, n_topics=4)
+
+
+@pytest.fixture
+def queries(index):
+    rng = np.random.default_rng(3)
+    return index.embeddings[rng.choice(index.n_passages, 4)] + 0.1
+
+
+def test_requires_memory_mapped_embeddings(index):
+    with pytest.raises(ValueError, match="memory-mapped"):
+        QuantizedPassageIndex(index.embeddings, index.offsets, index.item_ids)
+
+
+def test_from_index_memory_maps_floats(index, tmp_path):
+    quantized = QuantizedPassageIndex.from_index(index, str(tmp_path / "e.npy"), "int8")
+    assert isinstance(quantized.embeddings, np.memmap)
+    np.testing.assert_array_equal(quantized.embeddings, index.embeddings)
+    assert quantized.nbytes < index.embeddings.nbytes / 3
+
+
+def test_int8_roundtrip():
+    x = np.random.default_rng(0).standard_normal((10, 16)).astype(np.float32)
+    codes, scales = quantize_int8(x)
+    np.testing.assert_allclose(codes * scales[:, None], x, atol=float(scales.max()) / 2 + 1e-6)
+
+
+@pytest.mark.parametrize("kind", ["int8", "binary"])
+@pytest.mark.parametrize("block_passages", [7, 1 << 18])
+def test_full_rescore_is_exact(index, queries, tmp_path, kind, block_passages):
+    quantized = QuantizedPassageIndex.from_index(index, str(tmp_path / "e.npy"), kind, rescore=index.n_passages)
+    np.testing.assert_allclose(
+        quantized.topk_values(queries, 3, block_passages), index.topk_values(queries, 3), rtol=1e-5
+    )
+
+
+@pytest.mark.parametrize("kind", ["int8", "binary"])
+def test_each_query_rescores_its_own_candidates(index, queries, tmp_path, kind):
+    quantized = QuantizedPassageIndex.from_index(index, str(tmp_path / "e.npy"), kind, rescore=20)
+    approx = quantized.block_scores(queries.astype(np.float32), 0, index.n_passages)
+    exact = index.embeddings @ queries.T.astype(np.float32)
+    blocked = quantized.topk_values(queries, 3, block_passages=11)
+    np.testing.assert_allclose(blocked, quantized.topk_values(queries, 3), rtol=1e-6)
+    for q in range(len(queries)):
+        candidates = np.argsort(-approx[q], kind="stable")[:20]
+        kept = np.isin(np.arange(index.n_passages), candidates)
+        floor = exact[candidates, q].min()
+        for item in range(index.n_items):
+            rows = np.arange(index.offsets[item], index.offsets[item + 1])
+            scores = np.sort(exact[rows[kept[rows]], q])[::-1][:3]
+            missing = min(3, len(rows)) - len(scores)
+            expected = np.concatenate([scores, [floor] * missing, [-np.inf] * (3 - len(scores) - missing)])
+            np.testing.assert_allclose(blocked[q, item], expected, rtol=1e-5)
@@ -0,0 +1,53 @@
+import pytest
+
+from reformulation import PROMPT_VERSION
+from reformulation_cache import ReformulationCache, cache_key
+
+
+@pytest.fixture
+def clock():
+    now = [0.0]
+
+    def tick():
+        now[0] += 1.0
+        return now[0]
+    return tick
+
+
+def test_spelling_variants_share_one_entry():
+    cache = ReformulationCache()
+    cache.put("q2e", "m", "Cheap  Sushi near\tthe station ", "text")
+    for query in ("cheap sushi near the station", "CHEAP SUSHI NEAR THE STATION", "Ｃｈｅａｐ sushi near the station"):
+        assert cache.get("q2e", "m", query) == "text"
+    assert len(cache) == 1
+    assert cache.stats()["hits"] == 3
+
+
+def test_method_model_and_prompt_version_are_part_of_the_key():
+    cache = ReformulationCache()
+    cache.put("q2e", "m", "sushi", "text")
+    assert cache.get("q2d", "m", "sushi") is None
+    assert cache.get("q2e", "other", "sushi") is None
+    assert cache_key("q2e", "m", "sushi") != cache_key("q2e", "m", "sushi", prompt_version=PROMPT_VERSION + 1)
+    assert cache.stats()["misses"] == 2
+
+
+def test_least_recently_used_entries_are_evicted_by_size(clock):
+    cache = ReformulationCache(max_bytes=30, clock=clock)
+    for query in ("a", "b", "c"):
+        cache.put("q2e", "m", query, "x" * 10)
+    assert cache.stats()["bytes"] == 30 and cache.evictions == 0
+    assert cache.get("q2e", "m", "a") == "x" * 10  # "b" is now the oldest
+    cache.put("q2e", "m", "d", "é" * 5)  # 10 bytes in UTF-8
+    assert cache.get("q2e", "m", "b") is None
+    assert [cache.get("q2e", "m", q) is not None for q in ("a", "c", "d")] == [True, True, True]
+    # One large text pushes out as many old entries as it needs.
+    cache.put("q2e", "m", "e", "y" * 25)
+    stats = cache.stats()
+    assert stats["entries"] == 1 and stats["bytes"] == 25 and stats["evictions"] == 4
+
+
+def test_entries_survive_reopening(tmp_path):
+    path = str(tmp_path / "cache" / "reformulations.sqlite")
+    ReformulationCache(path).put("q2e", "m", "sushi", "text")
+    assert ReformulationCache(path).get("q2e", "m", " Sushi ") == "text"
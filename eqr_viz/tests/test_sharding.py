@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from bm25 import BM25Index
+from demo_data import CANNED_REFORMULATIONS, PASSAGES
+from encoder import HashingEncoder
+from nlrec import NLRecStore, convert
+from pipeline import RETRIEVAL_MODES, EQRPipeline, PassageIndex
+from reformulation import Reformulator, StubLLM
+from sharding import ShardedIndex
+from test_nlrec import _write_jsonl
+
+
+def _shards(encoder, n_shards=3):
+    names = list(PASSAGES)
+    return {f"shard{s}": PassageIndex.from_passages({i: PASSAGES[i] for i in names[s::n_shards]}, encoder)
+            for s in range(n_shards)}
+
+
+def _flat(shards):
+    return PassageIndex.from_passages(
+        {i: index.texts[index.offsets[j]:index.offsets[j + 1]] for index in shards.values()
+         for j, i in enumerate(index.item_ids)}, HashingEncoder())
+
+
+def test_sharded_scoring_matches_one_index():
+    encoder = HashingEncoder()
+    shards = _shards(encoder)
+    sharded, flat = ShardedIndex(shards, max_workers=2), _flat(shards)
+    assert sharded.item_ids == flat.item_ids and sharded.texts == flat.texts
+    queries = encoder.encode(list(CANNED_REFORMULATIONS))
+    np.testing.assert_allclose(sharded.topk_values(queries, 3, block_passages=4), flat.topk_values(queries, 3),
+                               atol=1e-6)
+    for (rows, _), (flat_rows, _) in zip(sharded.top_passages(queries, 5, 4), flat.top_passages(queries, 5)):
+        assert sorted(rows.tolist()) == sorted(flat_rows.tolist())
+    sparse = [BM25Index.from_texts(flat.texts).sparse_score(q) for q in CANNED_REFORMULATIONS]
+    np.testing.assert_allclose(sharded.sparse_topk_values(sparse, 3, 4), flat.sparse_topk_values(sparse, 3),
+                               atol=1e-6)
+    sharded.close()
+
+
+@pytest.mark.parametrize("retrieval", RETRIEVAL_MODES)
+def test_pipeline_runs_on_a_sharded_index(retrieval):
+    encoder = HashingEncoder()
+    shards = _shards(encoder)
+    reformulator = Reformulator(StubLLM(CANNED_REFORMULATIONS))
+    results = []
+    for index in (ShardedIndex(shards), _flat(shards)):
+        pipeline = EQRPipeline(index, encoder, reformulator, lexical=BM25Index.from_texts(index.texts))
+        results.append(pipeline.run_many(list(CANNED_REFORMULATIONS), retrieval=retrieval, fusion="mean"))
+    for sharded, flat in zip(*results):
+        np.testing.assert_allclose(sharded.scores, flat.scores, rtol=1e-5)
+        assert [item for _, item, _ in sharded.ranking("eqr", 5)] == [item for _, item, _ in flat.ranking("eqr", 5)]
+
+
+def test_from_store_keys_items_by_id(tmp_path):
+    raw = tmp_path / "raw" / "yelp"
+    _write_jsonl(str(raw / "queries.jsonl"), [{"query_id": 1, "query": "cheap coffee"}])
+    _write_jsonl(str(raw / "labels.jsonl"), [{"query_id": 1, "item_id": "b2"}])
+    _write_jsonl(str(raw / "corpus" / "phi.jsonl"), [
+        {"item_id": "b1", "name": "Chain Cafe", "text": "Good coffee."},
+        {"item_id": "b2", "name": "Chain Cafe", "text": "Cheap coffee."},
+    ])
+    _write_jsonl(str(raw / "corpus" / "nor.jsonl"), [{"item_id": "c1", "name": "Chain Cafe", "text": "Beignets."}])
+    convert(str(tmp_path / "raw"), str(tmp_path / "nlrec"))
+
+    index = ShardedIndex.from_store(NLRecStore(str(tmp_path / "nlrec")), "yelp", HashingEncoder())
+    assert list(index.shards) == ["nor", "phi"]
+    assert index.item_ids == ["c1", "b1", "b2"]
+    hits = index.search(HashingEncoder().encode("cheap coffee"), n=1)
+    assert hits[0][0][1:] == ("phi", "b2")
+
+
+def test_item_ids_must_be_unique_across_shards():
+    encoder = HashingEncoder()
+    shard = PassageIndex.from_passages({"a": ["x"]}, encoder)
+    with pytest.raises(ValueError, match="unique"):
+        ShardedIndex({"one": shard, "two": shard})
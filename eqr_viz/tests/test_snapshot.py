@@ -0,0 +1,59 @@
+import numpy as np
+
+from demo_data import CANNED_REFORMULATIONS, PASSAGES
+from encoder import HashingEncoder
+from pipeline import EQRPipeline, PassageIndex
+from reformulation import METHODS, Reformulator, StubLLM
+from snapshot import Snapshot, precompute, write_snapshot
+from subtopics import FUSION_MODES
+
+
+def test_snapshot_matches_live_pipeline(tmp_path):
+    llm = StubLLM(CANNED_REFORMULATIONS)
+    encoder = HashingEncoder()
+    pipeline = EQRPipeline(PassageIndex.from_passages(PASSAGES, encoder), encoder, Reformulator(llm))
+    queries = list(CANNED_REFORMULATIONS) + ["Cities with great street food"]
+
+    arrays = precompute(pipeline, queries, depth=5)
+    # One reformulation per (query, method), shared by all fusion modes.
+    assert llm.calls == len(queries) * len(METHODS)
+    path = str(tmp_path / "snapshot.npz")
+    write_snapshot(path, arrays)
+    snapshot = Snapshot.load(path)
+
+    assert queries[0] in snapshot and "unknown query" not in snapshot
+    assert snapshot.get("unknown query", "mean") is None
+    for fusion in FUSION_MODES:
+        live = pipeline.run_many(queries, fusion=fusion)
+        for query, result in zip(queries, live):
+            stored = snapshot.get(query, fusion)
+            assert stored.texts == result.texts
+            for method in METHODS:
+                expected = result.ranking(method, 5)
+                got = stored.ranking(method)
+                assert [item for _, item, _ in got] == [item for _, item, _ in expected]
+                np.testing.assert_allclose([s for *_, s in got], [s for *_, s in expected], rtol=1e-6)
+                assert stored.rank_of(method, expected[0][1]) == 1
+
+
+def test_snapshot_matches_only_its_model_prompts_and_corpus(tmp_path, monkeypatch):
+    encoder = HashingEncoder()
+    index = PassageIndex.from_passages(PASSAGES, encoder)
+    pipeline = EQRPipeline(index, encoder, Reformulator(StubLLM(CANNED_REFORMULATIONS)))
+    query = list(CANNED_REFORMULATIONS)[0]
+    path = str(tmp_path / "snapshot.npz")
+    write_snapshot(path, precompute(pipeline, [query], depth=3))
+    snapshot = Snapshot.load(path)
+
+    assert snapshot.matches(pipeline)
+    # Lookups are normalized like the caches.
+    assert f"  {query.upper()} " in snapshot
+    assert snapshot.get(f"  {query.upper()} ", "mean").texts == snapshot.get(query, "mean").texts
+
+    other_model = StubLLM(CANNED_REFORMULATIONS)
+    other_model.model_id = "gpt-4o-mini"
+    assert not snapshot.matches(EQRPipeline(index, encoder, Reformulator(other_model)))
+    smaller = PassageIndex.from_passages(dict(list(PASSAGES.items())[1:]), encoder)
+    assert not snapshot.matches(EQRPipeline(smaller, encoder, pipeline.reformulator))
+    monkeypatch.setattr("snapshot.PROMPT_VERSION", 2)
+    assert not snapshot.matches(pipeline)
@@ -0,0 +1,14 @@
+"""Segmented top-k of the EQR demo, from the shared ``common/topk.py``.
+
+The apps import their modules as top-level siblings (``streamlit run``
+puts only the app directory on ``sys.path``), so this module adds the
+repository root before importing the shared implementation.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+from common.topk import segmented_topk, segmented_topk_values, topk_sums
@@ -0,0 +1,176 @@
+"""IVF approximate review search for RA-Rec, with a recall/latency benchmark.
+
+A coarse quantizer (spherical k-means over the review embeddings) splits the
+reviews into inverted lists. A query probes the ``nprobe`` closest lists and
+scores only their reviews. The hard-constraint candidate set is applied as a
+pre-filter on the probed rows, so filtered-out restaurants are never scored.
+Small candidate sets fall back to exact scoring, which is cheaper than probing
+and loses nothing.
+
+Run ``python rarec_viz/ann.py`` to compare IVF against exact scoring on a
+synthetic corpus.
+"""
+import time
+
+import numpy as np
+
+from retrieval import SCORE_BLOCK_ROWS, ItemRanking, dot_rows, segmented_topk_mean, take_top
+
+# Candidate sets with at most this many reviews are scored exactly.
+EXACT_MAX_REVIEWS = 4096
+TRAIN_SAMPLE = 50000
+
+
+def _assign(x, centroids):
+    """Index of the closest centroid (by dot product) for each row of ``x``."""
+    out = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), SCORE_BLOCK_ROWS):
+        block = np.asarray(x[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+        out[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+def spherical_kmeans(x, n_clusters, n_iter=15, seed=0):
+    """Unit-norm centroids of ``x`` (rows assumed L2-normalised)."""
+    rng = np.random.default_rng(seed)
+    x = np.asarray(x, dtype=np.float32)
+    centroids = x[rng.choice(len(x), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = _assign(x, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=n_clusters)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        nonempty = counts > 0
+        sums = np.add.reduceat(x[order], starts[nonempty], axis=0)
+        centroids[nonempty] = sums
+        # Re-seed empty clusters with random rows.
+        n_empty = int((~nonempty).sum())
+        if n_empty:
+            centroids[~nonempty] = x[rng.choice(len(x), n_empty, replace=False)]
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        np.divide(centroids, norms, out=centroids, where=norms > 0)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index over the rows of a ``ReviewIndex``."""
+
+    def __init__(self, review_index, n_lists=None, n_iter=15, seed=0):
+        self.index = review_index
+        n = review_index.n_reviews
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(n)))
+        n_lists = min(n_lists, n)
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(n, min(n, TRAIN_SAMPLE), replace=False))
+        self.centroids = spherical_kmeans(review_index.embeddings[sample], n_lists, n_iter, seed)
+
+        assign = _assign(review_index.embeddings, self.centroids)
+        self.list_rows = np.argsort(assign, kind="stable")
+        self.list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=n_lists), out=self.list_offsets[1:])
+        self.row_item = np.repeat(np.arange(review_index.n_items), np.diff(review_index.offsets))
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def rank(self, query_vec, items=None, k=3, nprobe=8, exact_max_reviews=EXACT_MAX_REVIEWS):
+        """Like ``ReviewIndex.rank`` but only scores reviews in probed lists.
+
+        Items with no review in the probed lists are left out of the ranking.
+        """
+        index = self.index
+        if items is not None:
+            items = np.asarray(items, dtype=np.int64)
+            n_rows = int((index.offsets[items + 1] - index.offsets[items]).sum())
+            if n_rows <= exact_max_reviews:
+                return index.rank(query_vec, items, k)
+
+        query_vec = np.asarray(query_vec, dtype=np.float32)
+        probe = np.argsort(-(self.centroids @ query_vec))[:nprobe]
+        rows = np.concatenate([
+            self.list_rows[self.list_offsets[p]:self.list_offsets[p + 1]] for p in probe
+        ])
+        if items is not None:
+            allowed = np.zeros(index.n_items, dtype=bool)
+            allowed[items] = True
+            rows = rows[allowed[self.row_item[rows]]]
+        # Rows of one item are contiguous in the matrix, so sorting the probed
+        # rows groups them by item for the segmented top-k.
+        rows.sort()
+        scores = dot_rows(index.embeddings[rows], query_vec)
+        row_items = self.row_item[rows]
+        hit_items, starts = np.unique(row_items, return_index=True)
+        local = np.append(starts, len(rows)).astype(np.int64)
+        item_scores, top = segmented_topk_mean(scores, local, k)
+        top_rows = take_top(rows, top, -1)
+        order = np.argsort(-item_scores, kind="stable")
+        return ItemRanking(hit_items[order], item_scores[order], top_rows[order], rows, scores)
+
+
+def synthetic_index(n_items=20000, reviews_per_item=25, dim=128, n_topics=256, seed=0):
+    """Random clustered review corpus shaped like a large city."""
+    from retrieval import ReviewIndex
+
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(reviews_per_item, n_items) + 1
+    offsets = np.zeros(n_items + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    topics = rng.standard_normal((n_topics, dim)).astype(np.float32)
+    item_topic = rng.integers(n_topics, size=n_items)
+    emb = topics[np.repeat(item_topic, counts)]
+    emb += 0.8 * rng.standard_normal(emb.shape).astype(np.float32)
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+    return ReviewIndex(emb, offsets, list(range(n_items)))
+
+
+def benchmark(index, ivf, queries, k=3, top_n=10, nprobes=(1, 4, 8, 16, 32), candidate_fraction=0.3, seed=0):
+    """Recall@top_n of IVF item rankings against exact scoring, with latencies.
+
+    Each query is run with a random pre-filter keeping ``candidate_fraction``
+    of the items, as a hard-constraint filter would. Returns one dict per
+    mode with mean latency in milliseconds and mean recall.
+    """
+    rng = np.random.default_rng(seed)
+    filters = [
+        np.sort(rng.choice(index.n_items, int(index.n_items * candidate_fraction), replace=False))
+        for _ in queries
+    ]
+    exact, t0 = [], time.perf_counter()
+    for q, items in zip(queries, filters):
+        exact.append(set(index.rank(q, items, k).items[:top_n].tolist()))
+    results = [{"mode": "exact", "nprobe": None,
+                "latency_ms": 1000 * (time.perf_counter() - t0) / len(queries), f"recall@{top_n}": 1.0}]
+    for nprobe in nprobes:
+        recalls, t0 = [], time.perf_counter()
+        for q, items, truth in zip(queries, filters, exact):
+            got = ivf.rank(q, items, k, nprobe=nprobe, exact_max_reviews=0).items[:top_n]
+            recalls.append(len(truth & set(got.tolist())) / len(truth))
+        results.append({"mode": "ivf", "nprobe": nprobe,
+                        "latency_ms": 1000 * (time.perf_counter() - t0) / len(queries),
+                        f"recall@{top_n}": float(np.mean(recalls))})
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="IVF vs exact review scoring benchmark")
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--reviews-per-item", type=int, default=25)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-n", type=int, default=10)
+    args = parser.parse_args()
+
+    index = synthetic_index(args.items, args.reviews_per_item, args.dim)
+    t0 = time.perf_counter()
+    ivf = IVFIndex(index, args.lists)
+    print(f"{index.n_reviews} reviews, {ivf.n_lists} lists, built in {time.perf_counter() - t0:.1f}s")
+    queries = index.embeddings[np.random.default_rng(1).choice(index.n_reviews, args.queries)]
+    for row in benchmark(index, ivf, queries, top_n=args.top_n):
+        nprobe = "-" if row["nprobe"] is None else row["nprobe"]
+        print(f"{row['mode']:>5}  nprobe={nprobe:>3}  {row['latency_ms']:8.2f} ms  "
+              f"recall@{args.top_n}={row[f'recall@{args.top_n}']:.3f}")
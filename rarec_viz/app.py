@@ -1,6 +1,40 @@
 import streamlit as st
 import pandas as pd
 import time
+import os
+
+import numpy as np
+
+from ann import EXACT_MAX_REVIEWS, IVFIndex
+from attributes import AttributeStore, answer, parse_question
+from context_packing import N_PERMUTATIONS, minhash_signatures, pack_context
+from demo_data import ATTRIBUTES, DEMO_STATE, KNOWN_LOCATIONS, RESTAURANTS, REVIEWS
+from dialogue import RetrievalSession, StateTracker, empty_state, parse_feedback, state_delta
+from embedding_store import open_store
+from encoder import CachedEncoder, EmbeddingCache, HashingEncoder
+from generation import TimedStream, get_backend
+from geo import GridIndex, geocode
+from metadata_index import BitmapIndex
+from result_cache import ResultCache
+from retrieval import ReviewIndex, state_to_query
+from segments import SegmentedIndex, SegmentView
+
+TOP_K = 3
+CONTEXT_BUDGET_TOKENS = 60
+SEARCH_RADIUS_KM = 2.0
+# Directory written by `python rarec_viz/embedding_store.py <dir>`; when unset
+# the demo corpus is encoded in memory at startup.
+STORE_DIR = os.environ.get("RAREC_STORE_DIR")
+# Segmented index directory (`python rarec_viz/segments.py init <dir> <store>`).
+# It takes precedence over RAREC_STORE_DIR. Delta segments added by other
+# processes show up within REFRESH_SECONDS, and this process compacts the
+# index once COMPACT_AT segments pile up.
+SEGMENTS_DIR = os.environ.get("RAREC_SEGMENTS_DIR")
+REFRESH_SECONDS = 2.0
+COMPACT_AT = 4
+# Optional .npz file keeping query embeddings across server restarts.
+QUERY_CACHE_PATH = os.environ.get("RAREC_QUERY_CACHE")
+RESTAURANT_BY_NAME = {r["name"]: r for r in RESTAURANTS}
 
 # --- PAGE CONFIGURATION ---
 st.set_page_config(
@@ -109,6 +143,130 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# --- RETRIEVAL ENGINE (shared by every session of this server process) ---
+@st.cache_resource
+def load_engine():
+    encoder = HashingEncoder()
+    if SEGMENTS_DIR:
+        index = SegmentedIndex(SEGMENTS_DIR)
+        index.start_refresher(REFRESH_SECONDS, COMPACT_AT)
+    elif STORE_DIR:
+        index = open_store(STORE_DIR)
+    else:
+        index = ReviewIndex.from_reviews({r["name"]: REVIEWS[r["name"]] for r in RESTAURANTS}, encoder)
+    # Reviews are encoded above without the cache; queries go through it.
+    cache = EmbeddingCache(path=QUERY_CACHE_PATH)
+    if QUERY_CACHE_PATH:
+        cache.save_at_exit()
+    return CachedEncoder(encoder, cache), index
+
+@st.cache_resource
+def load_ann_index():
+    _, index = load_engine()
+    return IVFIndex(index)
+
+def restaurant(item_id):
+    """Demo metadata of ``item_id``; ids outside the demo set only have a name."""
+    return RESTAURANT_BY_NAME.get(item_id, {"name": item_id})
+
+@st.cache_resource(max_entries=4)
+def load_filters(generation, _item_ids):
+    """Metadata and location indexes over the items of one index generation.
+
+    Both follow the index's item order, so candidate positions from the
+    filter feed straight into review scoring. Items without demo metadata
+    match no hard constraint and no location.
+    """
+    records = [restaurant(item_id) for item_id in _item_ids]
+    metadata = BitmapIndex.from_records(records, ["cuisine_type", "dish_type"])
+    geo = GridIndex([r.get("lat", np.nan) for r in records], [r.get("lon", np.nan) for r in records], cell_km=1.0)
+    return metadata, geo
+
+def filters(view):
+    """``(BitmapIndex, GridIndex)`` for a snapshot of the engine's index."""
+    return load_filters(view.generation, view.item_ids)
+
+def filter_candidates(state, view):
+    """Location pre-filter (when the location is known) intersected with the hard constraints."""
+    metadata, geo = filters(view)
+    within = None
+    point = geocode(state.get("location"), KNOWN_LOCATIONS)
+    if point is not None:
+        within = metadata.bitset_of(geo.within_radius(point, SEARCH_RADIUS_KM))
+    return metadata.query(state["hard_constraints"], within)
+
+@st.cache_resource
+def load_signatures():
+    _, index = load_engine()
+    return minhash_signatures(index.texts)
+
+@st.cache_resource(max_entries=64)
+def load_segment_signatures(name, _texts):
+    # Segments never change, so their name is enough of a cache key.
+    return minhash_signatures(_texts)
+
+def review_signatures(index, rows):
+    """MinHash signatures of review ``rows`` of ``index`` (a snapshot)."""
+    if not isinstance(index, SegmentView):
+        return load_signatures()[rows]
+    out = np.empty((len(rows), N_PERMUTATIONS), dtype=np.uint32)
+    for seg, mine, local in index.split_rows(rows):
+        out[mine] = load_segment_signatures(seg.name, seg.index.texts)[local]
+    return out
+
+@st.cache_resource
+def load_attribute_store():
+    return AttributeStore.from_records(ATTRIBUTES)
+
+@st.cache_resource
+def load_result_cache():
+    return ResultCache(max_entries=1024, ttl=600)
+
+@st.cache_resource
+def load_backend():
+    return get_backend()
+
+def generation_request(index, ranking, item, state, alternatives=(), preamble="", budget=CONTEXT_BUDGET_TOKENS,
+                       question=""):
+    """Grounding for the LLM: the item's metadata plus its reviews packed into ``budget`` tokens.
+
+    ``index`` is the snapshot ``ranking`` was computed on.
+    """
+    name = index.item_ids[item]
+    mine = index.item_of_rows(ranking.rows) == item
+    rows = ranking.rows[mine]
+    texts = [index.texts[r] for r in rows]
+    attributes = [v for part in ("hard_constraints", "soft_constraints") for values in state[part].values() for v in values]
+    chosen, tokens, n_duplicates = pack_context(
+        texts, ranking.review_scores[mine], review_signatures(index, rows), attributes, budget
+    )
+    return {
+        "item": name,
+        "metadata": restaurant(name),
+        "reviews": [texts[i] for i in chosen],
+        "state": state,
+        "alternatives": list(alternatives),
+        "preamble": preamble,
+        "question": question,
+        "packing": {"tokens": tokens, "budget": budget, "considered": len(texts), "duplicates": n_duplicates},
+    }
+
+def stream_response(requests):
+    """Stream one or more generated replies into the current element; returns (text, stream)."""
+    if isinstance(requests, dict):
+        requests = [requests]
+    backend = load_backend()
+
+    def chunks():
+        for i, request in enumerate(requests):
+            if i:
+                yield " "
+            yield from backend.stream(request)
+
+    stream = TimedStream(chunks())
+    st.write_stream(stream)
+    return stream.text, stream
+
 # --- HEADER SECTION ---
 def render_header():
     st.markdown("""
@@ -168,12 +326,21 @@ def render_architecture():
         
         # STEP 1: HARD FILTER
         st.markdown("#### Step 1: Hard Constraint Filtering")
-        st.markdown("First, we filter the database to only include restaurants matching `Japanese` and `Sushi`.")
+        encoder, index = load_engine()
+        index = index.snapshot()
+        metadata, _ = filters(index)
+        hard = DEMO_STATE["hard_constraints"]
+        wanted = " and ".join(f"`{v}`" for values in hard.values() for v in values)
+        st.markdown(f"First, we filter the database to only include restaurants matching {wanted}.")
         
+        candidates = metadata.query(hard)
+        kept = set(candidates.tolist())
+        records = [restaurant(name) for name in metadata.item_ids]
         filter_df = pd.DataFrame({
-            "Restaurant": ["Washoku Bistro", "Tokyo Express", "Pasta Place", "Burger King"],
-            "Cuisine": ["Japanese", "Japanese", "Italian", "Fast Food"],
-            "Status": ["✅ Keep", "✅ Keep", "❌ Discard", "❌ Discard"]
+            "Restaurant": [r["name"] for r in records],
+            "Cuisine": [", ".join(r.get("cuisine_type", [])) for r in records],
+            "Dishes": [", ".join(r.get("dish_type", [])) for r in records],
+            "Status": ["✅ Keep" if i in kept else "❌ Discard" for i in range(len(records))]
         })
         st.dataframe(filter_df, hide_index=True, use_container_width=True)
         
@@ -185,66 +352,92 @@ def render_architecture():
         We generate a query and calculate the **Dot Product Similarity** between the query and **ALL reviews** of the remaining restaurants.
         """)
         
-        review_data = [
-            {"Restaurant": "Washoku Bistro", "Review Text": "Excellent sushi and very fresh.", "Score": 0.93, "Type": "High Match"},
-            {"Restaurant": "Washoku Bistro", "Review Text": "Casual atmosphere, great for dates.", "Score": 0.88, "Type": "High Match"},
-            {"Restaurant": "Washoku Bistro", "Review Text": "Had many healthy, low-cal options.", "Score": 0.88, "Type": "High Match (Weight)"},
-            {"Restaurant": "Tokyo Express", "Review Text": "Love their rolls, very cheap.", "Score": 0.91, "Type": "High Match"},
-            {"Restaurant": "Tokyo Express", "Review Text": "Good fried food, a bit greasy.", "Score": 0.62, "Type": "Low Match (Unhealthy)"},
-        ]
-        df_reviews = pd.DataFrame(review_data)
+        use_ann = st.toggle(
+            "Approximate search (IVF)",
+            help=f"Probe the closest k-means clusters of reviews instead of scoring every review. "
+                 f"Candidate sets with at most {EXACT_MAX_REVIEWS:,} reviews are always scored exactly.",
+            # The IVF lists are built over one contiguous review matrix.
+            disabled=isinstance(index, SegmentView)
+        )
+        query = state_to_query(DEMO_STATE)
+        query_vec = encoder.encode(query)[0]
+        if use_ann:
+            ranking = load_ann_index().rank(query_vec, candidates, k=TOP_K)
+        else:
+            ranking = index.rank(query_vec, candidates, k=TOP_K)
+        st.markdown(f"**Query:** `{query}`")
+
+        top_rows = set(ranking.top_rows[ranking.top_rows >= 0].tolist())
+        owners = index.item_of_rows(ranking.rows)
+        df_reviews = pd.DataFrame({
+            "Restaurant": [index.item_ids[i] for i in owners],
+            "Review Text": [index.texts[r] for r in ranking.rows],
+            "Score": ranking.review_scores.round(2),
+            "Top-k": ["✅" if r in top_rows else "" for r in ranking.rows],
+        })
         
-        def highlight_score(val):
-            color = '#d4edda' if val > 0.85 else '#f8d7da'
-            return f'background-color: {color}'
+        def highlight_score(col):
+            return [
+                f"background-color: {'#d4edda' if top else '#f8d7da'}"
+                for top in df_reviews["Top-k"] != ""
+            ]
 
-        st.dataframe(df_reviews.style.applymap(highlight_score, subset=['Score']), use_container_width=True)
+        st.dataframe(df_reviews.style.apply(highlight_score, subset=['Score']), hide_index=True, use_container_width=True)
         
         st.markdown("<div class='arrow-down'>↓</div>", unsafe_allow_html=True)
 
         # STEP 3: AGGREGATION
         st.markdown("#### Step 3: Late Fusion Aggregation")
-        st.markdown("We average the top-k review scores for each restaurant to get a final **Item Score**.")
+        st.markdown(f"We average the top-{TOP_K} review scores for each restaurant to get a final **Item Score**.")
         
-        col_a, col_b = st.columns(2)
-        with col_a:
-            st.markdown("""
-            **Washoku Bistro Calculation:**
-            $$(0.93 + 0.88 + 0.88) / 3 = \mathbf{0.89}$$
-            """)
-            st.success("🏆 Winner")
-        with col_b:
-            st.markdown("""
-            **Tokyo Express Calculation:**
-            $$(0.91 + 0.87 + 0.80) / 3 = \mathbf{0.86}$$
-            """)
-            st.warning("🥈 Runner Up")
+        badges = [st.success, st.warning]
+        cols = st.columns(max(len(ranking), 1))
+        row_score = dict(zip(ranking.rows.tolist(), ranking.review_scores.tolist()))
+        for place, (col, item, score, rows) in enumerate(zip(cols, ranking.items, ranking.scores, ranking.top_rows)):
+            terms = [f"{row_score[r]:.2f}" for r in rows if r >= 0]
+            with col:
+                st.markdown(f"""
+                **{index.item_ids[item]} Calculation:**
+                $$({' + '.join(terms)}) / {len(terms)} = \\mathbf{{{score:.2f}}}$$
+                """)
+                if place < len(badges):
+                    badges[place]("🏆 Winner" if place == 0 else "🥈 Runner Up")
 
     # --- TAB 3: GROUNDED GENERATION ---
     with tabs[2]:
         st.markdown("#### Grounded Generation")
         st.markdown("The LLM generates a response using the **Metadata** and the **Top Retrieved Reviews**.")
         
+        if not len(ranking):
+            st.info("No restaurant passed the hard-constraint filter.")
+            return
+        budget = st.slider("Review context budget (tokens)", 10, 200, CONTEXT_BUDGET_TOKENS, step=10)
+        request = generation_request(index, ranking, ranking.items[0], DEMO_STATE, budget=budget)
+        packing = request["packing"]
+        
         col1, col2 = st.columns(2)
         with col1:
             st.markdown("**Source Context (Retrieved):**")
-            st.markdown("""
-            * *Metadata:* Name: Washoku Bistro, Type: Japanese
-            * *Review 1:* "Casual atmosphere..."
-            * *Review 2:* "Excellent sushi..."
-            * *Review 3:* "...low-cal veggie options"
-            """)
+            metadata_line = ", ".join(
+                f"{key.replace('_', ' ').title()}: {', '.join(v) if isinstance(v, list) else v}"
+                for key, v in request["metadata"].items()
+            )
+            lines = [f"* *Metadata:* {metadata_line}"]
+            lines += [f'* *Review {i}:* "{text}"' for i, text in enumerate(request["reviews"], 1)]
+            st.markdown("\n".join(lines))
+            st.caption(
+                f"Packed {len(request['reviews'])} of {packing['considered']} reviews "
+                f"(~{packing['tokens']} of {packing['budget']} tokens); "
+                f"{packing['duplicates']} near-duplicate(s) removed."
+            )
         
         with col2:
             st.markdown("**Generated Response:**")
-            st.markdown("""
-            <div class="custom-card" style="background-color: #eaf4fc; border-left: 5px solid #4A90E2;">
-            "How about trying <b>Washoku Bistro</b>? 
-            It has a <span class="hl-purple">casual</span> vibe and offers 
-            <span class="hl-green">low-calorie menu items</span> (from review 3) 
-            while serving excellent <span class="hl-blue">Japanese sushi</span>."
-            </div>
-            """, unsafe_allow_html=True)
+            if st.button("▶ Generate", key="generate_tab"):
+                _, stream = stream_response(request)
+                st.caption(f"Time to first token: {stream.ttft_ms:.0f} ms • Total: {stream.total_ms:.0f} ms")
+            else:
+                st.caption(f"Streams from the `{load_backend().name}` backend.")
 
 # --- SECTION 2: STATIC CONVERSATION UI ---
 def render_chat_demo():
@@ -307,10 +500,151 @@ Great! Enjoy your meal! If you need any more assistance, feel free to ask.
     
     st.markdown(chat_html, unsafe_allow_html=True)
 
+# --- SECTION 3: LIVE CONVERSATION ---
+LOCATION_QUESTION = "Can you provide the location?"
+
+def respond(utterance):
+    encoder, index = load_engine()
+    index = index.snapshot()
+    metadata, _ = filters(index)
+    tracker = StateTracker({field: metadata.values(field) for field in metadata.fields})
+    session = st.session_state.retrieval
+    old_state = st.session_state.dialogue_state
+    messages = st.session_state.messages
+    expecting_location = bool(messages) and messages[-1]["content"] == LOCATION_QUESTION
+
+    state = tracker.update(old_state, utterance, expecting_location)
+    st.session_state.dialogue_state = state
+    turn = {"changed": sorted(state_delta(old_state, state)), "recomputed": []}
+
+    shown = [index.item_ids[i] for i in session.shown]
+    intent, names = parse_feedback(utterance, shown, index.item_ids)
+    targets = index.positions(names or shown[:1])
+    question = parse_question(utterance, index.item_ids, shown)
+    if turn["changed"] or any(tracker.mentions(utterance)):
+        # A new request ("Is there somewhere cheap with ramen?"), not a
+        # follow-up question about the items shown.
+        question = None
+
+    if question is not None:
+        # Attribute QA fast path: column lookup + template, no retrieval.
+        attribute, names = question
+        answers, missing = answer(load_attribute_store(), attribute, names)
+        session.shown = index.positions(names).tolist()
+        turn["recomputed"] = ["attribute lookup"]
+        reply = " ".join(answers)
+        if missing:
+            # Unknown attribute: retrieve the item's reviews for the question.
+            ranking = index.rank(encoder.encode(utterance)[0], index.positions(missing), k=TOP_K)
+            turn["recomputed"].append(f"review retrieval ({len(missing)} item(s))")
+            reply = [
+                generation_request(index, ranking, item, state, question=utterance,
+                                   preamble=reply if i == 0 else "")
+                for i, item in enumerate(index.positions(missing))
+            ]
+    elif intent == "reject" and session.ranking is not None:
+        # Masking only: the next pick comes from the ranking already scored.
+        session.reject(targets)
+        session.update(state)
+        turn["recomputed"] = session.recomputed + ["exclusion mask"]
+        picks = session.recommend(1)
+        apology = "I'm sorry that you did not like the recommendation."
+        if picks:
+            reply = generation_request(session.view, session.ranking, picks[0], state, preamble=apology)
+        else:
+            reply = apology + " Is there anything else I can assist you with?"
+    elif intent == "accept" and session.ranking is not None:
+        session.accept(targets)
+        turn["recomputed"] = ["exclusion mask"]
+        reply = "Great! Enjoy your meal! If you need any more assistance, feel free to ask."
+    elif not state["hard_constraints"] and not state["soft_constraints"]:
+        reply = "What kind of food are you in the mood for?"
+    elif state["location"] is None:
+        reply = LOCATION_QUESTION
+    else:
+        session.update(state)
+        turn["recomputed"] = session.recomputed
+        picks = session.recommend(2)
+        if picks:
+            alternatives = [session.view.item_ids[i] for i in picks[1:]]
+            preamble = ""
+            if geocode(state["location"], KNOWN_LOCATIONS) is None:
+                preamble = f"I couldn't place \"{state['location']}\" on the map, so I searched the whole city."
+            reply = generation_request(session.view, session.ranking, picks[0], state, alternatives, preamble)
+        elif len(session.ranking):
+            # Candidates exist, but every one was already accepted or rejected.
+            reply = (
+                f"I've already suggested every restaurant within {SEARCH_RADIUS_KM:g} km of {state['location']} "
+                "that matches your requirements, and you've accepted or turned them down. "
+                "Would you like to try another cuisine or location?"
+            )
+        else:
+            reply = (
+                "Sorry, I couldn't find a restaurant matching all of your requirements "
+                f"within {SEARCH_RADIUS_KM:g} km of {state['location']}."
+            )
+    st.session_state.turns.append(turn)
+    return reply
+
+def render_live_demo():
+    st.markdown("---")
+    st.markdown("## Try It Yourself")
+    st.caption("Chat with the retrieval pipeline. Each turn only recomputes the stages your change affects.")
+
+    encoder, index = load_engine()
+    if "retrieval" not in st.session_state:
+        st.session_state.retrieval = RetrievalSession(
+            index, encoder, filter_candidates, k=TOP_K,
+            result_cache=load_result_cache()
+        )
+        st.session_state.dialogue_state = empty_state()
+        st.session_state.messages = []
+        st.session_state.turns = []
+
+    for message in st.session_state.messages:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+
+    utterance = st.chat_input("e.g. Japanese restaurants with excellent sushi, casual setting")
+    if utterance:
+        with st.chat_message("user"):
+            st.markdown(utterance)
+        reply = respond(utterance)
+        with st.chat_message("assistant"):
+            if isinstance(reply, (dict, list)):
+                reply, stream = stream_response(reply)
+                st.session_state.turns[-1].update(ttft_ms=stream.ttft_ms, total_ms=stream.total_ms)
+            else:
+                st.markdown(reply)
+        st.session_state.messages.append({"role": "user", "content": utterance})
+        st.session_state.messages.append({"role": "assistant", "content": reply})
+
+    with st.expander("Semi-Structured State", expanded=bool(st.session_state.messages)):
+        st.json(st.session_state.dialogue_state)
+        if st.session_state.turns:
+            turn = st.session_state.turns[-1]
+            st.caption(
+                f"Changed: {', '.join(turn['changed']) or 'nothing'} • "
+                f"Recomputed: {', '.join(turn['recomputed']) or 'nothing (cached)'}"
+            )
+            if "ttft_ms" in turn:
+                st.caption(f"Time to first token: {turn['ttft_ms']:.0f} ms • Generation: {turn['total_ms']:.0f} ms")
+        stats = load_result_cache().stats()
+        st.caption(
+            f"Shared result cache: {stats['entries']} entries • {stats['hits']} hits / "
+            f"{stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)"
+        )
+        session = st.session_state.retrieval
+        excluded = {"Rejected": session.rejected, "Accepted": session.accepted}
+        for label, mask in excluded.items():
+            if mask.any():
+                st.caption(f"{label}: {', '.join(index.item_ids[i] for i in mask.nonzero()[0])}")
+
 # --- MAIN EXECUTION ---
 render_header()
 render_architecture()
 render_chat_demo()
+render_live_demo()
 
 # --- FOOTER ---
 st.markdown("""
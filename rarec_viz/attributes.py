@@ -0,0 +1,93 @@
+"""Columnar item attributes and the attribute-QA fast path.
+
+Follow-up questions such as "Does Tokyo Express have a parking lot?" are
+answered straight from structured attributes. The answer is an O(1) lookup
+into an Arrow table (one contiguous chunk per column, plus an id -> row
+map) and a template sentence. No review is retrieved and the LLM is not
+called. Only attributes that are missing for an item fall back to review
+retrieval + generation.
+"""
+import re
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# attribute -> (trigger words, answer template); booleans use (yes, no).
+ATTRIBUTES = {
+    "parking": (["parking", "park"], ("{name} has a parking lot.", "{name} does not have a parking lot.")),
+    "menu": (["menu", "offer", "serve", "dishes"], "{name} offers {value}."),
+    "hours": (["hours", "open", "close"], "{name} is open {value}."),
+    "price_range": (["price", "expensive", "cheap", "cost"], "{name} is in the {value} price range."),
+    "reservations": (["reservation", "book"], ("{name} takes reservations.", "{name} does not take reservations.")),
+    "wifi": (["wifi", "wi-fi", "internet"], ("{name} has free Wi-Fi.", "{name} does not have Wi-Fi.")),
+}
+QUESTION_RE = re.compile(r"\?\s*$|^(does|do|is|are|what|when|how|can|which)\b", re.IGNORECASE)
+PRONOUN_RE = re.compile(r"\b(they|them|their|it|its|those|both)\b", re.IGNORECASE)
+
+
+class AttributeStore:
+    """Item attributes as an Arrow table with O(1) ``(item, attribute)`` lookup."""
+
+    def __init__(self, table, id_column="name"):
+        self.table = table.combine_chunks()
+        self.id_column = id_column
+        self._row = {item_id: row for row, item_id in enumerate(self.table.column(id_column).to_pylist())}
+        self._columns = {name: self.table.column(name).chunk(0) for name in self.table.column_names
+                         if self.table.column(name).num_chunks}
+
+    @classmethod
+    def from_records(cls, records, id_column="name"):
+        # Records may omit attributes; every key seen becomes a nullable column.
+        columns = list(dict.fromkeys(key for record in records for key in record))
+        return cls(pa.table({c: [record.get(c) for record in records] for c in columns}), id_column)
+
+    @classmethod
+    def from_parquet(cls, path, id_column="name"):
+        return cls(pq.read_table(path, memory_map=True), id_column)
+
+    def to_parquet(self, path):
+        pq.write_table(self.table, path)
+
+    def get(self, item_id, attribute):
+        """Attribute value, or ``None`` if the item or attribute is unknown."""
+        row = self._row.get(item_id)
+        column = self._columns.get(attribute)
+        if row is None or column is None:
+            return None
+        return column[row].as_py()
+
+
+def parse_question(utterance, item_names, focus):
+    """Match an attribute question: ``(attribute, item names)`` or ``None``.
+
+    Items are the names mentioned in the question, or ``focus`` (the items
+    under discussion) when the question uses a pronoun.
+    """
+    text = " ".join(utterance.lower().split())
+    if not QUESTION_RE.search(text):
+        return None
+    attribute = next(
+        (attr for attr, (words, _) in ATTRIBUTES.items() if any(re.search(rf"\b{w}", text) for w in words)),
+        None,
+    )
+    if attribute is None:
+        return None
+    names = [name for name in item_names if name.lower() in text]
+    if not names and PRONOUN_RE.search(text):
+        names = list(focus)
+    return (attribute, names) if names else None
+
+
+def answer(store, attribute, names):
+    """Template answers from ``store`` plus the names with no stored value."""
+    template = ATTRIBUTES[attribute][1]
+    answers, missing = [], []
+    for name in names:
+        value = store.get(name, attribute)
+        if value is None:
+            missing.append(name)
+        elif isinstance(template, tuple):
+            answers.append(template[0 if value else 1].format(name=name))
+        else:
+            answers.append(template.format(name=name, value=value))
+    return answers, missing
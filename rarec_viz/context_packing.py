@@ -0,0 +1,87 @@
+"""Token-budgeted packing of retrieved reviews into the generation prompt.
+
+Reviews are deduplicated with MinHash signatures over their word stems.
+The signatures are computed once when the index is built, so a prompt only
+compares a few small integer vectors. Reviews are then picked greedily. At
+each step the packer takes the review that covers the most not-yet-covered
+state attributes, breaking ties by retrieval score, until the token budget
+is used up.
+"""
+import zlib
+
+import numpy as np
+
+from encoder import stem, tokenize
+
+N_PERMUTATIONS = 64
+DUPLICATE_JACCARD = 0.5
+_PRIME = np.uint64((1 << 31) - 1)
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token)."""
+    return max(1, round(len(text) / 4))
+
+
+def shingles(text):
+    return {stem(token) for token in tokenize(text)}
+
+
+def minhash_signatures(texts, n_permutations=N_PERMUTATIONS, seed=0):
+    """``(len(texts), n_permutations)`` MinHash signatures of word-stem sets."""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, int(_PRIME), n_permutations, dtype=np.uint64)
+    b = rng.integers(0, int(_PRIME), n_permutations, dtype=np.uint64)
+    out = np.full((len(texts), n_permutations), int(_PRIME), dtype=np.uint64)
+    for row, text in enumerate(texts):
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles(text)), dtype=np.uint64)
+        if len(hashes):
+            hashes %= _PRIME
+            out[row] = ((a[:, None] * hashes[None, :] + b[:, None]) % _PRIME).min(axis=1)
+    return out.astype(np.uint32)
+
+
+def estimated_jaccard(signature, others):
+    """Estimated Jaccard similarity of one signature against each row of ``others``."""
+    return (others == signature).mean(axis=1)
+
+
+def attribute_coverage(texts, attributes):
+    """Boolean ``(len(texts), len(attributes))`` matrix: review mentions attribute."""
+    attribute_stems = [shingles(a) for a in attributes]
+    out = np.zeros((len(texts), len(attributes)), dtype=bool)
+    for row, text in enumerate(texts):
+        stems = shingles(text)
+        for col, wanted in enumerate(attribute_stems):
+            out[row, col] = bool(wanted) and bool(wanted & stems)
+    return out
+
+
+def pack_context(texts, scores, signatures, attributes, budget_tokens, duplicate_jaccard=DUPLICATE_JACCARD):
+    """Choose which reviews go into the prompt.
+
+    Returns ``(chosen, tokens_used, n_duplicates)`` where ``chosen`` lists
+    indices into ``texts`` in prompt order.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    tokens = np.array([estimate_tokens(t) for t in texts], dtype=np.int64)
+    coverage = attribute_coverage(texts, attributes)
+    covered = np.zeros(len(attributes), dtype=bool)
+    available = np.ones(len(texts), dtype=bool)
+    chosen, used, n_duplicates = [], 0, 0
+
+    while available.any():
+        gain = (coverage & ~covered).sum(axis=1)
+        # Lexicographic (gain, score) maximum among the remaining reviews.
+        candidates = np.flatnonzero(available)
+        best = candidates[np.lexsort((-scores[candidates], -gain[candidates]))[0]]
+        available[best] = False
+        if chosen and estimated_jaccard(signatures[best], signatures[chosen]).max() >= duplicate_jaccard:
+            n_duplicates += 1
+            continue
+        if used + tokens[best] > budget_tokens:
+            continue
+        chosen.append(int(best))
+        used += int(tokens[best])
+        covered |= coverage[best]
+    return chosen, used, n_duplicates
@@ -0,0 +1,128 @@
+"""Toy restaurant corpus behind the RA-Rec walkthrough."""
+
+RESTAURANTS = [
+    {
+        "name": "Washoku Bistro",
+        "lat": 53.5693,
+        "lon": -113.508,
+        "cuisine_type": ["Japanese"],
+        "dish_type": ["sushi", "bento"],
+    },
+    {
+        "name": "Tokyo Express",
+        "lat": 53.565,
+        "lon": -113.5035,
+        "cuisine_type": ["Japanese"],
+        "dish_type": ["sushi", "tempura", "noodles"],
+    },
+    {
+        "name": "Sakura Ramen House",
+        "lat": 53.5185,
+        "lon": -113.499,
+        "cuisine_type": ["Japanese"],
+        "dish_type": ["ramen"],
+    },
+    {
+        "name": "Pasta Place",
+        "lat": 53.544,
+        "lon": -113.49,
+        "cuisine_type": ["Italian"],
+        "dish_type": ["pasta", "pizza"],
+    },
+    {
+        "name": "Burger King",
+        "lat": 53.568,
+        "lon": -113.51,
+        "cuisine_type": ["Fast Food"],
+        "dish_type": ["burgers"],
+    },
+]
+
+REVIEWS = {
+    "Washoku Bistro": [
+        "Excellent sushi and very fresh.",
+        "Really excellent sushi, very fresh.",
+        "Casual atmosphere, great for a relaxed lunch.",
+        "Had many healthy, low-cal options for anyone watching their weight.",
+        "Lunch menu is limited but the bento boxes are solid.",
+    ],
+    "Tokyo Express": [
+        "Love their sushi rolls, very cheap.",
+        "Good fried food, a bit greasy.",
+        "Quick casual spot, sushi combos come out fast.",
+        "Huge menu with tempura and noodles.",
+    ],
+    "Sakura Ramen House": [
+        "Rich tonkotsu ramen, very filling.",
+        "Casual counter seating and friendly staff.",
+    ],
+    "Pasta Place": [
+        "Fresh pasta and a cozy, casual setting.",
+        "Portions are huge, not great if you are watching your weight.",
+    ],
+    "Burger King": [
+        "Fast and cheap burgers.",
+        "Fries were soggy.",
+    ],
+}
+
+# Structured attributes for the QA fast path; a missing key means unknown.
+ATTRIBUTES = [
+    {
+        "name": "Washoku Bistro",
+        "menu": "a lunch menu with bento boxes and entrées, plus sushi rolls such as spicy salmon and California rolls",
+        "hours": "11am to 9pm, Tuesday to Sunday",
+        "price_range": "$$",
+        "reservations": True,
+    },
+    {
+        "name": "Tokyo Express",
+        "menu": "bento boxes, sushi combos, feature rolls, tempura and noodles",
+        "parking": True,
+        "hours": "11am to 10pm daily",
+        "price_range": "$",
+        "reservations": False,
+        "wifi": False,
+    },
+    {
+        "name": "Sakura Ramen House",
+        "menu": "tonkotsu, shoyu and miso ramen with gyoza on the side",
+        "parking": False,
+        "price_range": "$",
+    },
+    {
+        "name": "Pasta Place",
+        "menu": "fresh pasta, wood-fired pizza and tiramisu",
+        "parking": True,
+        "price_range": "$$",
+        "reservations": True,
+        "wifi": True,
+    },
+    {
+        "name": "Burger King",
+        "menu": "burgers, fries and shakes",
+        "parking": True,
+        "hours": "24 hours",
+        "price_range": "$",
+        "wifi": True,
+    },
+]
+
+# Gazetteer for the stub geocoder: normalised place name -> (lat, lon).
+KNOWN_LOCATIONS = {
+    "tower road nw & kingsway nw": (53.5667, -113.5069),
+    "kingsway": (53.5667, -113.5069),
+    "whyte ave": (53.5180, -113.4985),
+    "downtown": (53.5444, -113.4909),
+}
+
+DEMO_STATE = {
+    "hard_constraints": {
+        "cuisine_type": ["Japanese"],
+        "dish_type": ["sushi"],
+    },
+    "soft_constraints": {
+        "atmosphere": ["casual"],
+        "others": ["watching my weight"],
+    },
+}
@@ -0,0 +1,252 @@
+"""Live dialogue engine for the RA-Rec demo.
+
+``StateTracker`` updates the semi-structured state from a user utterance.
+RA-Rec does this with an LLM prompt; the demo uses a lexicon so it runs
+offline. ``RetrievalSession`` keeps the intermediate retrieval results of
+one conversation and, on each turn, recomputes only the stages that the
+state change affects:
+
+* soft constraints changed -> re-score reviews, reuse the candidate set;
+* location changed         -> re-filter, reuse cached review scores;
+* hard constraints changed -> re-filter and re-score.
+
+Rejected and accepted restaurants are kept in a per-session exclusion mask,
+so the next recommendation is read off the already scored ranking without
+another retrieval pass.
+"""
+import copy
+import re
+
+import numpy as np
+
+from result_cache import canonical_state
+
+STATE_PARTS = ("hard_constraints", "soft_constraints", "location")
+
+SOFT_LEXICON = {
+    "atmosphere": ["casual", "laid-back", "cozy", "romantic", "quiet", "lively", "fancy", "family friendly"],
+    "others": ["watching my weight", "healthy", "vegetarian", "vegan", "cheap", "quick", "spicy", "gluten free"],
+}
+
+REJECT_PHRASES = ["doesn't seem to match", "does not match", "doesn't match", "don't like", "not interested",
+                  "not for me", "no thanks", "something else"]
+ACCEPT_PHRASES = ["i will go", "i'll go", "sounds good", "i'll take", "i will take", "let's go with", "i'll try"]
+ORDINALS = {"first": 0, "1st": 0, "second": 1, "2nd": 1, "third": 2, "3rd": 2, "last": -1}
+
+
+def empty_state():
+    return {"hard_constraints": {}, "soft_constraints": {}, "location": None}
+
+
+def state_delta(old, new):
+    """Names of the state parts that differ between two turns."""
+    return {part for part in STATE_PARTS if old.get(part) != new.get(part)}
+
+
+def canonical_query(canonical):
+    """Retrieval query text of a ``canonical_state``: hard, then soft constraint values.
+
+    Every spelling of a state that shares a result-cache key also shares
+    this query, so a cached ranking always matches the current query.
+    """
+    hard, soft, _ = canonical
+    return ", ".join(value for part in (hard, soft) for _, values in part for value in values)
+
+
+def _contains(text, phrase):
+    return re.search(r"\b" + re.escape(phrase) + r"s?\b", text) is not None
+
+
+def parse_feedback(utterance, shown, item_names):
+    """Detect a rejection or acceptance and the restaurants it refers to.
+
+    Returns ``(intent, names)`` where ``intent`` is ``"reject"``,
+    ``"accept"`` or ``None``. Restaurants are resolved from names in the
+    utterance, then from ordinals ("the first one") over ``shown``, the
+    names recommended last.
+    """
+    text = " ".join(utterance.lower().split())
+    if any(phrase in text for phrase in REJECT_PHRASES):
+        intent = "reject"
+    elif any(phrase in text for phrase in ACCEPT_PHRASES):
+        intent = "accept"
+    else:
+        return None, []
+    names = [name for name in item_names if name.lower() in text]
+    if not names:
+        names = [
+            shown[i] for word, i in ORDINALS.items()
+            if shown and _contains(text, word) and -len(shown) <= i < len(shown)
+        ]
+    return intent, names
+
+
+class StateTracker:
+    """Lexicon-based stand-in for RA-Rec's prompt-based state tracker."""
+
+    def __init__(self, hard_lexicon, soft_lexicon=SOFT_LEXICON):
+        # field -> known values, e.g. {"cuisine_type": ["japanese", ...]}
+        self.hard_lexicon = hard_lexicon
+        self.soft_lexicon = soft_lexicon
+
+    def mentions(self, utterance):
+        """Hard and soft constraint values mentioned in ``utterance``."""
+        text = " ".join(utterance.lower().split())
+        hard = {
+            field: [v for v in values if _contains(text, v)]
+            for field, values in self.hard_lexicon.items()
+        }
+        soft = {
+            field: [v for v in values if _contains(text, v)]
+            for field, values in self.soft_lexicon.items()
+        }
+        return {f: v for f, v in hard.items() if v}, {f: v for f, v in soft.items() if v}
+
+    def update(self, state, utterance, expecting_location=False):
+        """Return the state after ``utterance`` (``state`` is not modified).
+
+        Newly mentioned hard values replace the previous values of their
+        field; soft values accumulate. When the system has just asked for a
+        location, an utterance with no constraint is taken as the location.
+        """
+        new = copy.deepcopy(state)
+        hard, soft = self.mentions(utterance)
+        new["hard_constraints"].update(hard)
+        for field, values in soft.items():
+            known = new["soft_constraints"].setdefault(field, [])
+            known.extend(v for v in values if v not in known)
+        if expecting_location and not hard and not soft:
+            new["location"] = utterance.strip()
+        return new
+
+
+class RetrievalSession:
+    """Per-conversation retrieval cache with delta recomputation.
+
+    ``filter_fn(state, view)`` returns candidate item positions in ``view``
+    (see below). Review scores are
+    cached per review row for the current query text, so a new candidate set
+    only scores the reviews that have not been scored yet. An optional
+    process-wide ``ResultCache`` is consulted first; a hit skips scoring and
+    aggregation altogether.
+
+    ``index`` is a ``ReviewIndex`` or a ``SegmentedIndex``. Each update works
+    on one ``index.snapshot()``, kept as ``view``. When a refresh or
+    compaction moves the index to a new generation, the candidates are
+    filtered again and the cached review scores are dropped, since row
+    numbers may have changed.
+
+    Memory-mapped and large indexes (``index.out_of_core``) are ranked with
+    ``rank_streaming`` instead, so a session holds ``k`` scores per
+    candidate rather than one per review. ``streaming`` forces either mode.
+    """
+
+    def __init__(self, index, encoder, filter_fn, k=3, result_cache=None, streaming=None):
+        self.index = index
+        self.streaming = streaming
+        self.view = index.snapshot()
+        self.encoder = encoder
+        self.filter_fn = filter_fn
+        self.k = k
+        self.result_cache = result_cache
+        self.state = empty_state()
+        self.candidates = None
+        self.ranking = None
+        self.recomputed = []
+        self._filter_key = None
+        self._query = None
+        self._query_vec = None
+        self._scores = None
+        self.rejected = np.zeros(self.view.n_items, dtype=bool)
+        self.accepted = np.zeros(self.view.n_items, dtype=bool)
+        self.shown = []
+
+    def update(self, state):
+        """Bring the ranking up to date with ``state`` and return it."""
+        self.recomputed = []
+        view = self.index.snapshot()
+        if view.generation != self.view.generation:
+            self._set_view(view)
+        canonical = canonical_state(state)
+        filter_key = (canonical[0], canonical[2])
+        query = canonical_query(canonical)
+        cache_key = (self.k, view.generation, canonical)
+
+        state_changed = filter_key != self._filter_key or query != self._query
+        if self.result_cache is not None and state_changed:
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                self.candidates, self.ranking = cached
+                self._filter_key = filter_key
+                self._set_query(query)
+                self.recomputed.append("result cache hit")
+                self.state = copy.deepcopy(state)
+                return self.ranking
+
+        if filter_key != self._filter_key:
+            self.candidates = self.filter_fn(state, view)
+            self._filter_key = filter_key
+            self.recomputed.append("filter")
+
+        if query != self._query:
+            self._set_query(query)
+            self.ranking = None
+
+        if self._streams():
+            if self.recomputed or self.ranking is None:
+                if self._query_vec is None:
+                    self._query_vec = self.encoder.encode(query)[0]
+                self.ranking = view.rank_streaming(self._query_vec, self.candidates, self.k)
+                self.recomputed.append("streamed scoring")
+                if self.result_cache is not None:
+                    self.result_cache.put(cache_key, (self.candidates, self.ranking))
+        else:
+            if self._scores is None:
+                self._scores = np.full(view.n_reviews, np.nan, dtype=np.float32)
+            rows, local = view.item_rows(self.candidates)
+            missing = rows[np.isnan(self._scores[rows])]
+            if len(missing):
+                if self._query_vec is None:
+                    self._query_vec = self.encoder.encode(query)[0]
+                self._scores[missing] = view.score_rows(missing, self._query_vec)
+                self.recomputed.append(f"scoring ({len(missing)} reviews)")
+            if self.recomputed or self.ranking is None:
+                self.ranking = view.aggregate(self.candidates, rows, self._scores[rows], local, self.k)
+                self.recomputed.append("aggregation")
+                if self.result_cache is not None:
+                    self.result_cache.put(cache_key, (self.candidates, self.ranking))
+        self.state = copy.deepcopy(state)
+        return self.ranking
+
+    def _set_query(self, query):
+        """Make ``query`` current; its review scores are allocated and filled in on demand."""
+        if query != self._query:
+            self._query = query
+            self._query_vec = None
+            self._scores = None
+
+    def _streams(self):
+        return self.view.out_of_core if self.streaming is None else self.streaming
+
+    def _set_view(self, view):
+        """Move to a new index generation; item positions stay, new items are appended."""
+        grow = view.n_items - len(self.rejected)
+        self.rejected = np.concatenate([self.rejected, np.zeros(grow, dtype=bool)])
+        self.accepted = np.concatenate([self.accepted, np.zeros(grow, dtype=bool)])
+        self.view = view
+        self._filter_key = None  # new items may pass the filter
+        self._query = None  # forces a fresh score cache sized for the new rows
+        self.ranking = None
+
+    def recommend(self, n=2):
+        """Best ``n`` ranked items that were neither rejected nor accepted."""
+        items = self.ranking.items
+        items = items[~(self.rejected | self.accepted)[items]]
+        self.shown = items[:n].tolist()
+        return self.shown
+
+    def reject(self, items):
+        self.rejected[items] = True
+
+    def accept(self, items):
+        self.accepted[items] = True
@@ -0,0 +1,165 @@
+"""On-disk review embedding store shared read-only by every Streamlit session.
+
+A store is a directory holding
+
+* ``embeddings.npy`` - ``(n_reviews, dim)`` float16 matrix, C order,
+* ``offsets.npy``    - ``(n_items + 1,)`` int64 row offsets per restaurant,
+* ``items.json``     - item ids and matrix shape,
+* ``texts.jsonl``    - optional review texts, one JSON string per row,
+* ``text_offsets.npy`` - ``(n_reviews + 1,)`` int64 byte offsets into ``texts.jsonl``.
+
+``open_store`` validates the ``.npy`` headers and file sizes without touching
+the data pages and then maps the matrix with ``mmap_mode="r"``. Texts are
+mapped too and decoded one row at a time on access (``StoredTexts``). Wrapped in
+``st.cache_resource`` it is opened once per server process; all sessions read
+the same page-cache-backed pages, so RAM does not grow with visitors.
+
+Build the demo store with ``python rarec_viz/embedding_store.py <dir>``.
+"""
+import json
+import os
+
+import numpy as np
+
+from retrieval import ReviewIndex
+
+STORE_DTYPE = np.dtype("<f2")
+EMBEDDINGS_FILE = "embeddings.npy"
+OFFSETS_FILE = "offsets.npy"
+ITEMS_FILE = "items.json"
+TEXTS_FILE = "texts.jsonl"
+TEXT_OFFSETS_FILE = "text_offsets.npy"
+
+
+class StoreError(ValueError):
+    """The store on disk is missing, truncated or inconsistent."""
+
+
+class StoredTexts:
+    """Read-only sequence of the review texts in ``texts.jsonl``, decoded per row."""
+
+    def __init__(self, filename, offsets):
+        self._offsets = offsets
+        # np.memmap cannot map an empty file.
+        self._data = np.memmap(filename, dtype=np.uint8, mode="r") if offsets[-1] else np.empty(0, np.uint8)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, row):
+        row = int(row)
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(f"review row {row} out of range")
+        return json.loads(self._data[self._offsets[row]:self._offsets[row + 1]].tobytes())
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+
+def write_store(path, index):
+    """Write ``index`` (a ``ReviewIndex``) as a float16 store under ``path``."""
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, EMBEDDINGS_FILE), np.ascontiguousarray(index.embeddings, dtype=STORE_DTYPE))
+    write_metadata(path, index)
+
+
+def write_texts(path, texts):
+    """Write ``texts`` (any iterable, consumed once) as ``texts.jsonl`` and its byte offsets."""
+    offsets = [0]
+    with open(os.path.join(path, TEXTS_FILE), "wb") as f:
+        for text in texts:
+            f.write(json.dumps(text).encode("utf-8") + b"\n")
+            offsets.append(f.tell())
+    np.save(os.path.join(path, TEXT_OFFSETS_FILE), np.array(offsets, dtype="<i8"))
+
+
+def write_metadata(path, index):
+    """Write the offsets, texts and ``items.json`` of ``index`` next to an existing matrix."""
+    np.save(os.path.join(path, OFFSETS_FILE), index.offsets.astype("<i8"))
+    if index.texts is not None:
+        write_texts(path, index.texts)
+    meta = {
+        "n_reviews": int(index.n_reviews),
+        "dim": int(index.embeddings.shape[1]),
+        "dtype": STORE_DTYPE.str,
+        "item_ids": index.item_ids,
+    }
+    with open(os.path.join(path, ITEMS_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def read_npy_header(filename):
+    """Return ``(shape, dtype, fortran_order)`` of a ``.npy`` file.
+
+    Only the header is read. Raises ``StoreError`` if the file is shorter
+    than the header promises.
+    """
+    with open(filename, "rb") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        data_start = f.tell()
+    expected = data_start + int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+    actual = os.path.getsize(filename)
+    if actual != expected:
+        raise StoreError(f"{filename}: expected {expected} bytes, found {actual}")
+    return shape, dtype, fortran_order
+
+
+def open_texts(path, n_reviews):
+    """``StoredTexts`` of the store under ``path``, or ``None`` if it has no texts."""
+    texts_file = os.path.join(path, TEXTS_FILE)
+    if not os.path.exists(texts_file):
+        return None
+    idx_file = os.path.join(path, TEXT_OFFSETS_FILE)
+    idx_shape, idx_dtype, _ = read_npy_header(idx_file)
+    if idx_shape != (n_reviews + 1,) or idx_dtype.kind != "i":
+        raise StoreError(f"{idx_file}: expected {n_reviews + 1} integer offsets")
+    offsets = np.load(idx_file)
+    if offsets[0] != 0 or offsets[-1] != os.path.getsize(texts_file) or np.any(np.diff(offsets) <= 0):
+        raise StoreError(f"{idx_file}: offsets do not match {texts_file}")
+    return StoredTexts(texts_file, offsets)
+
+
+def open_store(path):
+    """Open the store under ``path`` as a read-only, memory-mapped ``ReviewIndex``."""
+    with open(os.path.join(path, ITEMS_FILE), encoding="utf-8") as f:
+        meta = json.load(f)
+
+    emb_file = os.path.join(path, EMBEDDINGS_FILE)
+    shape, dtype, fortran_order = read_npy_header(emb_file)
+    if dtype != STORE_DTYPE:
+        raise StoreError(f"{emb_file}: expected dtype {STORE_DTYPE}, found {dtype}")
+    if fortran_order or len(shape) != 2:
+        raise StoreError(f"{emb_file}: expected a C-ordered 2-D matrix, found shape {shape}")
+    if shape != (meta["n_reviews"], meta["dim"]):
+        raise StoreError(f"{emb_file}: shape {shape} does not match {ITEMS_FILE}")
+
+    off_file = os.path.join(path, OFFSETS_FILE)
+    off_shape, off_dtype, _ = read_npy_header(off_file)
+    if off_shape != (len(meta["item_ids"]) + 1,) or off_dtype.kind != "i":
+        raise StoreError(f"{off_file}: expected {len(meta['item_ids']) + 1} integer offsets")
+
+    embeddings = np.load(emb_file, mmap_mode="r")
+    offsets = np.load(off_file)
+    try:
+        return ReviewIndex(embeddings, offsets, meta["item_ids"], open_texts(path, meta["n_reviews"]))
+    except ValueError as exc:
+        raise StoreError(f"{path}: {exc}") from exc
+
+
+if __name__ == "__main__":
+    import sys
+
+    from demo_data import RESTAURANTS, REVIEWS
+    from encoder import HashingEncoder
+
+    if len(sys.argv) != 2:
+        sys.exit("usage: python embedding_store.py <store-dir>")
+    demo = ReviewIndex.from_reviews({r["name"]: REVIEWS[r["name"]] for r in RESTAURANTS}, HashingEncoder())
+    write_store(sys.argv[1], demo)
+    print(f"wrote {demo.n_reviews} reviews for {demo.n_items} restaurants to {sys.argv[1]}")
@@ -0,0 +1,22 @@
+"""Text encoder of the RA-Rec demo, from the shared ``common/encoder.py``.
+
+The apps import their modules as top-level siblings (``streamlit run``
+puts only the app directory on ``sys.path``), so this module adds the
+repository root before importing the shared implementation.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+from common.encoder import (
+    DEFAULT_DIM,
+    CachedEncoder,
+    EmbeddingCache,
+    HashingEncoder,
+    normalize_query,
+    stem,
+    tokenize,
+)
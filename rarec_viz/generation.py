@@ -0,0 +1,140 @@
+"""Grounded response generation with streaming and latency metrics.
+
+A backend turns a generation request into a stream of text chunks:
+
+    request = {
+        "item": "Washoku Bistro",
+        "metadata": {...},               # restaurant record
+        "reviews": ["...", ...],         # top retrieved reviews
+        "state": {...},                  # semi-structured dialogue state
+        "alternatives": ["Tokyo Express"],
+        "preamble": "",                  # optional fixed opening sentence
+        "question": "",                  # set for review-grounded QA answers
+    }
+
+``StubBackend`` answers from a template so the demo works offline.
+``OpenAIBackend`` sends ``build_prompt(request)`` to a chat-completions model
+and needs the optional ``openai`` package. Wrap any stream in ``TimedStream``
+to record time-to-first-token and total generation time.
+"""
+import os
+import time
+
+DEFAULT_BACKEND = os.environ.get("RAREC_LLM_BACKEND", "stub")
+
+
+def build_prompt(request):
+    """Prompt for an LLM backend: metadata + top reviews + dialogue state."""
+    metadata = "\n".join(f"- {key}: {value}" for key, value in request["metadata"].items())
+    reviews = "\n".join(f'- Review {i}: "{text}"' for i, text in enumerate(request["reviews"], 1))
+    if request.get("question"):
+        task = f"Answer the user's question about {request['item']}: \"{request['question']}\""
+    else:
+        task = f"Recommend {request['item']} to the user in two or three sentences."
+    lines = [
+        "You are a conversational restaurant recommender.",
+        task,
+        "Only use facts from the metadata and reviews below.",
+        f"User preferences: {request['state']}",
+        f"Metadata:\n{metadata}",
+        f"Reviews:\n{reviews}",
+    ]
+    if request.get("alternatives"):
+        lines.append(f"Briefly mention {', '.join(request['alternatives'])} as another option.")
+    if request.get("preamble"):
+        lines.append(f'Start the reply with: "{request["preamble"]}"')
+    return "\n\n".join(lines)
+
+
+class StubBackend:
+    """Deterministic template backend that streams word by word."""
+
+    name = "stub"
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+
+    def respond(self, request):
+        soft = [v for values in request["state"].get("soft_constraints", {}).values() for v in values]
+        parts = [request["preamble"]] if request.get("preamble") else []
+        if request.get("question"):
+            if request["reviews"]:
+                parts.append(f"I don't have that listed for **{request['item']}**, "
+                             f'but a reviewer mentions: "{request["reviews"][0]}"')
+            else:
+                parts.append(f"Sorry, I don't know that about **{request['item']}**.")
+            return " ".join(parts)
+        parts.append(f"How about trying **{request['item']}**?")
+        if soft:
+            parts.append(f"It fits what you asked for ({', '.join(soft)}).")
+        if request["reviews"]:
+            parts.append(f'One reviewer says: "{request["reviews"][0]}"')
+        if request.get("alternatives"):
+            parts.append(f"If you'd like another option, {' or '.join(request['alternatives'])} is also a good match.")
+        return " ".join(parts)
+
+    def stream(self, request):
+        words = self.respond(request).split(" ")
+        for i, word in enumerate(words):
+            if self.delay:
+                time.sleep(self.delay)
+            yield word if i == 0 else " " + word
+
+
+class OpenAIBackend:
+    """Streams from an OpenAI-compatible chat-completions endpoint."""
+
+    name = "openai"
+
+    def __init__(self, model=None):
+        from openai import OpenAI  # optional dependency
+
+        self.client = OpenAI()
+        self.model = model or os.environ.get("RAREC_LLM_MODEL", "gpt-4o-mini")
+
+    def stream(self, request):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": build_prompt(request)}],
+            stream=True,
+        )
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+BACKENDS = {"stub": StubBackend, "openai": OpenAIBackend}
+
+
+def get_backend(name=DEFAULT_BACKEND):
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"unknown LLM backend {name!r}; choose from {sorted(BACKENDS)}") from None
+
+
+class TimedStream:
+    """Iterator wrapper recording time-to-first-token and total time (ms)."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._start = None
+        self.ttft_ms = None
+        self.total_ms = None
+        self.text = ""
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._start is None:
+            self._start = time.perf_counter()
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self.total_ms = 1000 * (time.perf_counter() - self._start)
+            raise
+        if self.ttft_ms is None:
+            self.ttft_ms = 1000 * (time.perf_counter() - self._start)
+        self.text += chunk
+        return chunk
@@ -0,0 +1,119 @@
+"""Uniform-grid spatial index for location-constrained recommendation.
+
+Items are bucketed into cells of about ``cell_km`` x ``cell_km``: rows of
+constant latitude, columns of constant longitude scaled at the corpus' mean
+latitude. Only occupied cells are stored, as sorted cell ids with per-cell
+offsets into the items sorted by cell, the same layout as the review
+matrix. A radius query takes the exact latitude/longitude bounding box of
+the circle, reads the occupied cells inside it and checks great-circle
+(haversine) distances on those few items, so results stay exact at any
+extent. Items without coordinates (NaN) are never returned. The result is
+a set of item positions that narrows the hard-constraint candidates before
+any review is scored.
+"""
+import numpy as np
+
+from metadata_index import normalize_value
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def geocode(location, gazetteer):
+    """``(lat, lon)`` for a free-text location, or ``None`` if unknown.
+
+    Stand-in for a geocoding service: exact match on the normalised text,
+    then the longest gazetteer entry contained in it.
+    """
+    if not location:
+        return None
+    text = normalize_value(location)
+    if text in gazetteer:
+        return gazetteer[text]
+    matches = [name for name in gazetteer if name in text]
+    return gazetteer[max(matches, key=len)] if matches else None
+
+
+def haversine_km(lat, lon, lats, lons):
+    """Great-circle distances (km) from ``(lat, lon)`` to each of ``lats``/``lons``, all in radians."""
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GridIndex:
+    """Items bucketed into cells of about ``cell_km`` x ``cell_km``."""
+
+    def __init__(self, lats, lons, cell_km=1.0):
+        self.lats = np.radians(np.asarray(lats, dtype=np.float64))
+        self.lons = np.radians(np.asarray(lons, dtype=np.float64))
+        self.cell_km = cell_km
+        located = np.flatnonzero(np.isfinite(self.lats) & np.isfinite(self.lons))
+        self.n_located = len(located)
+        # Row height and column width in radians; columns are ``cell_km``
+        # wide at the mean latitude.
+        self._dlat = cell_km / EARTH_RADIUS_KM
+        lat0 = self.lats[located].mean() if len(located) else 0.0
+        self._dlon = self._dlat / max(np.cos(lat0), 1e-6)
+        self._n_cols = int(np.floor(np.pi / self._dlon)) - int(np.floor(-np.pi / self._dlon)) + 1
+        cell_id = self._cell_ids(self._row(self.lats[located]), self._col(self.lons[located]))
+        by_cell = np.argsort(cell_id, kind="stable")
+        self.order = located[by_cell]
+        self.cells, counts = np.unique(cell_id[by_cell], return_counts=True)
+        self.cell_offsets = np.zeros(len(self.cells) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.cell_offsets[1:])
+
+    def _row(self, lats):
+        return np.floor(lats / self._dlat).astype(np.int64)
+
+    def _col(self, lons):
+        return np.floor(lons / self._dlon).astype(np.int64) - int(np.floor(-np.pi / self._dlon))
+
+    def _cell_ids(self, rows, cols):
+        return rows * self._n_cols + cols
+
+    def _items_in_box(self, lat_lo, lat_hi, lon_ranges):
+        rows = np.arange(self._row(lat_lo), self._row(lat_hi) + 1)
+        chunks = []
+        for lon_lo, lon_hi in lon_ranges:
+            # Cells of one row are contiguous in id order: one slice per row.
+            lo = np.searchsorted(self.cells, self._cell_ids(rows, self._col(lon_lo)))
+            hi = np.searchsorted(self.cells, self._cell_ids(rows, self._col(lon_hi)), side="right")
+            chunks.extend(self.order[self.cell_offsets[a]:self.cell_offsets[b]] for a, b in zip(lo, hi) if a < b)
+        return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int64)
+
+    def _candidates(self, lat, lon, radius_km):
+        """Items in the latitude/longitude bounding box of the circle around ``(lat, lon)``."""
+        delta = radius_km / EARTH_RADIUS_KM
+        lat_lo, lat_hi = lat - delta, lat + delta
+        if lat_lo <= -np.pi / 2 or lat_hi >= np.pi / 2:
+            # The circle covers a pole: every longitude is in reach.
+            return self._items_in_box(max(lat_lo, -np.pi / 2), min(lat_hi, np.pi / 2), [(-np.pi, np.pi)])
+        dlon = np.arcsin(min(np.sin(delta) / np.cos(lat), 1.0))
+        lon_lo, lon_hi = lon - dlon, lon + dlon
+        if lon_lo < -np.pi:
+            ranges = [(lon_lo + 2 * np.pi, np.pi), (-np.pi, lon_hi)]
+        elif lon_hi > np.pi:
+            ranges = [(lon_lo, np.pi), (-np.pi, lon_hi - 2 * np.pi)]
+        else:
+            ranges = [(lon_lo, lon_hi)]
+        return self._items_in_box(lat_lo, lat_hi, ranges)
+
+    def within_radius(self, point, radius_km):
+        """Sorted positions of items within ``radius_km`` of ``(lat, lon)``."""
+        lat, lon = np.radians(point)
+        items = self._candidates(lat, lon, radius_km)
+        dist = haversine_km(lat, lon, self.lats[items], self.lons[items])
+        return np.sort(items[dist <= radius_km])
+
+    def nearest(self, point, k):
+        """Positions and distances (km) of the ``k`` items closest to ``(lat, lon)``."""
+        lat, lon = np.radians(point)
+        k = min(k, self.n_located)
+        radius = self.cell_km
+        while True:
+            items = self._candidates(lat, lon, radius)
+            dist = haversine_km(lat, lon, self.lats[items], self.lons[items])
+            # Anything within ``radius`` is guaranteed to be in the box.
+            if (dist <= radius).sum() >= k or len(items) == self.n_located:
+                top = np.argsort(dist, kind="stable")[:k]
+                return items[top], dist[top]
+            radius *= 2
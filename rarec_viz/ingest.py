@@ -0,0 +1,270 @@
+"""Streaming, resumable ingestion into an embedding store.
+
+    python ingest.py reviews.jsonl store/ [--workers 8] [--batch-size 512]
+
+The source is JSONL with one document per line (``{"item_id": ..., "text":
+...}``), grouped by item: a review, or a WikiVoyage page. Each document flows
+through generators, so memory stays bounded by a few batches whatever the
+corpus size:
+
+    read -> clean -> chunk -> batch -> encode (process pool) -> append
+
+Batches hold whole documents. A process pool encodes them with at most
+``2 * workers`` batches in flight, and the results are appended in source
+order. Rows go straight into ``embeddings.npy`` of the store directory
+(format as in ``embedding_store``), passage texts into ``texts.jsonl`` and
+their byte offsets into ``text_offsets.npy``. Each new item appends its id
+to ``item_ids.jsonl`` and its first row to ``offsets.npy``. After every
+batch, ``ingest.json`` records how many rows and items are durable, the
+sizes of the text files and the byte offset in the source after the batch's
+last document. A rerun of an interrupted ingest truncates anything past that
+point and continues from the recorded offset. ``finalize`` closes the offset
+arrays, writes the final ``.npy`` headers and ``items.json``. Only then does
+``open_store`` accept the directory.
+"""
+import html
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from embedding_store import (EMBEDDINGS_FILE, ITEMS_FILE, OFFSETS_FILE, STORE_DTYPE, TEXT_OFFSETS_FILE, TEXTS_FILE,
+                             StoreError)
+
+CHECKPOINT_FILE = "ingest.json"
+ITEM_IDS_FILE = "item_ids.jsonl"
+# Fixed .npy header size, so the header can be rewritten in place with the
+# final shape once the number of rows is known.
+HEADER_BYTES = 128
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_SPACE_RE = re.compile(r"\s+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def read_documents(path, start=0):
+    """Yield ``(end_offset, record)`` for each JSONL line from byte ``start``."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        for line in iter(f.readline, b""):
+            if line.strip():
+                yield f.tell(), json.loads(line)
+
+
+def clean(text):
+    """Strip markup and collapse whitespace."""
+    return _SPACE_RE.sub(" ", _TAG_RE.sub(" ", html.unescape(text))).strip()
+
+
+def chunk(text, max_words=120):
+    """Split ``text`` into passages of whole sentences, each at most ``max_words`` words.
+
+    A single sentence longer than ``max_words`` becomes a passage of its own.
+    """
+    passages, current, length = [], [], 0
+    for sentence in _SENTENCE_RE.split(text):
+        words = len(sentence.split())
+        if current and length + words > max_words:
+            passages.append(" ".join(current))
+            current, length = [], 0
+        current.append(sentence)
+        length += words
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+def batches(documents, batch_size=512, max_words=120):
+    """Group cleaned, chunked documents into batches of about ``batch_size`` passages.
+
+    Yields ``(end_offset, item_ids, texts)``. ``end_offset`` is the source
+    position after the batch's last document, and ``item_ids`` holds one
+    entry per passage.
+    """
+    item_ids, texts, end = [], [], None
+    for end, record in documents:
+        text = clean(record.get("text", ""))
+        if not text:
+            continue
+        for passage in chunk(text, max_words):
+            item_ids.append(str(record["item_id"]))
+            texts.append(passage)
+        if len(texts) >= batch_size:
+            yield end, item_ids, texts
+            item_ids, texts = [], []
+    if texts or end is not None:
+        yield end, item_ids, texts
+
+
+def _encode(encoder, texts):
+    return encoder.encode(texts).astype(STORE_DTYPE) if texts else np.empty((0, encoder.dim), STORE_DTYPE)
+
+
+def _npy_header(shape, dtype=STORE_DTYPE):
+    header = f"{{'descr': '{dtype.str}', 'fortran_order': False, 'shape': {tuple(shape)}, }}"
+    prefix = b"\x93NUMPY\x01\x00" + (HEADER_BYTES - 10).to_bytes(2, "little")
+    return prefix + header.ljust(HEADER_BYTES - 11).encode("latin1") + b"\n"
+
+
+class Ingestor:
+    """Appends encoded passages to the store under ``path`` with checkpoints.
+
+    Every per-row and per-item record goes to an append-only file, so a
+    checkpoint only stores counts and byte sizes and costs the same at any
+    corpus size.
+    """
+
+    def __init__(self, path, source, dim):
+        self.path = path
+        self.source = os.path.abspath(source)
+        self.dim = dim
+        os.makedirs(path, exist_ok=True)
+        self.state = state = self._load_checkpoint()
+        if state["done"]:
+            # Finished store: the checkpoint sizes leave out the closing
+            # offsets written by ``finalize``, so nothing may be truncated.
+            return
+        # Drop anything written after the last checkpoint.
+        self._rows = self._open(EMBEDDINGS_FILE, HEADER_BYTES + state["n_rows"] * dim * STORE_DTYPE.itemsize)
+        self._texts = self._open(TEXTS_FILE, state["texts_bytes"])
+        self._text_offsets = self._open(TEXT_OFFSETS_FILE, HEADER_BYTES + 8 * state["n_rows"])
+        self._offsets = self._open(OFFSETS_FILE, HEADER_BYTES + 8 * state["n_items"])
+        self._item_ids = self._open(ITEM_IDS_FILE, state["item_ids_bytes"])
+        self._item_ids.seek(0)
+        seen = [json.loads(line) for line in self._item_ids]
+        self._seen, self._last = set(seen), seen[-1] if seen else None
+        self._rows.seek(0)
+        self._rows.write(_npy_header((state["n_rows"], dim)))
+        for f in self._files:
+            f.seek(0, os.SEEK_END)
+
+    @property
+    def _files(self):
+        return self._rows, self._texts, self._text_offsets, self._offsets, self._item_ids
+
+    def _open(self, name, size):
+        f = open(os.path.join(self.path, name), "r+b" if self.state["n_rows"] else "w+b")
+        f.truncate(size)
+        return f
+
+    def _load_checkpoint(self):
+        fresh = {"source": self.source, "dim": self.dim, "offset": 0, "n_rows": 0, "texts_bytes": 0,
+                 "n_items": 0, "item_ids_bytes": 0, "done": False}
+        try:
+            with open(os.path.join(self.path, CHECKPOINT_FILE), encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return fresh
+        if state["source"] != self.source or state["dim"] != self.dim:
+            raise StoreError(f"{self.path} holds an ingest of {state['source']} (dim {state['dim']}); "
+                             "use a new directory")
+        return state
+
+    def _save_checkpoint(self):
+        tmp = os.path.join(self.path, CHECKPOINT_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.path, CHECKPOINT_FILE))
+
+    def append(self, end_offset, item_ids, texts, embeddings):
+        """Append one encoded batch and checkpoint it."""
+        state = self.state
+        starts = []
+        for i, item_id in enumerate(item_ids):
+            if item_id != self._last:
+                if item_id in self._seen:
+                    raise StoreError(f"item {item_id!r} is not contiguous; group the source by item_id")
+                self._seen.add(item_id)
+                self._last = item_id
+                self._item_ids.write(json.dumps(item_id).encode("utf-8") + b"\n")
+                starts.append(state["n_rows"] + i)
+        self._rows.write(np.ascontiguousarray(embeddings).tobytes())
+        self._offsets.write(np.array(starts, dtype="<i8").tobytes())
+        text_starts = []
+        for text in texts:
+            text_starts.append(self._texts.tell())
+            self._texts.write(json.dumps(text).encode("utf-8") + b"\n")
+        self._text_offsets.write(np.array(text_starts, dtype="<i8").tobytes())
+        for f in self._files:
+            f.flush()
+            os.fsync(f.fileno())
+        state["n_rows"] += len(texts)
+        state["n_items"] += len(starts)
+        state["texts_bytes"] = self._texts.tell()
+        state["item_ids_bytes"] = self._item_ids.tell()
+        state["offset"] = end_offset
+        self._save_checkpoint()
+
+    def finalize(self):
+        """Close the offset arrays, write the final headers and ``items.json``; the store is then openable."""
+        state = self.state
+        self._offsets.write(np.array([state["n_rows"]], dtype="<i8").tobytes())
+        self._text_offsets.write(np.array([state["texts_bytes"]], dtype="<i8").tobytes())
+        for f, shape, dtype in ((self._rows, (state["n_rows"], self.dim), STORE_DTYPE),
+                                (self._offsets, (state["n_items"] + 1,), np.dtype("<i8")),
+                                (self._text_offsets, (state["n_rows"] + 1,), np.dtype("<i8"))):
+            f.seek(0)
+            f.write(_npy_header(shape, dtype))
+        self._item_ids.seek(0)
+        item_ids = [json.loads(line) for line in self._item_ids]
+        for f in self._files:
+            f.close()
+        with open(os.path.join(self.path, ITEMS_FILE), "w", encoding="utf-8") as f:
+            json.dump({"n_reviews": state["n_rows"], "dim": self.dim, "dtype": STORE_DTYPE.str,
+                       "item_ids": item_ids}, f)
+        state["done"] = True
+        self._save_checkpoint()
+
+
+def ingest(source, path, encoder, batch_size=512, max_words=120, workers=None, max_batches=None):
+    """Stream ``source`` into the store at ``path``, resuming a previous run.
+
+    ``max_batches`` stops early without finalizing, which simulates an
+    interruption. Returns the checkpoint state.
+    """
+    ingestor = Ingestor(path, source, encoder.dim)
+    if ingestor.state["done"]:
+        return ingestor.state
+    stream = batches(read_documents(source, ingestor.state["offset"]), batch_size, max_words)
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as pool:
+        pending, written = [], 0
+        for end, item_ids, texts in stream:
+            pending.append((end, item_ids, texts, pool.submit(_encode, encoder, texts)))
+            # Keep a bounded window in flight and append strictly in order.
+            while len(pending) > 2 * workers or (pending and pending[0][3].done()):
+                end, item_ids, texts, future = pending.pop(0)
+                ingestor.append(end, item_ids, texts, future.result())
+                written += 1
+                if max_batches is not None and written >= max_batches:
+                    for *_, rest in pending:
+                        rest.cancel()
+                    return ingestor.state
+        for end, item_ids, texts, future in pending:
+            ingestor.append(end, item_ids, texts, future.result())
+    ingestor.finalize()
+    return ingestor.state
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from encoder import HashingEncoder
+
+    parser = argparse.ArgumentParser(description="Stream a JSONL corpus into an embedding store.")
+    parser.add_argument("source", help="JSONL with item_id and text, grouped by item_id")
+    parser.add_argument("store", help="store directory (resumed if it holds a checkpoint)")
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--max-words", type=int, default=120, help="passage length limit")
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    state = ingest(args.source, args.store, HashingEncoder(), args.batch_size, args.max_words, args.workers)
+    print(f"{state['n_rows']} passages for {state['n_items']} items in {args.store} "
+          f"({time.perf_counter() - start:.1f}s)")
@@ -0,0 +1,89 @@
+"""Bitmap index over restaurant metadata for hard-constraint filtering.
+
+Every ``(field, value)`` pair keeps a precomputed bitset with one bit per
+item, packed into ``uint64`` words. A hard-constraint query ORs the bitsets
+of the values listed for a field and ANDs the fields together, so filtering
+costs a handful of word-wise operations instead of a DataFrame scan.
+"""
+import numpy as np
+
+
+def normalize_value(value):
+    return " ".join(str(value).lower().split())
+
+
+class BitmapIndex:
+    """Per-value bitsets over a fixed list of items."""
+
+    def __init__(self, item_ids, fields):
+        self.item_ids = list(item_ids)
+        self.fields = tuple(fields)
+        self.n_words = (len(self.item_ids) + 63) // 64
+        self._bitsets = {field: {} for field in self.fields}
+        self._all = self._pack(np.arange(len(self.item_ids)))
+
+    @classmethod
+    def from_records(cls, records, fields, id_field="name"):
+        """Index ``records`` (dicts) on ``fields``; list values are multi-valued."""
+        index = cls([record[id_field] for record in records], fields)
+        postings = {field: {} for field in fields}
+        for position, record in enumerate(records):
+            for field in fields:
+                values = record.get(field, [])
+                if isinstance(values, str):
+                    values = [values]
+                for value in values:
+                    postings[field].setdefault(normalize_value(value), []).append(position)
+        for field, by_value in postings.items():
+            for value, positions in by_value.items():
+                index._bitsets[field][value] = index._pack(positions)
+        return index
+
+    def _pack(self, positions):
+        positions = np.asarray(positions, dtype=np.uint64)
+        words = np.zeros(self.n_words, dtype=np.uint64)
+        np.bitwise_or.at(words, positions >> np.uint64(6), np.uint64(1) << (positions & np.uint64(63)))
+        return words
+
+    def all_items(self):
+        """Bitset with every item set."""
+        return self._all.copy()
+
+    def bitset_of(self, positions):
+        """Bitset with exactly ``positions`` set, e.g. to pass as ``within``."""
+        return self._pack(positions)
+
+    def values(self, field):
+        return sorted(self._bitsets[field])
+
+    def bitset(self, field, values):
+        """OR of the bitsets of ``values`` in ``field`` (unknown values match nothing)."""
+        words = np.zeros(self.n_words, dtype=np.uint64)
+        for value in values:
+            bits = self._bitsets[field].get(normalize_value(value))
+            if bits is not None:
+                words |= bits
+        return words
+
+    def match(self, constraints, within=None):
+        """Bitset of items satisfying every field in ``constraints``.
+
+        ``constraints`` maps field -> accepted values, e.g. the
+        ``hard_constraints`` of the dialogue state. Fields this index does not
+        cover are left to later stages. ``within`` optionally restricts the
+        result to an existing bitset.
+        """
+        words = self._all.copy() if within is None else within.copy()
+        for field, values in constraints.items():
+            if field in self._bitsets and values:
+                words &= self.bitset(field, values)
+        return words
+
+    def positions(self, words):
+        """Sorted item positions set in ``words``."""
+        bits = np.unpackbits(words.astype("<u8", copy=False).view(np.uint8), bitorder="little")
+        return np.flatnonzero(bits[: len(self.item_ids)])
+
+    def query(self, constraints, within=None):
+        """Item positions satisfying ``constraints``, ready for scoring."""
+        return self.positions(self.match(constraints, within))
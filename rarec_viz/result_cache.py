@@ -0,0 +1,84 @@
+"""Process-wide retrieval result cache keyed on the canonical dialogue state.
+
+Two states that differ only in value order, case, whitespace or duplicates
+map to the same key, so popular requests ("Japanese / sushi / casual") are
+scored once and served from memory to every session. Entries expire after
+``ttl`` seconds and the least recently used entry is evicted beyond
+``max_entries``. Streamlit runs each session's script in its own thread, so
+all access goes through one lock.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from metadata_index import normalize_value
+
+
+def canonical_state(state):
+    """Hashable, order-insensitive form of the semi-structured state."""
+    def constraints(part):
+        return tuple(sorted(
+            (field, tuple(sorted({normalize_value(v) for v in values})))
+            for field, values in state.get(part, {}).items() if values
+        ))
+
+    location = state.get("location")
+    return (
+        constraints("hard_constraints"),
+        constraints("soft_constraints"),
+        normalize_value(location) if location else None,
+    )
+
+
+class ResultCache:
+    """Thread-safe LRU cache with per-entry TTL and hit/miss counters."""
+
+    def __init__(self, max_entries=1024, ttl=600.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Cached value for ``key`` or ``None`` (counts a hit or a miss)."""
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
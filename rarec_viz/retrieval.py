@@ -0,0 +1,249 @@
+"""Late-fusion review retrieval for RA-Rec.
+
+All review embeddings live in one contiguous ``(n_reviews, dim)`` matrix.
+Reviews of the same restaurant are stored back to back, so restaurant ``i``
+owns rows ``offsets[i]:offsets[i + 1]``. Scoring a query is one matmul over
+the rows of the candidate restaurants, and the per-restaurant top-k mean is a
+segmented partial sort over the resulting score vector.
+
+``ReviewIndex.rank_streaming`` is the out-of-core variant. It streams the
+(typically memory-mapped) matrix in fixed-size row blocks and folds each
+block into a running ``(n_items, k)`` array of best scores. Peak memory is
+one block plus ``n_items * k`` values, whatever the corpus size. Use it for
+memory-mapped stores and for anything with ``STREAMING_MIN_REVIEWS`` reviews
+or more (``out_of_core``); ``RetrievalSession`` does so by default.
+"""
+import numpy as np
+
+from topk import segmented_topk
+
+# Rows converted to float32 at a time when scoring a float16 (e.g.
+# memory-mapped) matrix, so the temporary copy stays small.
+SCORE_BLOCK_ROWS = 65536
+# From this size on, ``RetrievalSession`` ranks with ``rank_streaming``
+# instead of caching a float32 score per review in every session.
+STREAMING_MIN_REVIEWS = 1_000_000
+
+
+def state_to_query(state):
+    """Flatten the semi-structured state into the retrieval query text."""
+    parts = []
+    for values in state.get("hard_constraints", {}).values():
+        parts.extend(values)
+    for values in state.get("soft_constraints", {}).values():
+        parts.extend(values)
+    return ", ".join(parts)
+
+
+def segment_rows(offsets, segments):
+    """Concatenated row ranges of ``segments`` plus their local offsets."""
+    segments = np.asarray(segments, dtype=np.int64)
+    starts = offsets[segments]
+    counts = offsets[segments + 1] - starts
+    local = np.zeros(len(segments) + 1, dtype=np.int64)
+    np.cumsum(counts, out=local[1:])
+    # Row r of the output is starts[seg] + (r - local[seg]) for its segment.
+    rows = np.arange(local[-1], dtype=np.int64)
+    rows += np.repeat(starts - local[:-1], counts)
+    return rows, local
+
+
+def dot_rows(block, query_vec):
+    """``block @ query_vec`` in float32, upcasting ``block`` chunk by chunk."""
+    if block.dtype == np.float32:
+        return block @ query_vec
+    out = np.empty(len(block), dtype=np.float32)
+    for start in range(0, len(block), SCORE_BLOCK_ROWS):
+        stop = start + SCORE_BLOCK_ROWS
+        out[start:stop] = block[start:stop].astype(np.float32) @ query_vec
+    return out
+
+
+def take_top(values, top, fill):
+    """``values[top]`` with ``fill`` where ``top`` is ``-1`` padding.
+
+    Works when ``values`` is empty (every segment empty), where plain fancy
+    indexing of the padding would raise.
+    """
+    if len(values) == 0:
+        return np.full(top.shape, fill, dtype=np.result_type(values.dtype, fill))
+    return np.where(top >= 0, values[np.maximum(top, 0)], fill)
+
+
+def segmented_topk_mean(scores, offsets, k):
+    """Mean of the top-``k`` scores per segment (NaN for empty segments)."""
+    top = segmented_topk(scores, offsets, k)
+    valid = top >= 0
+    values = take_top(scores, top, 0.0)
+    n = valid.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return values.sum(axis=1) / n, top
+
+
+def late_fusion(items, rows, scores, local, k=3):
+    """``ItemRanking`` of ``items`` by the mean of their top-``k`` review scores.
+
+    Item ``i`` owns ``rows``/``scores`` entries ``local[i]:local[i + 1]``.
+    """
+    items = np.asarray(items, dtype=np.int64)
+    item_scores, top = segmented_topk_mean(scores, local, k)
+    top_rows = take_top(rows, top, -1)
+    order = np.argsort(-item_scores, kind="stable")
+    return ItemRanking(items[order], item_scores[order], top_rows[order], rows, scores)
+
+
+class ItemRanking:
+    """Item scores and the reviews that produced them, best item first."""
+
+    def __init__(self, items, scores, top_rows, rows, review_scores):
+        self.items = items                  # item positions in the index
+        self.scores = scores                # late-fusion item scores
+        self.top_rows = top_rows            # (n_items, k) review rows, -1 padded
+        self.rows = rows                    # every review row that was scored
+        self.review_scores = review_scores  # score of each row in ``rows``
+
+    def __len__(self):
+        return len(self.items)
+
+
+class ReviewIndex:
+    """Contiguous review-embedding matrix with per-restaurant offsets."""
+
+    # Immutable: row numbers never change. ``SegmentedIndex`` bumps its
+    # generation whenever its rows are renumbered.
+    generation = 0
+
+    def __init__(self, embeddings, offsets, item_ids, texts=None):
+        offsets = np.asarray(offsets, dtype=np.int64)
+        if offsets.ndim != 1 or len(offsets) != len(item_ids) + 1:
+            raise ValueError("offsets must have one entry per item plus one")
+        if offsets[0] != 0 or offsets[-1] != len(embeddings) or np.any(np.diff(offsets) < 0):
+            raise ValueError("offsets must be non-decreasing from 0 to n_reviews")
+        self.embeddings = embeddings
+        self.offsets = offsets
+        self.item_ids = list(item_ids)
+        self.texts = texts
+        self._position = {item_id: i for i, item_id in enumerate(self.item_ids)}
+
+    @classmethod
+    def from_reviews(cls, reviews_by_item, encoder):
+        """Build an index from ``{item_id: [review text, ...]}``."""
+        item_ids = list(reviews_by_item)
+        texts = [text for item_id in item_ids for text in reviews_by_item[item_id]]
+        offsets = np.zeros(len(item_ids) + 1, dtype=np.int64)
+        np.cumsum([len(reviews_by_item[i]) for i in item_ids], out=offsets[1:])
+        return cls(encoder.encode(texts), offsets, item_ids, texts)
+
+    @property
+    def n_items(self):
+        return len(self.item_ids)
+
+    @property
+    def n_reviews(self):
+        return len(self.embeddings)
+
+    @property
+    def out_of_core(self):
+        """Whether to rank with ``rank_streaming``: the matrix is memory-mapped or large."""
+        return isinstance(self.embeddings, np.memmap) or self.n_reviews >= STREAMING_MIN_REVIEWS
+
+    def snapshot(self):
+        """The index as of now; ``self``, since a ``ReviewIndex`` never changes."""
+        return self
+
+    def item_rows(self, items):
+        """Review rows of ``items`` grouped per item, plus the per-item offsets into them."""
+        return segment_rows(self.offsets, items)
+
+    def score_rows(self, rows, query_vec):
+        """Scores of review ``rows`` against ``query_vec``."""
+        return dot_rows(self.embeddings[rows], query_vec)
+
+    def positions(self, item_ids):
+        """Map item ids to their positions in the index."""
+        return np.fromiter((self._position[i] for i in item_ids), dtype=np.int64)
+
+    def item_of_rows(self, rows):
+        """Item position owning each review row."""
+        return np.searchsorted(self.offsets, rows, side="right") - 1
+
+    def score_reviews(self, query_vec, items=None):
+        """Dot product of ``query_vec`` against every review of ``items``.
+
+        ``items`` are item positions (all items when ``None``). Returns the
+        scored review rows, their scores and the segment offsets of ``items``
+        within those arrays.
+        """
+        query_vec = np.asarray(query_vec, dtype=np.float32)
+        if items is None:
+            rows = np.arange(self.n_reviews, dtype=np.int64)
+            local = self.offsets
+            block = self.embeddings
+        else:
+            rows, local = segment_rows(self.offsets, items)
+            block = self.embeddings[rows]
+        scores = dot_rows(block, query_vec)
+        return rows, scores, local
+
+    def rank(self, query_vec, items=None, k=3):
+        """Score reviews, aggregate the top-``k`` per item and sort items."""
+        rows, scores, local = self.score_reviews(query_vec, items)
+        if items is None:
+            items = np.arange(self.n_items, dtype=np.int64)
+        return self.aggregate(items, rows, scores, local, k)
+
+    def aggregate(self, items, rows, scores, local, k=3):
+        """Rank ``items`` from already computed review scores.
+
+        ``rows``/``scores``/``local`` are laid out as returned by
+        ``score_reviews``.
+        """
+        return late_fusion(items, rows, scores, local, k)
+
+    def rank_streaming(self, query_vec, items=None, k=3, block_rows=SCORE_BLOCK_ROWS):
+        """``rank`` in one pass over row blocks with a bounded top-``k`` per item.
+
+        Items may straddle block boundaries. Each block's per-item top-``k``
+        is merged into the running top-``k``. The returned ranking lists only
+        the kept top rows in ``rows``/``review_scores``, not every scored row.
+        """
+        query_vec = np.asarray(query_vec, dtype=np.float32)
+        if items is None:
+            items = np.arange(self.n_items, dtype=np.int64)
+            starts, local = self.offsets[:-1], self.offsets
+        else:
+            items = np.asarray(items, dtype=np.int64)
+            starts = self.offsets[items]
+            local = np.zeros(len(items) + 1, dtype=np.int64)
+            np.cumsum(self.offsets[items + 1] - starts, out=local[1:])
+        contiguous = len(items) == self.n_items and np.array_equal(items, np.arange(self.n_items))
+        best = np.full((len(items), k), -np.inf, dtype=np.float32)
+        best_rows = np.full((len(items), k), -1, dtype=np.int64)
+        for s in range(0, int(local[-1]), block_rows):
+            e = min(s + block_rows, int(local[-1]))
+            first = int(np.searchsorted(local, s, side="right")) - 1
+            last = int(np.searchsorted(local, e, side="left"))
+            if contiguous:
+                rows = np.arange(s, e, dtype=np.int64)
+                block = self.embeddings[s:e]
+            else:
+                seg = np.searchsorted(local, np.arange(s, e), side="right") - 1
+                rows = starts[seg] + (np.arange(s, e) - local[seg])
+                block = self.embeddings[rows]
+            scores = dot_rows(block, query_vec)
+            # Offsets of items first..last-1 clipped to this block.
+            bounds = np.clip(local[first:last + 1], s, e) - s
+            top = segmented_topk(scores, bounds, k)
+            new = take_top(scores, top, -np.inf)
+            new_rows = take_top(rows, top, -1)
+            merged = np.concatenate([best[first:last], new], axis=1)
+            merged_rows = np.concatenate([best_rows[first:last], new_rows], axis=1)
+            keep = np.argsort(-merged, axis=1, kind="stable")[:, :k]
+            best[first:last] = np.take_along_axis(merged, keep, axis=1)
+            best_rows[first:last] = np.take_along_axis(merged_rows, keep, axis=1)
+        finite = np.isfinite(best)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            item_scores = np.where(finite, best, 0.0).sum(axis=1) / finite.sum(axis=1)
+        order = np.argsort(-item_scores, kind="stable")
+        kept = best_rows[order]
+        return ItemRanking(items[order], item_scores[order], kept, kept[kept >= 0], best[order][kept >= 0])
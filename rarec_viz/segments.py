@@ -0,0 +1,500 @@
+"""Append-only review index made of immutable segments.
+
+A segmented index lives in one directory::
+
+    MANIFEST.json        {"segments": ["seg-000001", "seg-000004"], "next_id": 5, "generation": 3}
+    seg-000001/          main segment (an ``embedding_store`` directory)
+    seg-000004/          delta segment with newly ingested reviews
+
+Nothing inside a segment changes after it is written. New reviews become a
+new delta segment, either built by ``add_reviews`` or written by
+``ingest.py`` and registered with ``add_store``. Rewriting ``MANIFEST.json``
+(tmp file + ``os.replace``) makes them visible. Every change of the segment
+list bumps the manifest's ``generation``. ``refresh()`` reloads when the
+generation on disk differs from the loaded one, and ``start_refresher`` runs
+it on a timer, so queries see reviews added by other processes within
+seconds.
+
+A query scores every segment with its own contiguous ``ReviewIndex`` and
+keeps the top-k per item in each. The per-segment candidates are then merged
+into one top-k per item. Compaction merges all current segments into a new
+main segment in a background thread, which the refresher starts once
+enough segments pile up. It then swaps the segment list atomically: readers
+take a reference to the current ``SegmentView`` and never wait on a rebuild. Item positions (first appearance across segments,
+in manifest order) do not change across compaction.
+
+    python segments.py init <dir> [<store>]
+    python segments.py add <dir> <store>       # e.g. the output of ingest.py
+    python segments.py compact <dir>
+"""
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from embedding_store import (EMBEDDINGS_FILE, STORE_DTYPE, open_store, write_metadata, write_store,
+                             write_texts)
+from retrieval import SCORE_BLOCK_ROWS, ItemRanking, ReviewIndex, late_fusion, segment_rows
+from topk import segmented_topk
+
+MANIFEST_FILE = "MANIFEST.json"
+COPY_BLOCK_ROWS = 65536
+
+
+class Segment:
+    """One immutable ``ReviewIndex`` placed in the global row and item space."""
+
+    def __init__(self, name, index, base, item_map, n_global_items):
+        self.name = name
+        self.index = index
+        self.base = base              # global row of the segment's first review
+        self.item_map = item_map      # local item position -> global item position
+        self.local_of = np.full(n_global_items, -1, dtype=np.int64)  # and back, -1 if absent
+        self.local_of[item_map] = np.arange(len(item_map))
+
+
+class SegmentTexts:
+    """Read-only sequence of review texts addressed by global row."""
+
+    def __init__(self, segments, n_reviews):
+        self._segments = segments
+        self._bases = np.array([s.base for s in segments], dtype=np.int64)
+        self._n = n_reviews
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, row):
+        seg = self._segments[int(np.searchsorted(self._bases, row, side="right")) - 1]
+        return seg.index.texts[int(row) - seg.base]
+
+
+class SegmentView:
+    """Immutable snapshot of a ``SegmentedIndex`` at one manifest generation.
+
+    Global rows are numbered segment by segment, so an item's reviews are
+    not contiguous. ``item_rows``, ``score_rows`` and ``aggregate`` give the
+    same surface as ``ReviewIndex`` without relying on contiguous offsets.
+    """
+
+    def __init__(self, segments, position, item_ids, generation):
+        self.segments = segments
+        self.generation = generation
+        self.item_ids = item_ids
+        self._position = position
+        self._bases = np.array([s.base for s in segments], dtype=np.int64)
+
+    def snapshot(self):
+        return self
+
+    @property
+    def out_of_core(self):
+        return any(s.index.out_of_core for s in self.segments)
+
+    @property
+    def n_items(self):
+        return len(self.item_ids)
+
+    @property
+    def n_reviews(self):
+        return self.segments[-1].base + self.segments[-1].index.n_reviews if self.segments else 0
+
+    @property
+    def texts(self):
+        return SegmentTexts(self.segments, self.n_reviews)
+
+    def positions(self, item_ids):
+        return np.fromiter((self._position[i] for i in item_ids), dtype=np.int64)
+
+    def split_rows(self, rows):
+        """Yield ``(segment, mask, local rows)`` for the global ``rows`` in each segment."""
+        rows = np.asarray(rows, dtype=np.int64)
+        seg = np.searchsorted(self._bases, rows, side="right") - 1
+        for s in np.unique(seg):
+            mine = seg == s
+            yield self.segments[s], mine, rows[mine] - self.segments[s].base
+
+    def item_of_rows(self, rows):
+        out = np.empty(len(rows), dtype=np.int64)
+        for seg, mine, local in self.split_rows(rows):
+            out[mine] = seg.item_map[seg.index.item_of_rows(local)]
+        return out
+
+    def item_rows(self, items):
+        """Global review rows of ``items`` grouped per item (in segment order), plus per-item offsets."""
+        items = np.asarray(items, dtype=np.int64)
+        owner, parts = [], []
+        for seg in self.segments:
+            local_items = seg.local_of[items]
+            present = np.flatnonzero(local_items >= 0)
+            rows, local = segment_rows(seg.index.offsets, local_items[present])
+            owner.append(np.repeat(present, np.diff(local)))
+            parts.append(rows + seg.base)
+        owner = np.concatenate(owner) if owner else np.empty(0, np.int64)
+        rows = np.concatenate(parts) if parts else np.empty(0, np.int64)
+        # Stable, so each item keeps its rows in segment order.
+        order = np.argsort(owner, kind="stable")
+        local = np.zeros(len(items) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(owner, minlength=len(items)), out=local[1:])
+        return rows[order], local
+
+    def score_rows(self, rows, query_vec):
+        out = np.empty(len(rows), dtype=np.float32)
+        for seg, mine, local in self.split_rows(rows):
+            out[mine] = seg.index.score_rows(local, query_vec)
+        return out
+
+    def aggregate(self, items, rows, scores, local, k=3):
+        """Rank ``items`` from review scores laid out as returned by ``item_rows``."""
+        return late_fusion(items, rows, scores, local, k)
+
+    def rank(self, query_vec, items=None, k=3):
+        """Rank ``items`` (global positions, all when ``None``) across all segments.
+
+        Each segment contributes its top-``k`` reviews per item. The merged
+        top-``k`` over those candidates equals the top-``k`` over the item's
+        reviews in all segments together.
+        """
+        items = np.arange(self.n_items, dtype=np.int64) if items is None else np.asarray(items, dtype=np.int64)
+        wanted = np.zeros(self.n_items, dtype=bool)
+        wanted[items] = True
+        cand_item, cand_row, cand_score, all_rows, all_scores = [], [], [], [], []
+        for seg in self.segments:
+            local_items = np.flatnonzero(wanted[seg.item_map])
+            if len(local_items) == 0:
+                continue
+            rows, scores, local = seg.index.score_reviews(query_vec, local_items)
+            top = segmented_topk(scores, local, k)
+            valid = top >= 0
+            cand_item.append(np.repeat(seg.item_map[local_items], valid.sum(axis=1)))
+            cand_row.append(rows[top[valid]] + seg.base)
+            cand_score.append(scores[top[valid]])
+            all_rows.append(rows + seg.base)
+            all_scores.append(scores)
+        return _merge_topk(items, cand_item, cand_row, cand_score, all_rows, all_scores, k)
+
+    def rank_streaming(self, query_vec, items=None, k=3, block_rows=SCORE_BLOCK_ROWS):
+        """``rank`` with each segment streamed by ``ReviewIndex.rank_streaming``.
+
+        Like there, the ranking's ``rows`` hold only the kept top rows.
+        """
+        items = np.arange(self.n_items, dtype=np.int64) if items is None else np.asarray(items, dtype=np.int64)
+        wanted = np.zeros(self.n_items, dtype=bool)
+        wanted[items] = True
+        cand_item, cand_row, cand_score = [], [], []
+        for seg in self.segments:
+            local_items = np.flatnonzero(wanted[seg.item_map])
+            if len(local_items) == 0:
+                continue
+            ranking = seg.index.rank_streaming(query_vec, local_items, k, block_rows)
+            valid = ranking.top_rows >= 0
+            cand_item.append(np.repeat(seg.item_map[ranking.items], valid.sum(axis=1)))
+            cand_row.append(ranking.rows + seg.base)
+            cand_score.append(ranking.review_scores)
+        return _merge_topk(items, cand_item, cand_row, cand_score, cand_row, cand_score, k)
+
+
+class SegmentedIndex:
+    """Main segment plus delta segments, searched together.
+
+    Reads go to the current ``SegmentView``. Callers that issue several
+    reads for one result (score, then look up texts) should take
+    ``snapshot()`` once, since a refresh or compaction renumbers rows.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()          # serialises manifest writers
+        self._compacting = threading.Lock()
+        self._compactor = None
+        self._refresher = None
+        self._stop = threading.Event()
+        self._view = SegmentView((), {}, [], None)
+        self._load()
+
+    # --- manifest -----------------------------------------------------------
+
+    @classmethod
+    def create(cls, path, index=None):
+        """New segmented index under ``path``; ``index`` becomes the main segment."""
+        os.makedirs(path, exist_ok=True)
+        manifest = {"segments": [], "next_id": 1, "generation": 0}
+        if index is not None:
+            write_store(os.path.join(path, "seg-000001"), index)
+            manifest = {"segments": ["seg-000001"], "next_id": 2, "generation": 1}
+        _write_manifest(path, manifest)
+        return cls(path)
+
+    def _read_manifest(self):
+        with open(os.path.join(self.path, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+
+    def _load(self, manifest=None):
+        manifest = manifest or self._read_manifest()
+        opened = {s.name: s.index for s in self._view.segments}
+        indexes = [opened.get(name) or open_store(os.path.join(self.path, name)) for name in manifest["segments"]]
+        position, item_ids = {}, []
+        for index in indexes:
+            for item_id in index.item_ids:
+                if item_id not in position:
+                    position[item_id] = len(item_ids)
+                    item_ids.append(item_id)
+        segments, base = [], 0
+        for name, index in zip(manifest["segments"], indexes):
+            item_map = np.fromiter((position[i] for i in index.item_ids), dtype=np.int64, count=index.n_items)
+            segments.append(Segment(name, index, base, item_map, len(item_ids)))
+            base += index.n_reviews
+        # One object, replaced in a single assignment: readers never see a
+        # half-updated index.
+        self._view = SegmentView(tuple(segments), position, item_ids, manifest.get("generation", 0))
+
+    def refresh(self):
+        """Reload the manifest if its generation moved on. Returns True if it did."""
+        with self._lock:
+            manifest = self._read_manifest()
+            if manifest.get("generation", 0) == self._view.generation:
+                return False
+            self._load(manifest)
+        return True
+
+    def start_refresher(self, interval=2.0, compact_at=4):
+        """Refresh every ``interval`` seconds on a daemon thread.
+
+        After each refresh, compaction starts in the background once there
+        are ``compact_at`` segments (never when ``None``). Run compaction in
+        one process per index directory.
+        """
+        if self._refresher and self._refresher.is_alive():
+            return self._refresher
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except (OSError, ValueError):
+                    # A segment vanished under a concurrent compaction, or
+                    # failed validation; the next tick reads the new manifest.
+                    continue
+                if compact_at is not None:
+                    self.compact_in_background(compact_at)
+
+        self._stop.clear()
+        self._refresher = threading.Thread(target=run, name="segment-refresh", daemon=True)
+        self._refresher.start()
+        return self._refresher
+
+    def stop_refresher(self):
+        self._stop.set()
+        if self._refresher:
+            self._refresher.join()
+
+    # --- read side (same surface as ReviewIndex where the app needs it) -----
+
+    def snapshot(self):
+        """The current ``SegmentView``."""
+        return self._view
+
+    @property
+    def generation(self):
+        return self._view.generation
+
+    @property
+    def segments(self):
+        return self._view.segments
+
+    @property
+    def item_ids(self):
+        return self._view.item_ids
+
+    @property
+    def n_items(self):
+        return self._view.n_items
+
+    @property
+    def n_reviews(self):
+        return self._view.n_reviews
+
+    @property
+    def texts(self):
+        return self._view.texts
+
+    def positions(self, item_ids):
+        return self._view.positions(item_ids)
+
+    def item_of_rows(self, rows):
+        return self._view.item_of_rows(rows)
+
+    @property
+    def out_of_core(self):
+        return self._view.out_of_core
+
+    def rank(self, query_vec, items=None, k=3):
+        return self._view.rank(query_vec, items, k)
+
+    def rank_streaming(self, query_vec, items=None, k=3, block_rows=SCORE_BLOCK_ROWS):
+        return self._view.rank_streaming(query_vec, items, k, block_rows)
+
+    # --- write side ---------------------------------------------------------
+
+    def _commit(self, update):
+        """Apply ``update(segment_names) -> segment_names`` and publish atomically.
+
+        ``update`` may return ``None`` to leave the manifest untouched.
+        Returns whether it was published.
+        """
+        with self._lock:
+            manifest = self._read_manifest()
+            names = update(list(manifest["segments"]))
+            if names is None:
+                return False
+            manifest["segments"] = names
+            manifest["generation"] = manifest.get("generation", 0) + 1
+            _write_manifest(self.path, manifest)
+            self._load(manifest)
+        return True
+
+    def _new_segment_dir(self):
+        with self._lock:
+            manifest = self._read_manifest()
+            name = f"seg-{manifest['next_id']:06d}"
+            manifest["next_id"] += 1
+            _write_manifest(self.path, manifest)
+        return name
+
+    def add_reviews(self, reviews_by_item, encoder):
+        """Encode ``{item_id: [text, ...]}`` into a new delta segment."""
+        name = self._new_segment_dir()
+        write_store(os.path.join(self.path, name), ReviewIndex.from_reviews(reviews_by_item, encoder))
+        self._commit(lambda names: names + [name])
+        return name
+
+    def add_store(self, store_path):
+        """Move a finished store directory (e.g. from ``ingest.py``) in as a delta segment."""
+        open_store(store_path)  # validate before publishing
+        name = self._new_segment_dir()
+        shutil.move(store_path, os.path.join(self.path, name))
+        self._commit(lambda names: names + [name])
+        return name
+
+    def compact(self):
+        """Merge all current segments into one new main segment and swap it in.
+
+        Segments added while the merge runs stay as deltas after it. If
+        another writer removed any of the merged segments meanwhile, the
+        merge is discarded.
+        """
+        with self._compacting:
+            view = self._view
+            if len(view.segments) <= 1:
+                return None
+            name = self._new_segment_dir()
+            _merge_segments(os.path.join(self.path, name), view.segments, view.item_ids)
+            merged = {s.name for s in view.segments}
+
+            def update(names):
+                if not merged <= set(names):
+                    return None
+                return [name] + [n for n in names if n not in merged]
+
+            published = self._commit(update)
+            # Open memory maps of old segments stay valid after unlinking.
+            for old in merged if published else [name]:
+                shutil.rmtree(os.path.join(self.path, old), ignore_errors=True)
+            return name if published else None
+
+    def compact_in_background(self, min_segments=2):
+        """Start ``compact`` on a daemon thread unless one is running already."""
+        if len(self.segments) < min_segments or (self._compactor and self._compactor.is_alive()):
+            return None
+        self._compactor = threading.Thread(target=self.compact, name="segment-compaction", daemon=True)
+        self._compactor.start()
+        return self._compactor
+
+
+def _write_manifest(path, manifest):
+    tmp = os.path.join(path, MANIFEST_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(path, MANIFEST_FILE))
+
+
+def _merge_topk(items, cand_item, cand_row, cand_score, all_rows, all_scores, k):
+    """Per-item top-``k`` mean over the per-segment candidates."""
+    cand_item = np.concatenate(cand_item) if cand_item else np.empty(0, np.int64)
+    cand_row = np.concatenate(cand_row) if cand_row else np.empty(0, np.int64)
+    cand_score = np.concatenate(cand_score) if cand_score else np.empty(0, np.float32)
+    order = np.lexsort((-cand_score, cand_item))
+    cand_item, cand_row, cand_score = cand_item[order], cand_row[order], cand_score[order]
+    starts = np.searchsorted(cand_item, items, side="left")
+    stops = np.searchsorted(cand_item, items, side="right")
+    counts = np.minimum(stops - starts, k)
+    top_rows = np.full((len(items), k), -1, dtype=np.int64)
+    sums = np.zeros(len(items))
+    for j in range(k):
+        has = counts > j
+        top_rows[has, j] = cand_row[starts[has] + j]
+        sums[has] += cand_score[starts[has] + j]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scores = sums / counts
+    rank = np.argsort(-scores, kind="stable")
+    rows = np.concatenate(all_rows) if all_rows else np.empty(0, np.int64)
+    review_scores = np.concatenate(all_scores) if all_scores else np.empty(0, np.float32)
+    return ItemRanking(items[rank], scores[rank], top_rows[rank], rows, review_scores)
+
+
+def _merge_segments(path, segments, item_ids):
+    """Write ``segments`` as one store with each item's rows contiguous, in ``item_ids`` order."""
+    owner = np.concatenate([s.item_map[s.index.item_of_rows(np.arange(s.index.n_reviews))] for s in segments])
+    # Stable by item, so reviews keep segment (i.e. arrival) order per item.
+    order = np.argsort(owner, kind="stable")
+    dim = segments[0].index.embeddings.shape[1]
+    os.makedirs(path, exist_ok=True)
+    out = np.lib.format.open_memmap(os.path.join(path, EMBEDDINGS_FILE), mode="w+",
+                                    dtype=STORE_DTYPE, shape=(len(order), dim))
+    dest = np.empty(len(order), dtype=np.int64)
+    dest[order] = np.arange(len(order))
+    for seg in segments:
+        for start in range(0, seg.index.n_reviews, COPY_BLOCK_ROWS):
+            stop = min(start + COPY_BLOCK_ROWS, seg.index.n_reviews)
+            out[dest[seg.base + start:seg.base + stop]] = seg.index.embeddings[start:stop]
+    out.flush()
+    del out
+    offsets = np.zeros(len(item_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(owner, minlength=len(item_ids)), out=offsets[1:])
+    if all(s.index.texts is not None for s in segments):
+        texts = SegmentTexts(segments, len(order))
+        write_texts(path, (texts[row] for row in order))
+    merged = ReviewIndex(np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r"), offsets, item_ids)
+    write_metadata(path, merged)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage a segmented review index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("init", help="create an index, optionally from an existing store")
+    p.add_argument("dir")
+    p.add_argument("store", nargs="?")
+    p = sub.add_parser("add", help="move a finished store in as a delta segment")
+    p.add_argument("dir")
+    p.add_argument("store")
+    p = sub.add_parser("compact", help="merge all segments into one")
+    p.add_argument("dir")
+    args = parser.parse_args()
+
+    if args.command == "init":
+        index = SegmentedIndex.create(args.dir)
+        if args.store:
+            index.add_store(args.store)
+    else:
+        index = SegmentedIndex(args.dir)
+        if args.command == "add":
+            index.add_store(args.store)
+        else:
+            index.compact()
+    print(f"{args.dir}: {len(index.segments)} segments, {index.n_items} items, {index.n_reviews} reviews")
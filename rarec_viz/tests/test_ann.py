@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from ann import IVFIndex, synthetic_index
+
+
+@pytest.fixture(scope="module")
+def index():
+    return synthetic_index(n_items=400, reviews_per_item=6, dim=32, n_topics=16)
+
+
+@pytest.fixture(scope="module")
+def ivf(index):
+    return IVFIndex(index, n_lists=16)
+
+
+@pytest.fixture(scope="module")
+def queries(index):
+    return index.embeddings[np.random.default_rng(1).choice(index.n_reviews, 20)]
+
+
+def test_probing_every_list_is_exact(index, ivf, queries):
+    items = np.arange(0, index.n_items, 3)
+    for q in queries:
+        exact = index.rank(q, items, k=3)
+        got = ivf.rank(q, items, k=3, nprobe=ivf.n_lists, exact_max_reviews=0)
+        np.testing.assert_array_equal(got.items, exact.items)
+        np.testing.assert_allclose(got.scores, exact.scores, rtol=1e-5)
+        np.testing.assert_array_equal(got.top_rows, exact.top_rows)
+
+
+def test_recall_against_exact_search(index, ivf, queries):
+    rng = np.random.default_rng(2)
+    filters = [np.sort(rng.choice(index.n_items, index.n_items // 3, replace=False)) for _ in queries]
+    truths = [set(index.rank(q, items, k=3).items[:10].tolist()) for q, items in zip(queries, filters)]
+    recalls = {}
+    for nprobe in (1, 8):
+        hits = []
+        for q, items, truth in zip(queries, filters, truths):
+            got = ivf.rank(q, items, k=3, nprobe=nprobe, exact_max_reviews=0)
+            # The filter is applied before scoring: nothing outside it comes back.
+            assert set(got.items.tolist()) <= set(items.tolist())
+            hits.append(len(truth & set(got.items[:10].tolist())) / len(truth))
+        recalls[nprobe] = np.mean(hits)
+    assert recalls[1] < recalls[8]
+    assert recalls[8] >= 0.9
+
+
+def test_small_candidate_sets_fall_back_to_exact(index, ivf, queries):
+    items = np.array([5, 17, 42])
+    got = ivf.rank(queries[0], items, k=3, nprobe=1)
+    exact = index.rank(queries[0], items, k=3)
+    np.testing.assert_array_equal(got.items, exact.items)
+    np.testing.assert_array_equal(got.scores, exact.scores)
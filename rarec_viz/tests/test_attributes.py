@@ -0,0 +1,38 @@
+import pytest
+
+from attributes import AttributeStore, answer, parse_question
+
+NAMES = ["Tokyo Express", "Sakura Ramen", "Luigi's"]
+FOCUS = ["Tokyo Express", "Sakura Ramen"]
+
+
+@pytest.fixture
+def store():
+    return AttributeStore.from_records([
+        {"name": "Tokyo Express", "parking": True, "menu": "sushi and udon", "price_range": "$$"},
+        {"name": "Sakura Ramen", "parking": False, "menu": "ramen"},
+    ])
+
+
+@pytest.mark.parametrize("utterance, expected", [
+    ("Does Tokyo Express have a parking lot?", ("parking", ["Tokyo Express"])),
+    ("what's on the menu at sakura ramen", ("menu", ["Sakura Ramen"])),
+    ("Are they expensive?", ("price_range", FOCUS)),
+    ("Do both of them take reservations?", ("reservations", FOCUS)),
+    # New requests mention no item and no pronoun for the items shown.
+    ("Are there any Italian places that serve pasta?", None),
+    ("Is there somewhere cheap with ramen?", None),
+    # Not a question, or no known attribute.
+    ("Tokyo Express has parking", None),
+    ("Is Tokyo Express good?", None),
+])
+def test_parse_question_routes_follow_ups_only(utterance, expected):
+    assert parse_question(utterance, NAMES, FOCUS) == expected
+
+
+def test_answer_uses_templates_and_reports_missing_values(store):
+    assert answer(store, "parking", FOCUS) == (
+        ["Tokyo Express has a parking lot.", "Sakura Ramen does not have a parking lot."], [])
+    assert answer(store, "price_range", FOCUS + ["Luigi's"]) == (
+        ["Tokyo Express is in the $$ price range."], ["Sakura Ramen", "Luigi's"])
+    assert store.get("Tokyo Express", "wifi") is None
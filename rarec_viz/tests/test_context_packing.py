@@ -0,0 +1,65 @@
+import numpy as np
+
+from context_packing import estimate_tokens, estimated_jaccard, minhash_signatures, pack_context, shingles
+
+WORDS = "sushi ramen fresh cheap friendly cozy noisy parking patio spicy sweet tea coffee service staff".split()
+ATTRIBUTES = ["sushi", "cheap", "parking", "patio"]
+
+
+def _texts(n, seed=0):
+    rng = np.random.default_rng(seed)
+    texts = [" ".join(rng.choice(WORDS, rng.integers(2, 8))) for _ in range(n)]
+    # Near-duplicates of earlier reviews, differing in one word.
+    texts += [t + " really" for t in texts[: n // 3]]
+    return texts
+
+
+def _jaccard(a, b):
+    a, b = shingles(a), shingles(b)
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def _reference(texts, scores, signatures, attributes, budget, threshold):
+    """Plain-Python greedy packing over sets, with the same similarity estimates."""
+    wanted = [shingles(a) for a in attributes]
+    covers = [{j for j, w in enumerate(wanted) if w & shingles(t)} for t in texts]
+    covered, left, chosen, used, dupes = set(), set(range(len(texts))), [], 0, 0
+    while left:
+        best = min(left, key=lambda i: (-len(covers[i] - covered), -scores[i], i))
+        left.discard(best)
+        if chosen and max(np.mean(signatures[best] == signatures[c]) for c in chosen) >= threshold:
+            dupes += 1
+        elif used + estimate_tokens(texts[best]) <= budget:
+            chosen.append(best)
+            used += estimate_tokens(texts[best])
+            covered |= covers[best]
+    return chosen, used, dupes
+
+
+def test_minhash_estimates_jaccard():
+    texts = _texts(30)
+    signatures = minhash_signatures(texts)
+    errors = [abs(estimated_jaccard(signatures[i], signatures[j:j + 1])[0] - _jaccard(texts[i], texts[j]))
+              for i in range(len(texts)) for j in range(i + 1, len(texts))]
+    assert np.mean(errors) < 0.05 and max(errors) < 0.3
+    assert estimated_jaccard(signatures[0], signatures)[0] == 1.0
+
+
+def test_pack_context_matches_greedy_reference():
+    texts = _texts(24, seed=1)
+    signatures = minhash_signatures(texts)
+    rng = np.random.default_rng(2)
+    for budget in (5, 15, 40, 1000):
+        scores = rng.random(len(texts))
+        chosen, used, dupes = pack_context(texts, scores, signatures, ATTRIBUTES, budget)
+        assert used == sum(estimate_tokens(texts[i]) for i in chosen) <= budget
+        # Kept reviews are never near-duplicates of each other.
+        assert all(_jaccard(texts[a], texts[b]) < 0.9 for a in chosen for b in chosen if a < b)
+        assert (chosen, used, dupes) == _reference(texts, scores, signatures, ATTRIBUTES, budget, threshold=0.5)
+
+
+def test_exact_duplicates_are_dropped_and_attributes_covered_first():
+    texts = ["Cheap and cheerful.", "Great sushi, cheap too.", "Great sushi, cheap too!", "Lovely patio."]
+    signatures = minhash_signatures(texts)
+    chosen, _, dupes = pack_context(texts, [0.9, 0.5, 0.4, 0.1], signatures, ["sushi", "cheap", "patio"], 100)
+    assert chosen == [1, 3, 0] and dupes == 1
@@ -0,0 +1,109 @@
+import numpy as np
+
+from dialogue import RetrievalSession, empty_state
+from embedding_store import open_store, write_store
+from encoder import HashingEncoder
+from result_cache import ResultCache
+from retrieval import ReviewIndex
+
+REVIEWS = {
+    "Sushi Bar": ["fresh sushi rolls", "great sashimi"],
+    "Pasta Place": ["creamy pasta", "homemade ravioli"],
+    "Burger Joint": ["juicy burgers", "crispy fries"],
+}
+
+
+def _session(cache):
+    encoder = HashingEncoder()
+    index = ReviewIndex.from_reviews(REVIEWS, encoder)
+    return RetrievalSession(index, encoder, lambda state, view: np.arange(view.n_items), k=2, result_cache=cache)
+
+
+def _state(dish):
+    state = empty_state()
+    state["soft_constraints"] = {"dish": [dish]}
+    state["location"] = "downtown"
+    return state
+
+
+def test_result_cache_hit_updates_query_state():
+    now = [0.0]
+    cache = ResultCache(ttl=10.0, clock=lambda: now[0])
+    _session(cache).update(_state("pasta"))  # another session fills the cache
+
+    session = _session(cache)
+    sushi = session.update(_state("sushi"))
+    assert session.index.item_ids[sushi.items[0]] == "Sushi Bar"
+
+    pasta = session.update(_state("pasta"))
+    assert session.recomputed == ["result cache hit"]
+    assert session.index.item_ids[pasta.items[0]] == "Pasta Place"
+
+    # Back to the earlier query: must not be mistaken for "nothing changed".
+    now[0] = 60.0  # every cached entry has expired
+    again = session.update(_state("sushi"))
+    assert session.recomputed != []
+    assert session.index.item_ids[again.items[0]] == "Sushi Bar"
+
+    # Same state again: nothing to recompute, same ranking.
+    assert session.update(_state("sushi")) is again
+    assert session.recomputed == []
+
+
+def test_memory_mapped_store_is_ranked_by_streaming(tmp_path):
+    encoder = HashingEncoder()
+    write_store(str(tmp_path), ReviewIndex.from_reviews(REVIEWS, encoder))
+    stored = open_store(str(tmp_path))
+    assert stored.out_of_core
+    sessions = [RetrievalSession(index, encoder, lambda state, view: np.arange(view.n_items), k=2, streaming=streaming)
+                for index, streaming in ((stored, None), (stored, False))]
+    streamed, cached = (session.update(_state("pasta")) for session in sessions)
+    assert sessions[0].recomputed == ["filter", "streamed scoring"]
+    assert sessions[0]._scores is None
+    np.testing.assert_array_equal(streamed.items, cached.items)
+    np.testing.assert_allclose(streamed.scores, cached.scores, rtol=1e-5)
+    np.testing.assert_array_equal(streamed.top_rows, cached.top_rows)
+
+    sessions[0].update(_state("pasta"))
+    assert sessions[0].recomputed == []
+
+
+def test_spellings_of_one_state_share_the_cached_ranking_and_query():
+    cache = ResultCache(ttl=10.0)
+    first = _session(cache)
+    state = _state("pasta")
+    state["soft_constraints"]["dish"] = ["Pasta", "ravioli"]
+    ranking = first.update(state)
+
+    session = _session(cache)
+    state["soft_constraints"]["dish"] = ["  RAVIOLI", "pasta"]
+    assert session.update(state) is ranking
+    assert session.recomputed == ["result cache hit"]
+    assert session._query == first._query == "pasta, ravioli"
+    # A hit scores nothing, so no per-review score array is allocated.
+    assert session._scores is None
+
+
+def test_rejections_mask_the_ranking_without_rescoring():
+    reviews = {f"Place {i}": [f"pasta dish number {j} at place {i}" for j in range(i % 3 + 1)] for i in range(8)}
+    encoder = HashingEncoder()
+    index = ReviewIndex.from_reviews(reviews, encoder)
+    session = RetrievalSession(index, encoder, lambda state, view: np.arange(view.n_items), k=2)
+    ranking = session.update(_state("pasta"))
+    full = ranking.items.tolist()
+
+    excluded = set()
+    for step in range(len(full)):
+        picks = session.recommend(2)
+        assert picks == [i for i in full if i not in excluded][:2]
+        if not picks:
+            break
+        (session.reject if step % 2 else session.accept)(picks[:1])
+        excluded.add(picks[0])
+        # Masking reuses the scored ranking: nothing is recomputed.
+        assert session.update(_state("pasta")) is ranking and session.recomputed == []
+    assert excluded == set(full)
+
+    # The masks outlive a state change that re-ranks.
+    session.update(_state("ravioli"))
+    assert session.recomputed and session.recommend(3) == []
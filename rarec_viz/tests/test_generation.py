@@ -0,0 +1,61 @@
+import pytest
+
+import generation
+from generation import StubBackend, TimedStream, build_prompt, get_backend
+
+REQUEST = {
+    "item": "Washoku Bistro",
+    "metadata": {"name": "Washoku Bistro", "cuisine_type": ["Japanese"]},
+    "reviews": ["Excellent sushi and very fresh."],
+    "state": {"hard_constraints": {}, "soft_constraints": {"dish": ["sushi"]}, "location": None},
+    "alternatives": ["Tokyo Express"],
+    "preamble": "",
+    "question": "",
+}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [10.0]
+    monkeypatch.setattr(generation.time, "perf_counter", lambda: now[0])
+    return now
+
+
+def _chunks(clock, delays, texts):
+    for delay, text in zip(delays, texts):
+        clock[0] += delay
+        yield text
+
+
+def test_timed_stream_records_ttft_total_and_text(clock):
+    stream = TimedStream(_chunks(clock, [0.25, 0.1, 0.05], ["How", " about", " sushi?"]))
+    clock[0] += 5.0  # time before the first read does not count
+    assert stream.ttft_ms is None and stream.total_ms is None
+    assert next(stream) == "How"
+    assert stream.ttft_ms == pytest.approx(250.0)
+    assert list(stream) == [" about", " sushi?"]
+    assert stream.text == "How about sushi?"
+    assert stream.ttft_ms == pytest.approx(250.0)
+    assert stream.total_ms == pytest.approx(400.0)
+
+
+def test_timed_stream_of_nothing(clock):
+    stream = TimedStream(iter([]))
+    assert list(stream) == [] and stream.text == ""
+    assert stream.ttft_ms is None and stream.total_ms == 0.0
+
+
+def test_stub_backend_streams_its_reply():
+    backend = StubBackend(delay=0)
+    stream = TimedStream(backend.stream(REQUEST))
+    assert "".join(stream) == stream.text == backend.respond(REQUEST)
+    assert stream.text.startswith("How about trying **Washoku Bistro**?")
+    assert "Tokyo Express" in stream.text and stream.ttft_ms <= stream.total_ms
+
+
+def test_prompt_carries_the_grounding_and_unknown_backends_fail():
+    prompt = build_prompt(dict(REQUEST, question="Do they have parking?"))
+    assert 'Review 1: "Excellent sushi and very fresh."' in prompt
+    assert "Answer the user's question about Washoku Bistro" in prompt
+    with pytest.raises(ValueError, match="unknown LLM backend"):
+        get_backend("nope")
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from geo import GridIndex, haversine_km
+
+
+def _brute_force(lats, lons, point):
+    lat, lon = np.radians(point)
+    return haversine_km(lat, lon, np.radians(lats), np.radians(lons))
+
+
+@pytest.mark.parametrize("lat_range, lon_range, radius_km", [
+    ((40.6, 40.9), (-74.1, -73.8), 2.0),  # one city
+    ((-60.0, 70.0), (-180.0, 180.0), 1500.0),  # continents, across the antimeridian
+    ((80.0, 90.0), (-180.0, 180.0), 800.0),  # around a pole
+])
+def test_grid_queries_match_brute_force_haversine(lat_range, lon_range, radius_km):
+    rng = np.random.default_rng(0)
+    lats, lons = rng.uniform(*lat_range, 2000), rng.uniform(*lon_range, 2000)
+    grid = GridIndex(lats, lons, cell_km=radius_km / 4)
+    # Only occupied cells are stored, however large the extent.
+    assert len(grid.cells) <= len(lats) and grid.cell_offsets[-1] == len(lats)
+    for point in zip(lats[:20], lons[:20]):
+        dist = _brute_force(lats, lons, point)
+        np.testing.assert_array_equal(grid.within_radius(point, radius_km), np.flatnonzero(dist <= radius_km))
+        items, got = grid.nearest(point, 5)
+        np.testing.assert_allclose(got, np.sort(dist)[:5])
+        np.testing.assert_allclose(dist[items], got)
+
+
+def test_queries_near_the_antimeridian_see_both_sides():
+    grid = GridIndex([0.0, 0.0, 0.0], [179.99, -179.99, 170.0])
+    np.testing.assert_array_equal(grid.within_radius((0.0, 180.0), 5.0), [0, 1])
+    assert grid.within_radius((0.0, 180.0), 5.0).dtype == np.int64
+    assert len(GridIndex([], []).within_radius((0.0, 0.0), 5.0)) == 0
+
+
+def test_items_without_coordinates_are_never_returned():
+    grid = GridIndex([0.0, np.nan, 0.001], [0.0, 0.0, np.nan])
+    np.testing.assert_array_equal(grid.within_radius((0.0, 0.0), 50.0), [0])
+    items, _ = grid.nearest((0.0, 0.0), 3)
+    np.testing.assert_array_equal(items, [0])
@@ -0,0 +1,82 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from embedding_store import StoredTexts, StoreError, open_store, write_store
+from encoder import HashingEncoder
+from ingest import CHECKPOINT_FILE, ingest
+from retrieval import ReviewIndex
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "reviews.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        for item in range(6):
+            for review in range(item % 3 + 1):
+                text = f"<p>Review {review} of place {item}.</p> Great &amp; cheap food. Friendly staff!"
+                f.write(json.dumps({"item_id": f"place-{item}", "text": text}) + "\n")
+    return str(path)
+
+
+def _ingest(source, path, **kwargs):
+    return ingest(source, str(path), HashingEncoder(dim=32), batch_size=2, max_words=5, workers=1, **kwargs)
+
+
+def test_resumed_ingest_matches_a_single_run(source, tmp_path):
+    _ingest(source, tmp_path / "once")
+    state = _ingest(source, tmp_path / "resumed", max_batches=2)
+    assert not state["done"]
+    with pytest.raises(FileNotFoundError):
+        open_store(str(tmp_path / "resumed"))
+    # The checkpoint holds counts and sizes only, never per-row lists.
+    with open(tmp_path / "resumed" / CHECKPOINT_FILE, encoding="utf-8") as f:
+        assert all(not isinstance(v, (list, dict)) for v in json.load(f).values())
+    assert _ingest(source, tmp_path / "resumed")["done"]
+
+    once, resumed = open_store(str(tmp_path / "once")), open_store(str(tmp_path / "resumed"))
+    assert resumed.item_ids == once.item_ids == [f"place-{i}" for i in range(6)]
+    np.testing.assert_array_equal(resumed.offsets, once.offsets)
+    np.testing.assert_array_equal(resumed.embeddings, once.embeddings)
+    assert isinstance(resumed.texts, StoredTexts)
+    assert list(resumed.texts) == list(once.texts)
+    assert resumed.texts[0] == "Review 0 of place 0."
+    assert resumed.texts[-1] == once.texts[once.n_reviews - 1]
+
+
+def test_ingest_rejects_items_that_are_not_contiguous(tmp_path):
+    path = tmp_path / "split.jsonl"
+    path.write_text("".join(json.dumps({"item_id": i, "text": "Nice."}) + "\n" for i in "aba"))
+    with pytest.raises(StoreError, match="not contiguous"):
+        _ingest(str(path), tmp_path / "store")
+
+
+def test_store_texts_round_trip_and_are_read_lazily(tmp_path):
+    texts = ["plain", "ünïcode ☕", 'quotes "and"\nnewlines', ""]
+    index = ReviewIndex(np.zeros((4, 3), np.float32), [0, 1, 4], ["x", "y"], texts)
+    write_store(str(tmp_path), index)
+    with open(tmp_path / "items.json", encoding="utf-8") as f:
+        assert "texts" not in json.load(f)
+    stored = open_store(str(tmp_path)).texts
+    assert len(stored) == 4 and list(stored) == texts and stored[np.int64(1)] == texts[1]
+    with pytest.raises(IndexError):
+        stored[4]
+
+    with open(tmp_path / "texts.jsonl", "ab") as f:
+        f.write(b'"extra"\n')
+    with pytest.raises(StoreError, match="text_offsets"):
+        open_store(str(tmp_path))
+    os.remove(tmp_path / "texts.jsonl")
+    assert open_store(str(tmp_path)).texts is None
+
+
+def test_rerunning_a_finished_ingest_leaves_the_store_intact(source, tmp_path):
+    first = _ingest(source, tmp_path / "store")
+    before = open_store(str(tmp_path / "store"))
+    again = _ingest(source, tmp_path / "store")
+    assert again["done"] and again["n_rows"] == first["n_rows"]
+    after = open_store(str(tmp_path / "store"))
+    np.testing.assert_array_equal(after.offsets, before.offsets)
+    assert list(after.texts) == list(before.texts)
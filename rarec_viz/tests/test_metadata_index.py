@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from metadata_index import BitmapIndex, normalize_value
+
+CUISINES = ["Japanese", "Italian", "Thai", "Mexican"]
+DISHES = ["sushi", "ramen", "pasta", "pizza", "curry", "tacos"]
+
+
+def _records(n, seed=0):
+    rng = np.random.default_rng(seed)
+    records = []
+    for i in range(n):
+        record = {"name": f"r{i}", "cuisine_type": CUISINES[rng.integers(len(CUISINES))]}
+        if i % 7:  # some records have no dishes at all
+            record["dish_type"] = [d.upper() if rng.random() < 0.2 else d
+                                   for d in rng.choice(DISHES, rng.integers(1, 4), replace=False)]
+        records.append(record)
+    return records
+
+
+def _brute_force(records, constraints, within=None):
+    def values(record, field):
+        raw = record.get(field, [])
+        return {normalize_value(v) for v in ([raw] if isinstance(raw, str) else raw)}
+
+    return [
+        i for i, record in enumerate(records)
+        if (within is None or i in within)
+        and all(not wanted or values(record, field) & {normalize_value(v) for v in wanted}
+                for field, wanted in constraints.items() if field in ("cuisine_type", "dish_type"))
+    ]
+
+
+@pytest.mark.parametrize("n", [1, 63, 64, 65, 300])  # around uint64 word boundaries
+def test_query_matches_brute_force(n):
+    records = _records(n)
+    index = BitmapIndex.from_records(records, ["cuisine_type", "dish_type"])
+    rng = np.random.default_rng(n)
+    for _ in range(25):
+        constraints = {
+            "cuisine_type": list(rng.choice(CUISINES, rng.integers(0, 3), replace=False)),
+            "dish_type": [" Sushi ", *rng.choice(DISHES, rng.integers(0, 2), replace=False)],
+            "ambience": ["quiet"],  # not indexed: left to later stages
+        }
+        within = set(rng.choice(n, rng.integers(0, n + 1), replace=False).tolist())
+        np.testing.assert_array_equal(index.query(constraints), _brute_force(records, constraints))
+        np.testing.assert_array_equal(index.query(constraints, index.bitset_of(sorted(within))),
+                                      _brute_force(records, constraints, within))
+
+
+def test_unknown_values_match_nothing_and_empty_constraints_match_everything():
+    records = _records(70)
+    index = BitmapIndex.from_records(records, ["cuisine_type", "dish_type"])
+    assert len(index.query({"cuisine_type": ["Klingon"]})) == 0
+    np.testing.assert_array_equal(index.query({}), np.arange(70))
+    np.testing.assert_array_equal(index.query({"dish_type": []}), np.arange(70))
+    assert index.values("cuisine_type") == sorted(normalize_value(c) for c in CUISINES)
+    # Bits past the last item stay clear, so positions never run past it.
+    assert index.positions(~np.zeros(index.n_words, dtype=np.uint64)).tolist() == list(range(70))
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from retrieval import ReviewIndex, segmented_topk_mean
+from topk import segmented_topk
+
+
+def _index():
+    rng = np.random.default_rng(0)
+    emb = rng.standard_normal((12, 8)).astype(np.float32)
+    # Item "c" has no reviews.
+    return ReviewIndex(emb, [0, 5, 9, 9, 12], ["a", "b", "c", "d"], [f"r{i}" for i in range(12)])
+
+
+def _brute(index, query_vec, items, k):
+    out = {}
+    for i in items:
+        scores = index.embeddings[index.offsets[i]:index.offsets[i + 1]] @ query_vec
+        out[i] = np.sort(scores)[::-1][:k].mean() if len(scores) else np.nan
+    return out
+
+
+@pytest.mark.parametrize("items", [None, [0, 1, 3], [2, 0], [3]])
+def test_rank_matches_brute_force(items):
+    index = _index()
+    q = np.ones(8, np.float32)
+    ranking = index.rank(q, items, k=3)
+    expected = _brute(index, q, range(index.n_items) if items is None else items, 3)
+    assert sorted(ranking.items.tolist()) == sorted(expected)
+    for item, score in zip(ranking.items, ranking.scores):
+        np.testing.assert_allclose(score, expected[item], rtol=1e-5)
+
+
+@pytest.mark.parametrize("counts", [[3, 0, 5, 1, 4], [200, 1, 0, 2]])  # dense and skewed layouts
+def test_segmented_topk_matches_brute_force(counts):
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    scores = np.random.default_rng(0).standard_normal((3, offsets[-1])).astype(np.float32)
+    top = segmented_topk(scores, offsets, 3)
+    assert top.shape == (3, len(counts), 3)
+    for q in range(3):
+        np.testing.assert_array_equal(segmented_topk(scores[q], offsets, 3), top[q])
+        for s, (lo, hi) in enumerate(zip(offsets[:-1], offsets[1:])):
+            expected = lo + np.argsort(-scores[q, lo:hi], kind="stable")[:3]
+            got = top[q, s]
+            np.testing.assert_array_equal(got[got >= 0], expected)
+            assert (got[len(expected):] == -1).all()
+
+
+def test_segmented_topk_mean_all_segments_empty():
+    scores, top = segmented_topk_mean(np.empty(0, np.float32), np.array([0, 0, 0]), 3)
+    assert np.isnan(scores).all()
+    assert (top == -1).all()
+
+
+def test_rank_items_without_reviews():
+    # Regression: every candidate has zero reviews, so no review is scored.
+    index = ReviewIndex(np.eye(4, dtype=np.float32)[:2], [0, 2, 2], ["a", "b"])
+    q = np.ones(4, np.float32)
+    for rank in (index.rank, index.rank_streaming):
+        ranking = rank(q, [1], 3)
+        assert ranking.items.tolist() == [1]
+        assert np.isnan(ranking.scores).all()
+        assert (ranking.top_rows == -1).all()
+
+
+@pytest.mark.parametrize("block_rows", [1, 4, 64])
+def test_rank_streaming_matches_rank(block_rows):
+    index = _index()
+    q = np.linspace(-1, 1, 8).astype(np.float32)
+    for items in (None, [3, 0, 2]):
+        full = index.rank(q, items, k=2)
+        streamed = index.rank_streaming(q, items, k=2, block_rows=block_rows)
+        np.testing.assert_array_equal(full.items, streamed.items)
+        np.testing.assert_allclose(full.scores, streamed.scores, rtol=1e-6)
+        np.testing.assert_array_equal(full.top_rows, streamed.top_rows)
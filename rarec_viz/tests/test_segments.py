@@ -0,0 +1,147 @@
+import json
+import os
+import time
+
+import numpy as np
+import pytest
+
+from dialogue import RetrievalSession, empty_state
+from encoder import HashingEncoder
+from retrieval import ReviewIndex
+from segments import MANIFEST_FILE, SegmentedIndex
+
+MAIN = {
+    "Sushi Bar": ["fresh sushi rolls", "great sashimi", "friendly chef"],
+    "Pasta Place": ["creamy pasta", "homemade ravioli"],
+}
+DELTA = {
+    "Pasta Place": ["best pasta carbonara in town"],
+    "Burger Joint": ["juicy burgers", "crispy fries"],
+}
+
+
+@pytest.fixture
+def encoder():
+    return HashingEncoder(dim=64)
+
+
+@pytest.fixture
+def segmented(tmp_path, encoder):
+    index = SegmentedIndex.create(str(tmp_path), ReviewIndex.from_reviews(MAIN, encoder))
+    index.add_reviews(DELTA, encoder)
+    return index
+
+
+def _flat(encoder):
+    merged = {item: MAIN.get(item, []) + DELTA.get(item, []) for item in ["Sushi Bar", "Pasta Place", "Burger Joint"]}
+    return ReviewIndex.from_reviews(merged, encoder)
+
+
+def _state(dish):
+    state = empty_state()
+    state["soft_constraints"] = {"dish": [dish]}
+    return state
+
+
+def _session(index, encoder, streaming=False):
+    return RetrievalSession(index, encoder, lambda state, view: np.arange(view.n_items), k=2, streaming=streaming)
+
+
+def test_refresh_follows_the_manifest_generation(segmented, tmp_path, encoder):
+    reader = SegmentedIndex(str(tmp_path))
+    assert not reader.refresh()
+    manifest_file = os.path.join(str(tmp_path), MANIFEST_FILE)
+    stamp = os.stat(manifest_file)
+    segmented.add_reviews({"Sushi Bar": ["omakase"]}, encoder)
+    # Same mtime as before: only the generation tells the change apart.
+    os.utime(manifest_file, ns=(stamp.st_atime_ns, stamp.st_mtime_ns))
+    assert reader.refresh()
+    assert reader.generation == segmented.generation
+    assert len(reader.segments) == 3
+    assert not reader.refresh()
+
+
+def test_session_on_segments_matches_flat_index(segmented, encoder):
+    flat = _flat(encoder)
+    for dish in ["pasta", "sushi", "burgers"]:
+        expected = _session(flat, encoder).update(_state(dish))
+        got = _session(segmented, encoder).update(_state(dish))
+        assert [segmented.item_ids[i] for i in got.items] == [flat.item_ids[i] for i in expected.items]
+        # Segments store float16, the flat index float32.
+        np.testing.assert_allclose(got.scores, expected.scores, atol=1e-3)
+        ranked = segmented.rank(encoder.encode(dish)[0], k=2)
+        np.testing.assert_allclose(ranked.scores, got.scores, rtol=1e-5)
+        # Rows point at the same texts in both layouts.
+        assert sorted(segmented.texts[r] for r in got.rows) == sorted(flat.texts[r] for r in expected.rows)
+        streamed = _session(segmented, encoder, streaming=None).update(_state(dish))
+        np.testing.assert_array_equal(streamed.items, got.items)
+        np.testing.assert_allclose(streamed.scores, got.scores, rtol=1e-5)
+        np.testing.assert_array_equal(streamed.top_rows, got.top_rows)
+
+
+def test_item_rows_group_each_item_across_segments(segmented):
+    view = segmented.snapshot()
+    pasta, burger = view.positions(["Pasta Place", "Burger Joint"])
+    rows, local = view.item_rows([burger, pasta])
+    assert [view.texts[r] for r in rows[local[1]:local[2]]] == MAIN["Pasta Place"] + DELTA["Pasta Place"]
+    assert [view.texts[r] for r in rows[local[0]:local[1]]] == DELTA["Burger Joint"]
+    np.testing.assert_array_equal(view.item_of_rows(rows), np.repeat([burger, pasta], np.diff(local)))
+
+
+def test_session_rescores_after_compaction(segmented, encoder):
+    session = _session(segmented, encoder)
+    before = session.update(_state("pasta"))
+    before_texts = [segmented.texts[r] for r in before.top_rows[0] if r >= 0]
+    generation = segmented.generation
+    assert segmented.compact() is not None
+    assert segmented.generation > generation and len(segmented.segments) == 1
+
+    after = session.update(_state("pasta"))
+    assert session.view.generation == segmented.generation
+    assert "scoring (8 reviews)" in session.recomputed
+    np.testing.assert_allclose(after.scores, before.scores, rtol=1e-5)
+    assert [session.view.texts[r] for r in after.top_rows[0] if r >= 0] == before_texts
+
+
+def test_compaction_abandons_a_stale_merge(segmented, tmp_path, encoder):
+    other = SegmentedIndex(str(tmp_path))
+    other.compact()
+    # ``segmented`` still sees the old segments, which are gone now.
+    assert segmented.compact() is None
+    with open(os.path.join(str(tmp_path), MANIFEST_FILE), encoding="utf-8") as f:
+        assert len(json.load(f)["segments"]) == 1
+    assert [n for n in os.listdir(str(tmp_path)) if n.startswith("seg-")] == [other.segments[0].name]
+
+
+def test_refresher_picks_up_and_compacts_new_segments(segmented, tmp_path, encoder):
+    reader = SegmentedIndex(str(tmp_path))
+    reader.start_refresher(interval=0.01, compact_at=3)
+    try:
+        segmented.add_reviews({"Sushi Bar": ["omakase"]}, encoder)
+        deadline = time.monotonic() + 10
+        while len(reader.segments) != 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        reader.stop_refresher()
+        if reader._compactor:
+            reader._compactor.join()
+    assert len(reader.segments) == 1
+    assert reader.n_reviews == 9
+    assert segmented.refresh() and len(segmented.segments) == 1
+
+
+def test_session_filters_again_when_new_items_arrive(segmented, encoder):
+    seen = []
+
+    def filter_fn(state, view):
+        seen.append(view.generation)
+        return np.arange(view.n_items)
+
+    session = RetrievalSession(segmented, encoder, filter_fn, k=2)
+    session.update(_state("ramen"))
+    segmented.add_reviews({"Ramen Shop": ["rich tonkotsu ramen"]}, encoder)
+    ranking = session.update(_state("ramen"))
+    assert seen == [segmented.generation - 1, segmented.generation]
+    assert "filter" in session.recomputed
+    assert session.view.item_ids[ranking.items[0]] == "Ramen Shop"
+    assert len(session.rejected) == session.view.n_items == 4